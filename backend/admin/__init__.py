@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+
+admin_bp = Blueprint('admin', __name__)
+
+from .cache_admin import get_query_cache_stats
@@ -0,0 +1,20 @@
+from flask import jsonify
+from . import admin_bp
+from bigquery.cache import get_default_cache
+from bigquery.singleflight import get_default_singleflight
+from utils.openalex_client import get_openalex_client
+
+
+@admin_bp.route('/cache/stats', methods=['GET'])
+def get_query_cache_stats():
+    """
+    Returns hit/miss/eviction counters and tier sizes for the shared BigQuery result cache,
+    how many in-flight queries were coalesced, and request and response cache counters
+    for the OpenAlex client.
+    """
+    return jsonify({
+        'status': 'success',
+        'query_cache': get_default_cache().stats(),
+        'query_coalescing': get_default_singleflight().stats(),
+        'openalex': get_openalex_client().stats()
+    })
@@ -2,13 +2,15 @@ from flask import Flask
 from flask_cors import CORS
 from works import work_data_bp
 from journals import journal_data_bp
+from admin import admin_bp
 
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Filter-Hash'])
 
 app.register_blueprint(work_data_bp, url_prefix="/works")
 app.register_blueprint(journal_data_bp, url_prefix="/works")
+app.register_blueprint(admin_bp, url_prefix="/admin")
 
 
 if __name__ == '__main__':
@@ -1,7 +1,36 @@
 from google.cloud import bigquery
 from dataclasses import dataclass
-from typing import Optional, Union, Dict, List, Any
+from typing import Optional, Union, Dict, List, Any, Tuple
+import time
 import pandas as pd
+from .cache import QueryCache, get_default_cache
+from .singleflight import SingleFlight, get_default_singleflight
+from .duckdb_engine import DuckDBEngine
+from .storage_download import DOWNLOAD_MODES, STORAGE_MIN_ROWS, StorageDownloader, may_be_wide, preserves_order
+
+QueryParameter = Union[bigquery.ScalarQueryParameter, bigquery.ArrayQueryParameter]
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a query would bill more bytes than its budget allows"""
+
+    def __init__(self, dataset_name: str, maximum_bytes_billed: int, estimated_bytes: Optional[int] = None):
+        self.dataset_name = dataset_name
+        self.maximum_bytes_billed = maximum_bytes_billed
+        self.estimated_bytes = estimated_bytes
+        estimate = f"{estimated_bytes} bytes" if estimated_bytes is not None else "more bytes"
+        super().__init__(
+            f"Query on '{dataset_name}' would process {estimate}, "
+            f"exceeding the budget of {maximum_bytes_billed} bytes"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'error': 'query_budget_exceeded',
+            'message': str(self),
+            'dataset': self.dataset_name,
+            'estimated_bytes': self.estimated_bytes,
+            'maximum_bytes_billed': self.maximum_bytes_billed
+        }
 
 @dataclass
 class Dataset:
@@ -10,15 +39,39 @@ class Dataset:
     dataset: str
     table: str
     billing_project_id: str
+    engine: str = 'bigquery'
+    snapshot_path: Optional[str] = None
 
     @property
     def full_path(self) -> str:
         return f"{self.project_id}.{self.dataset}.{self.table}"
 
 class BigQuery:
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[QueryCache] = None,
+        use_cache: bool = True,
+        download_mode: str = 'auto',
+        singleflight: Optional[SingleFlight] = None,
+        coalesce: bool = True
+    ):
+        """
+        `download_mode` picks how results are fetched: 'rest' pages through the JSON
+        API, 'storage' streams Arrow over the Storage Read API and 'auto' chooses
+        per result by its size (see bigquery.storage_download).
+
+        With `coalesce`, identical DataFrame queries that are already running are
+        joined instead of started again (see bigquery.singleflight).
+        """
+        if download_mode not in DOWNLOAD_MODES:
+            raise ValueError(f"Unknown download mode '{download_mode}'. Valid modes are: {list(DOWNLOAD_MODES)}")
         self.clients: Dict[str, bigquery.Client] = {}
         self.datasets: Dict[str, Dataset] = {}
+        self.cache = (cache or get_default_cache()) if use_cache else None
+        self.singleflight = (singleflight or get_default_singleflight()) if coalesce else None
+        self.duckdb: Optional[DuckDBEngine] = None
+        self.download_mode = download_mode
+        self.storage = StorageDownloader()
 
     def add_dataset(
         self,
@@ -26,16 +79,37 @@ class BigQuery:
         project_id: str,
         dataset: str,
         table: str,
-        billing_project_id: str
+        billing_project_id: str,
+        engine: str = 'bigquery',
+        snapshot_path: Optional[str] = None
     ):
-        """Register a new dataset"""
-        self.datasets[name] = Dataset(project_id, dataset, table, billing_project_id)
-        if billing_project_id not in self.clients:
+        """
+        Register a new dataset.
+
+        With `engine='duckdb'` queries against the dataset run locally on the Parquet
+        snapshot at `snapshot_path` instead of submitting BigQuery jobs; the same
+        BigQuery-dialect SQL is translated on the fly.
+        """
+        if engine not in ('bigquery', 'duckdb'):
+            raise ValueError(f"Unknown engine '{engine}'. Valid engines are: ['bigquery', 'duckdb']")
+        self.datasets[name] = Dataset(project_id, dataset, table, billing_project_id, engine, snapshot_path)
+
+        if engine == 'duckdb':
+            if not snapshot_path:
+                raise ValueError(f"Dataset '{name}' uses the duckdb engine but has no snapshot_path")
+            if self.duckdb is None:
+                self.duckdb = DuckDBEngine()
+            self.duckdb.register(name, self.datasets[name].full_path, snapshot_path)
+        elif billing_project_id not in self.clients:
             self.clients[billing_project_id] = bigquery.Client(project=billing_project_id)
 
     def inspect_schema(self, dataset_name: str) -> None:
         """Print out the schema of a dataset"""
         dataset = self.datasets[dataset_name]
+        if dataset.engine == 'duckdb':
+            print(f"\nSchema for {dataset.full_path} (snapshot {dataset.snapshot_path}):")
+            print(self.duckdb.describe(dataset.full_path).to_string(index=False))
+            return
         client = self.clients[dataset.billing_project_id]
         table_ref = client.get_table(dataset.full_path)
         
@@ -53,16 +127,275 @@ class BigQuery:
         self,
         dataset_name: str,
         query: str,
-        as_dataframe: bool = True
+        as_dataframe: bool = True,
+        params: Optional[List[QueryParameter]] = None,
+        use_cache: bool = True,
+        ttl: Optional[float] = None,
+        dry_run: bool = False,
+        maximum_bytes_billed: Optional[int] = None,
+        download_mode: Optional[str] = None
+    ) -> Union[pd.DataFrame, bigquery.table.RowIterator, int]:
+        """
+        Run a query against a specific dataset.
+
+        `params` are bound to the `@name` placeholders in the query text.
+        DataFrame results are served from and stored in the result cache, keyed on
+        the normalized SQL, parameters and dataset name. `ttl` overrides the cache's
+        default lifetime for this entry.
+
+        With `dry_run` the query is only validated and the estimated number of bytes
+        processed is returned. With `maximum_bytes_billed` the job carries the limit:
+        BigQuery fails it before billing anything if it would bill more, and that
+        failure is raised as QueryBudgetExceeded.
+
+        `download_mode` overrides the client's download mode for this query.
+
+        Concurrent calls for the same DataFrame query share one execution; callers
+        that joined a running one get their own copy of its result.
+        """
+        if dry_run:
+            return self.estimate_bytes(dataset_name, query, params)
+
+        cache_key = None
+        if self.cache is not None and use_cache and as_dataframe and self.datasets[dataset_name].engine != 'duckdb':
+            cache_key = self.cache.make_key(dataset_name, query, params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        run = lambda: self._run_query(dataset_name, query, as_dataframe, params, cache_key, ttl, maximum_bytes_billed, download_mode)
+        if self.singleflight is None or not as_dataframe:
+            return run()
+
+        key = f"{cache_key or QueryCache.make_key(dataset_name, query, params)}:{maximum_bytes_billed}:{download_mode}"
+        df, shared = self.singleflight.do(key, run)
+        return df.copy() if shared else df
+
+    def _run_query(
+        self,
+        dataset_name: str,
+        query: str,
+        as_dataframe: bool,
+        params: Optional[List[QueryParameter]],
+        cache_key: Optional[str],
+        ttl: Optional[float],
+        maximum_bytes_billed: Optional[int],
+        download_mode: Optional[str]
     ) -> Union[pd.DataFrame, bigquery.table.RowIterator]:
-        """Run a query against a specific dataset"""
+        """Run a query that missed the result cache, storing its DataFrame under `cache_key`"""
+        dataset = self.datasets[dataset_name]
+
+        if dataset.engine == 'duckdb':
+            try:
+                return self.duckdb.query(query, params)
+            except Exception as e:
+                raise Exception(f"Local query failed: {str(e)}\nQuery: {query}")
+
+        client = self.clients[dataset.billing_project_id]
+
+        try:
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=params or [],
+                maximum_bytes_billed=maximum_bytes_billed
+            )
+            job = client.query(query, job_config=job_config)
+            results = job.result()
+            if not as_dataframe:
+                return results
+            df, download = self._download(client, dataset, job, results, download_mode)
+            print(
+                f"Downloaded {len(df)} rows via {download['download_mode']} in {download['download_ms']} ms "
+                f"(job {download['job_ms']} ms)"
+            )
+        except Exception as e:
+            if maximum_bytes_billed is not None and 'bytesBilledLimitExceeded' in str(getattr(e, 'errors', '')):
+                raise QueryBudgetExceeded(dataset_name, maximum_bytes_billed) from e
+            raise Exception(f"Query failed: {str(e)}\nQuery: {query}")
+
+        if cache_key is not None:
+            self.cache.put(cache_key, df, ttl=ttl)
+        return df
+
+    def estimate_bytes(
+        self,
+        dataset_name: str,
+        query: str,
+        params: Optional[List[QueryParameter]] = None
+    ) -> int:
+        """Dry-run a query and return the number of bytes it would process"""
         dataset = self.datasets[dataset_name]
+        if dataset.engine == 'duckdb':
+            # local snapshots are never billed
+            return 0
         client = self.clients[dataset.billing_project_id]
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=params or [],
+            dry_run=True,
+            use_query_cache=False
+        )
         try:
-            results = client.query(query).result()
-            return results.to_dataframe() if as_dataframe else results
+            job = client.query(query, job_config=job_config)
+        except Exception as e:
+            raise Exception(f"Dry run failed: {str(e)}\nQuery: {query}")
+        return int(job.total_bytes_processed or 0)
+
+    def profile(
+        self,
+        dataset_name: str,
+        query: str,
+        params: Optional[List[QueryParameter]] = None,
+        download_mode: Optional[str] = None
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Run a query bypassing every cache and report its cost: bytes processed and
+        billed, slot milliseconds, the job's own duration, how long downloading the
+        result took and the end-to-end latency.
+        """
+        dataset = self.datasets[dataset_name]
+        started = time.perf_counter()
+        if dataset.engine == 'duckdb':
+            frame = self.duckdb.query(query, params)
+            return frame, {
+                'rows': len(frame),
+                'bytes_processed': 0,
+                'bytes_billed': 0,
+                'slot_ms': None,
+                'job_ms': None,
+                'download_mode': None,
+                'download_ms': None,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 1)
+            }
+
+        client = self.clients[dataset.billing_project_id]
+        job_config = bigquery.QueryJobConfig(query_parameters=params or [], use_query_cache=False)
+        try:
+            job = client.query(query, job_config=job_config)
+            frame, download = self._download(client, dataset, job, job.result(), download_mode)
         except Exception as e:
             raise Exception(f"Query failed: {str(e)}\nQuery: {query}")
+        latency_ms = (time.perf_counter() - started) * 1000
+        return frame, {
+            'rows': len(frame),
+            'bytes_processed': job.total_bytes_processed,
+            'bytes_billed': job.total_bytes_billed,
+            'slot_ms': job.slot_millis,
+            'job_ms': download['job_ms'],
+            'download_mode': download['download_mode'],
+            'download_ms': download['download_ms'],
+            'latency_ms': round(latency_ms, 1)
+        }
+
+    def _download(
+        self,
+        client: bigquery.Client,
+        dataset: Dataset,
+        job: bigquery.QueryJob,
+        results: bigquery.table.RowIterator,
+        download_mode: Optional[str] = None
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Fetch a finished job's result as a DataFrame, over the Storage Read API or
+        REST depending on the download mode, and time the download apart from the job
+        """
+        mode = download_mode or self.download_mode
+        rows = results.total_rows
+        num_bytes = None
+        if (mode == 'auto' and job.destination is not None and (rows or 0) < STORAGE_MIN_ROWS
+                and may_be_wide(rows, results.schema)):
+            # nested or long results can be large with few rows; the destination table knows its size
+            num_bytes = client.get_table(job.destination).num_bytes
+
+        download = None
+        if job.destination is not None and self.storage.should_use(mode, rows, num_bytes):
+            try:
+                frame, download = self.storage.download(
+                    job.destination.to_bqstorage(),
+                    dataset.billing_project_id,
+                    preserve_order=preserves_order(job.query)
+                )
+            except Exception as e:
+                if mode == 'storage':
+                    raise
+                print(f"Storage Read API download failed, falling back to REST: {str(e)}")
+        if download is None:
+            started = time.perf_counter()
+            frame = results.to_dataframe(create_bqstorage_client=False)
+            download = {
+                'download_mode': 'rest',
+                'streams': None,
+                'download_ms': round((time.perf_counter() - started) * 1000, 1)
+            }
+
+        job_ms = (job.ended - job.started).total_seconds() * 1000 if job.started and job.ended else None
+        download['job_ms'] = round(job_ms, 1) if job_ms is not None else None
+        return frame, download
+
+    def table_columns(self, dataset_name: str) -> List[str]:
+        """Top-level column names of a dataset's table"""
+        dataset = self.datasets[dataset_name]
+        if dataset.engine == 'duckdb':
+            return self.duckdb.describe(dataset.full_path)['column_name'].tolist()
+        client = self.clients[dataset.billing_project_id]
+        return [field.name for field in client.get_table(dataset.full_path).schema]
+
+    def query_script(
+        self,
+        dataset_name: str,
+        statements: List[str],
+        params: Optional[List[QueryParameter]] = None,
+        maximum_bytes_billed: Optional[int] = None
+    ) -> List[Optional[pd.DataFrame]]:
+        """
+        Run statements as one multi-statement script (sharing temp tables and
+        parameters) and return a DataFrame per SELECT statement, None for the others.
+        Script results are not cached.
+        """
+        dataset = self.datasets[dataset_name]
+        statements = [statement.strip().rstrip(';') for statement in statements]
+
+        if dataset.engine == 'duckdb':
+            try:
+                return self.duckdb.script(statements, params)
+            except Exception as e:
+                raise Exception(f"Local script failed: {str(e)}")
+
+        # child jobs report the line their statement starts on
+        start_lines = []
+        line = 1
+        for statement in statements:
+            start_lines.append(line)
+            line += statement.count('\n') + 1
+        script = ';\n'.join(statements) + ';'
+
+        client = self.clients[dataset.billing_project_id]
+        try:
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=params or [],
+                maximum_bytes_billed=maximum_bytes_billed
+            )
+            job = client.query(script, job_config=job_config)
+            job.result()
+            children = {}
+            for child in client.list_jobs(parent_job=job.job_id):
+                frames = child.script_statistics.stack_frames if child.script_statistics else []
+                if frames:
+                    children[frames[0].start_line] = child
+            print(f"Script processed {job.total_bytes_processed} bytes, billed {job.total_bytes_billed}")
+
+            results: List[Optional[pd.DataFrame]] = []
+            for start_line in start_lines:
+                child = children.get(start_line)
+                if child is None or child.statement_type != 'SELECT':
+                    results.append(None)
+                else:
+                    child_job = client.get_job(child.job_id)
+                    frame, _ = self._download(client, dataset, child_job, child_job.result())
+                    results.append(frame)
+            return results
+        except Exception as e:
+            if maximum_bytes_billed is not None and 'bytesBilledLimitExceeded' in str(getattr(e, 'errors', '')):
+                raise QueryBudgetExceeded(dataset_name, maximum_bytes_billed) from e
+            raise Exception(f"Script failed: {str(e)}\nScript: {script}")
 
     def get_data(
         self,
@@ -70,7 +403,8 @@ class BigQuery:
         fields: List[str],
         where: Optional[str] = None,
         limit: Optional[int] = None,
-        as_dataframe: bool = True
+        as_dataframe: bool = True,
+        params: Optional[List[QueryParameter]] = None
     ) -> Union[pd.DataFrame, bigquery.table.RowIterator]:
         """Retrieve data from a specific dataset with optional filtering and limiting"""
         dataset = self.datasets[dataset_name]
@@ -80,7 +414,7 @@ class BigQuery:
             query += f" WHERE {where}"
         if limit:
             query += f" LIMIT {limit}"
-        return self.query(dataset_name, query, as_dataframe)
+        return self.query(dataset_name, query, as_dataframe, params=params)
 
 if __name__ == "__main__":
     bq = BigQuery()
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPIRES_AT_METADATA_KEY = b'discover_cache_expires_at'
+
+
+def normalize_sql(query: str) -> str:
+    """Collapse whitespace and strip `--` comments outside of quoted literals"""
+    out = []
+    quote = None
+    pending_space = False
+    i = 0
+    n = len(query)
+    while i < n:
+        ch = query[i]
+        if quote:
+            out.append(ch)
+            if ch == '\\' and i + 1 < n:
+                out.append(query[i + 1])
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+            i += 1
+            continue
+
+        if ch == '-' and query.startswith('--', i):
+            newline = query.find('\n', i)
+            i = n if newline == -1 else newline
+            pending_space = True
+            continue
+        if ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+
+        if pending_space and out:
+            out.append(' ')
+        pending_space = False
+        if ch in ("'", '"', '`'):
+            quote = ch
+        out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+@dataclass
+class _Entry:
+    frame: pd.DataFrame
+    size: int
+    expires_at: float
+
+
+class QueryCache:
+    """
+    Two-tier result cache for query DataFrames.
+
+    Entries live in an in-memory LRU and are written through to zstd-compressed
+    Parquet files on disk, so results survive restarts and are shared between
+    worker processes. Both tiers are bounded by a byte budget and evict the least
+    recently used entries first; every entry carries its own expiry time.
+
+    The memory tier owns its frames: `put` stores a copy and `get` hands out copies,
+    so callers may modify what they get or stored without touching the cached result.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_memory_bytes: int = 256 * 1024 * 1024,
+        max_disk_bytes: int = 2 * 1024 * 1024 * 1024,
+        default_ttl: float = 6 * 60 * 60
+    ):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.default_ttl = default_ttl
+
+        self._memory: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'expirations': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'disk_errors': 0
+        }
+
+        self._disk_bytes = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    @staticmethod
+    def make_key(dataset_name: str, query: str, params: Optional[List[Any]] = None) -> str:
+        """Build a cache key from the dataset name, normalized SQL and query parameters"""
+        payload = {
+            'dataset': dataset_name,
+            'query': normalize_sql(query),
+            'params': [
+                p.to_api_repr() if hasattr(p, 'to_api_repr') else p
+                for p in (params or [])
+            ]
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """Return a cached DataFrame, checking memory first and then disk"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return entry.frame.copy()
+                self._drop_memory(key)
+                self._counters['expirations'] += 1
+
+        frame, expires_at = self._read_disk(key, now)
+        with self._lock:
+            if frame is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._store_memory(key, frame, expires_at)
+        return frame.copy()
+
+    def put(self, key: str, frame: pd.DataFrame, ttl: Optional[float] = None) -> None:
+        """Store a DataFrame in both tiers with the given (or default) time to live"""
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_memory(key, frame.copy(), expires_at)
+        self._write_disk(key, frame, expires_at)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._drop_memory(key)
+        path = self._path(key)
+        if path and os.path.exists(path):
+            self._discard_file(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        for path, _, _ in self._scan_disk():
+            self._discard_file(path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            hits = counters['memory_hits'] + counters['disk_hits']
+            lookups = hits + counters['misses']
+            return {
+                **counters,
+                'hits': hits,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'max_memory_bytes': self.max_memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+                'cache_dir': self.cache_dir
+            }
+
+    # memory tier (callers hold self._lock)
+
+    def _store_memory(self, key: str, frame: pd.DataFrame, expires_at: float) -> None:
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        if size > self.max_memory_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = _Entry(frame, size, expires_at)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+            self._counters['memory_evictions'] += 1
+
+    def _drop_memory(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry.size
+
+    # disk tier
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def _scan_disk(self):
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return []
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.parquet'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _read_disk(self, key: str, now: float):
+        path = self._path(key)
+        if not path or not os.path.exists(path):
+            return None, None
+        try:
+            table = pq.read_table(path)
+            metadata = table.schema.metadata or {}
+            expires_at = float(metadata.get(EXPIRES_AT_METADATA_KEY, 0))
+            if expires_at <= now:
+                self._discard_file(path)
+                with self._lock:
+                    self._counters['expirations'] += 1
+                return None, None
+            os.utime(path)
+            return table.to_pandas(), expires_at
+        except Exception as e:
+            print(f"Query cache read failed for {path}: {str(e)}")
+            with self._lock:
+                self._counters['disk_errors'] += 1
+            self._discard_file(path)
+            return None, None
+
+    def _write_disk(self, key: str, frame: pd.DataFrame, expires_at: float) -> None:
+        path = self._path(key)
+        if not path:
+            return
+        try:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[EXPIRES_AT_METADATA_KEY] = str(expires_at).encode()
+            table = table.replace_schema_metadata(metadata)
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            pq.write_table(table, tmp_path, compression='zstd')
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += os.path.getsize(path) - previous
+                over_budget = self._disk_bytes > self.max_disk_bytes
+            if over_budget:
+                self._evict_disk()
+        except Exception as e:
+            print(f"Query cache write failed for {path}: {str(e)}")
+            with self._lock:
+                self._counters['disk_errors'] += 1
+
+    def _evict_disk(self) -> None:
+        """Delete the least recently used files until the disk tier fits its budget"""
+        files = sorted(self._scan_disk(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        for path, size, _ in files:
+            if total <= self.max_disk_bytes:
+                break
+            if self._remove_file(path):
+                total -= size
+                evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._counters['disk_evictions'] += evicted
+
+    def _discard_file(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if self._remove_file(path):
+            with self._lock:
+                self._disk_bytes = max(0, self._disk_bytes - size)
+
+    @staticmethod
+    def _remove_file(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+_default_cache: Optional[QueryCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> QueryCache:
+    """Process-wide cache shared by every BigQuery instance that doesn't bring its own"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = QueryCache(
+                cache_dir=os.environ.get(
+                    'DISCOVER_QUERY_CACHE_DIR',
+                    os.path.join(tempfile.gettempdir(), 'discover-query-cache')
+                ),
+                max_memory_bytes=int(os.environ.get('DISCOVER_QUERY_CACHE_MEMORY_BYTES', 256 * 1024 * 1024)),
+                max_disk_bytes=int(os.environ.get('DISCOVER_QUERY_CACHE_DISK_BYTES', 2 * 1024 * 1024 * 1024)),
+                default_ttl=float(os.environ.get('DISCOVER_QUERY_CACHE_TTL', 6 * 60 * 60))
+            )
+        return _default_cache
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import pandas as pd
 from concurrent.futures import ThreadPoolExecutor
 from .analytics.publication_analytics import PublicationAnalytics
@@ -11,24 +11,73 @@ from .analytics.repository_analytics import RepositoryAnalytics
 from .analytics.sdg_analytics import SDGAnalytics
 from .analytics.institutional_analytics import InstitutionalAnalytics
 from .analytics.trend_analytics import TrendAnalytics
+from .analytics.sketch_analytics import SketchAnalytics
+from .analytics.facet_analytics import FacetAnalytics
+from .batch import BatchScan
+from .pagination import BLOCK_SIZE, PublicationBlockCache
+from .publication_store import PublicationStore, get_default_publication_store
+from .search_index import SearchIndex, get_default_search_index
+from .sketches import merge_sketches
+
+GiB = 1024 ** 3
+
+# maximum_bytes_billed per analysis; BigQuery rejects queries that would bill more
+DEFAULT_BYTE_BUDGETS = {
+    'publications': 5 * GiB,
+    'publications_count': 5 * GiB,
+    'publication_venues': 10 * GiB,
+    'publication_stats': 15 * GiB,
+    'publication_timeline': 5 * GiB,
+    'collaborations': 10 * GiB,
+    'researcher_productivity': 10 * GiB,
+    'research_topics': 10 * GiB,
+    'funding_patterns': 10 * GiB,
+    'data_repositories': 10 * GiB,
+    'sdg_impact': 10 * GiB,
+    'institutional_impact': 10 * GiB,
+    'research_trends': 15 * GiB,
+    'sketches': 10 * GiB,
+    'facet_index': 10 * GiB,
+    'facet_ids': 5 * GiB
+}
 
 class DimensionsAnalytics:
     
-    def __init__(self, bq_client, max_workers: int = 10):
+    def __init__(
+        self,
+        bq_client,
+        max_workers: int = 10,
+        byte_budgets: Optional[Dict[str, int]] = None,
+        publication_block_size: int = BLOCK_SIZE,
+        search_index: Optional[SearchIndex] = None,
+        publication_store: Optional[PublicationStore] = None
+    ):
         self.bq = bq_client
         self.max_workers = max_workers
         self.loop = asyncio.get_event_loop()
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.byte_budgets = {**DEFAULT_BYTE_BUDGETS, **(byte_budgets or {})}
+        self.search_index = search_index if search_index is not None else get_default_search_index()
+        self.publication_store = publication_store if publication_store is not None else get_default_publication_store()
         
-        self.publication_analytics = PublicationAnalytics(bq_client)
-        self.collaboration_analytics = CollaborationAnalytics(bq_client)
-        self.researcher_analytics = ResearcherAnalytics(bq_client)
-        self.topic_analytics = TopicAnalytics(bq_client)
-        self.funding_analytics = FundingAnalytics(bq_client)
-        self.repository_analytics = RepositoryAnalytics(bq_client)
-        self.sdg_analytics = SDGAnalytics(bq_client)
-        self.institutional_analytics = InstitutionalAnalytics(bq_client)
-        self.trend_analytics = TrendAnalytics(bq_client)
+        self.publication_analytics = PublicationAnalytics(bq_client, self.byte_budgets, self.search_index, self.publication_store)
+        self.collaboration_analytics = CollaborationAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.researcher_analytics = ResearcherAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.topic_analytics = TopicAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.funding_analytics = FundingAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.repository_analytics = RepositoryAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.sdg_analytics = SDGAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.institutional_analytics = InstitutionalAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.trend_analytics = TrendAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.sketch_analytics = SketchAnalytics(bq_client, self.byte_budgets, self.search_index)
+        self.facet_analytics = FacetAnalytics(bq_client, self.byte_budgets, self.search_index)
+
+        # publication listing pages, sliced from cached blocks of publication_block_size rows
+        self.publication_pages = PublicationBlockCache(
+            self.publication_analytics.get_publication_block,
+            self.publication_analytics.get_publications_page,
+            block_size=publication_block_size
+        )
         
         self.analyses = {
             'publication_venues': self.publication_analytics.analyze,
@@ -98,6 +147,82 @@ class DimensionsAnalytics:
                 results[name] = None
         return results
 
+    async def run_batched_analyses(
+        self,
+        dataset_name: str,
+        filters: Dict[str, Any],
+        analysis_names: Optional[List[str]] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Run analyses (all by default) as one BigQuery script that filters the table once
+        into a temp table and runs every analysis against it. Returns the same shape as
+        run_concurrent_analyses, with None for analyses that failed.
+        """
+        names = list(analysis_names or self.analyses)
+        unknown = [name for name in names if name not in self.analyses]
+        if unknown:
+            raise ValueError(f"Unknown analyses {unknown}. Valid analyses are: {list(self.analyses.keys())}")
+
+        where_clause, params = self.publication_analytics.build_where_clause(filters)
+        budgets = [self.byte_budgets.get(name) for name in names]
+        batch = BatchScan(
+            self.bq,
+            dataset_name,
+            names,
+            where_clause,
+            params,
+            maximum_bytes_billed=None if None in budgets else sum(budgets)
+        )
+
+        def run(name: str) -> pd.DataFrame:
+            token = batch.activate(name)
+            try:
+                return self.analyses[name](dataset_name, filters)
+            finally:
+                batch.finish(name)
+                batch.deactivate(token)
+
+        # every analysis blocks until the whole batch has run, so each needs its own thread
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            tasks = [(name, self.loop.run_in_executor(executor, run, name)) for name in names]
+            for name, task in tasks:
+                try:
+                    results[name] = await task
+                    print(f"Completed analysis: {name}")
+                except Exception as e:
+                    print(f"Error in {name} analysis: {str(e)}")
+                    results[name] = None
+        return results
+
+    def get_publications_page(self, dataset_name: str, filters: Dict[str, Any]) -> Tuple[pd.DataFrame, Optional[str]]:
+        """A listing page and the next page's cursor, from the publication store when one is loaded"""
+        if self.publication_store is not None:
+            return self.publication_analytics.get_publications_page(dataset_name, filters)
+        return self.publication_pages.get_page(dataset_name, filters)
+
+    def merge_sketches(
+        self,
+        dataset_name: str,
+        filters: Dict[str, Any],
+        facets: Optional[List[str]] = None,
+        top_k: int = 20
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Approximate distinct counts and leaderboards for the filter's date range, merged
+        locally from cached per-year sketches (see bigquery.dimensions.sketches for the
+        error bounds). Only years without a cached sketch are queried.
+        """
+        sketches = self.sketch_analytics.get_year_sketches(dataset_name, filters)
+        return merge_sketches(sketches, facets, top_k)
+
+    def set_byte_budget(self, analysis_name: str, maximum_bytes_billed: Optional[int]) -> None:
+        """Set (or with None, remove) the maximum_bytes_billed budget for an analysis"""
+        if maximum_bytes_billed is None:
+            self.byte_budgets.pop(analysis_name, None)
+        else:
+            self.byte_budgets[analysis_name] = maximum_bytes_billed
+
     def __del__(self):
         """Cleanup executor on deletion"""
         if hasattr(self, 'executor'):
@@ -1,123 +1,170 @@
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple
 import pandas as pd
+from google.cloud import bigquery
+from pyroaring import FrozenBitMap
+from ..bq import QueryParameter
+from .batch import BATCH_TABLE, current_batch
+from .year_shards import YearShardCache, shard_ranges
+from .search_index import MAX_SEARCH_IDS, SearchIndex, tokenize
+from utils.canonical_filter import canonicalize_filter
 
 class DimensionsFilter:
-    def __init__(self, bq_client):
+    def __init__(
+        self,
+        bq_client,
+        byte_budgets: Optional[Dict[str, int]] = None,
+        search_index: Optional[SearchIndex] = None
+    ):
         self.bq = bq_client
+        # maximum_bytes_billed per analysis name, usually shared with DimensionsAnalytics
+        self.byte_budgets = byte_budgets if byte_budgets is not None else {}
+        # local full-text index resolving search_query to publication ids, if one is loaded
+        self.search_index = search_index
+
+    def table_ref(self, dataset_name: str) -> str:
+        """Table analytics queries read from: the dataset, or the shared temp table inside a batch"""
+        if current_batch() is not None:
+            return BATCH_TABLE
+        return self.bq.datasets[dataset_name].full_path
         
-    def build_where_clause(self, filters: Dict[str, Any]) -> str:
+    def build_where_clause(self, filters: Dict[str, Any]) -> Tuple[str, List[QueryParameter]]:
+        """
+        Build a parameterized WHERE clause for the given filters.
+
+        Filter values are never inlined: each predicate references a fixed named
+        parameter, so the query text only depends on which filters are set and not
+        on their values. Returns the clause and the parameters it references.
+        """
+        filters = canonicalize_filter(filters)
         conditions = []
-        
+        params: List[QueryParameter] = []
+
+        def scalar(name: str, type_: str, value: Any) -> str:
+            params.append(bigquery.ScalarQueryParameter(name, type_, value))
+            return f"@{name}"
+
+        def array(name: str, values: List[Any], type_: str = 'STRING') -> str:
+            params.append(bigquery.ArrayQueryParameter(name, type_, list(values)))
+            return f"@{name}"
+
+        def number_type(value: Any) -> str:
+            return 'INT64' if isinstance(value, int) and not isinstance(value, bool) else 'FLOAT64'
+
         conditions.append("date_normal IS NOT NULL")
 
         if filters.get('dateRange'):
             if filters['dateRange'].get('from'):
                 from_date = self._format_date(filters['dateRange']['from'])
                 if from_date:
-                    conditions.append(f"DATE(date_normal) >= DATE('{from_date}')")
+                    conditions.append(f"DATE(date_normal) >= {scalar('date_from', 'DATE', from_date)}")
             if filters['dateRange'].get('to'):
                 to_date = self._format_date(filters['dateRange']['to'])
                 if to_date:
-                    conditions.append(f"DATE(date_normal) <= DATE('{to_date}')")
+                    conditions.append(f"DATE(date_normal) <= {scalar('date_to', 'DATE', to_date)}")
 
+        # publication years (and with yearsFrom, every year from then on), used to
+        # compute only the missing per-year shards
+        year_conditions = []
+        if filters.get('years'):
+            year_conditions.append(f"EXTRACT(YEAR FROM date_normal) IN UNNEST({array('years', filters['years'], 'INT64')})")
+        if filters.get('yearsFrom'):
+            year_conditions.append(f"EXTRACT(YEAR FROM date_normal) >= {scalar('years_from', 'INT64', filters['yearsFrom'])}")
+        if year_conditions:
+            conditions.append(year_conditions[0] if len(year_conditions) == 1 else f"({' OR '.join(year_conditions)})")
 
         if filters.get('search_query'):
-            search_terms = filters['search_query'].replace("'", "''")
-            conditions.append(f"""(
-                LOWER(title.preferred) LIKE LOWER('%{search_terms}%') OR
-                LOWER(COALESCE(abstract.preferred, '')) LIKE LOWER('%{search_terms}%')
-            )""")
+            search_ids = self.search_ids(filters['search_query'])
+            if search_ids is not None:
+                # matches in relevance order, which listings use as their sort
+                conditions.append(f"id IN UNNEST({array('search_ids', search_ids)})")
+            else:
+                search = scalar('search_query', 'STRING', filters['search_query'])
+                conditions.append(f"""(
+                    LOWER(title.preferred) LIKE CONCAT('%', LOWER({search}), '%') OR
+                    LOWER(COALESCE(abstract.preferred, '')) LIKE CONCAT('%', LOWER({search}), '%')
+                )""")
 
         if filters.get('citationCount'):
-            if filters['citationCount'].get('min') is not None:
-                conditions.append(f"COALESCE(citations_count, 0) >= {filters['citationCount']['min']}")
-            if filters['citationCount'].get('max') is not None:
-                conditions.append(f"citations_count <= {filters['citationCount']['max']}")
-
-        if filters.get('type') and len(filters['type']) > 0:
-            doc_types = [f"'{t}'" for t in filters['type']]
-            conditions.append(f"document_type.classification IN ({','.join(doc_types)})")
-
-        if filters.get('type') and len(filters['type']) > 0:
-            doc_types = [f"'{t}'" for t in filters['type']]
-            conditions.append(f"document_type.classification IN ({','.join(doc_types)})")
-
-        if filters.get('excludeTypes') and len(filters['excludeTypes']) > 0:
-            exclude_types = [f"'{t}'" for t in filters['excludeTypes']]
-            conditions.append(f"document_type.classification NOT IN ({','.join(exclude_types)})")
-            
-        if filters.get('fields') and len(filters['fields']) > 0:
-            field_conditions = []
-            for field in filters['fields']:
-                field = field.replace("'", "''")
-                field_conditions.append(f"""
-                    EXISTS (
-                        SELECT 1 
-                        FROM UNNEST(categories.for_2020_v2022.first_level.full) f
-                        WHERE LOWER(f.name) = LOWER('{field}')
-                    )
-                """)
-            if field_conditions:
-                conditions.append(f"({' OR '.join(field_conditions)})")
+            citation_min = filters['citationCount'].get('min')
+            if citation_min is not None:
+                conditions.append(f"COALESCE(citations_count, 0) >= {scalar('citation_min', number_type(citation_min), citation_min)}")
+            citation_max = filters['citationCount'].get('max')
+            if citation_max is not None:
+                conditions.append(f"citations_count <= {scalar('citation_max', number_type(citation_max), citation_max)}")
 
-        if filters.get('excludeFields') and len(filters['excludeFields']) > 0:
-            for field in filters['excludeFields']:
-                field = field.replace("'", "''")
-                conditions.append(f"""
-                    NOT EXISTS (
-                        SELECT 1 
-                        FROM UNNEST(categories.for_2020_v2022.first_level.full) f
-                        WHERE LOWER(f.name) = LOWER('{field}')
-                    )
-                """)
+        if filters.get('type'):
+            conditions.append(f"document_type.classification IN UNNEST({array('types', filters['type'])})")
+
+        if filters.get('excludeTypes'):
+            conditions.append(f"document_type.classification NOT IN UNNEST({array('exclude_types', filters['excludeTypes'])})")
+
+        if filters.get('fields'):
+            fields = array('fields', sorted({f.lower() for f in filters['fields']}))
+            conditions.append(f"""
+                EXISTS (
+                    SELECT 1
+                    FROM UNNEST(categories.for_2020_v2022.first_level.full) f
+                    WHERE LOWER(f.name) IN UNNEST({fields})
+                )
+            """)
+
+        if filters.get('excludeFields'):
+            exclude_fields = array('exclude_fields', sorted({f.lower() for f in filters['excludeFields']}))
+            conditions.append(f"""
+                NOT EXISTS (
+                    SELECT 1
+                    FROM UNNEST(categories.for_2020_v2022.first_level.full) f
+                    WHERE LOWER(f.name) IN UNNEST({exclude_fields})
+                )
+            """)
 
         if filters.get('organizations'):
             # Handle research organizations
-            if filters['organizations'].get('research') and len(filters['organizations']['research']) > 0:
-                research_orgs = [f"'{org}'" for org in filters['organizations']['research']]
+            if filters['organizations'].get('research'):
+                research_orgs = array('research_orgs', filters['organizations']['research'])
                 conditions.append(f"""
                     EXISTS (
-                        SELECT 1 
+                        SELECT 1
                         FROM UNNEST(research_orgs) org
-                        WHERE org IN ({','.join(research_orgs)})
+                        WHERE org IN UNNEST({research_orgs})
                     )
                 """)
-            
+
             # Add handling for excludeResearch
-            if filters['organizations'].get('excludeResearch') and len(filters['organizations']['excludeResearch']) > 0:
-                exclude_research_orgs = [f"'{org}'" for org in filters['organizations']['excludeResearch']]
+            if filters['organizations'].get('excludeResearch'):
+                exclude_research_orgs = array('exclude_research_orgs', filters['organizations']['excludeResearch'])
                 conditions.append(f"""
                     NOT EXISTS (
-                        SELECT 1 
+                        SELECT 1
                         FROM UNNEST(research_orgs) org
-                        WHERE org IN ({','.join(exclude_research_orgs)})
+                        WHERE org IN UNNEST({exclude_research_orgs})
                     )
                 """)
 
             # Handle funding organizations
-            if filters['organizations'].get('funding') and len(filters['organizations']['funding']) > 0:
-                funding_orgs = [f"'{org}'" for org in filters['organizations']['funding']]
+            if filters['organizations'].get('funding'):
+                funding_orgs = array('funding_orgs', filters['organizations']['funding'])
                 conditions.append(f"""
                     EXISTS (
-                        SELECT 1 
+                        SELECT 1
                         FROM UNNEST(funder_orgs) org
-                        WHERE org IN ({','.join(funding_orgs)})
+                        WHERE org IN UNNEST({funding_orgs})
                     )
                 """)
 
-        if filters.get('journalLists') and len(filters['journalLists']) > 0:
-            journal_lists = [f"'{jl}'" for jl in filters['journalLists']]
+        if filters.get('journalLists'):
+            journal_lists = array('journal_lists', filters['journalLists'])
             conditions.append(f"""
                 EXISTS (
-                    SELECT 1 
+                    SELECT 1
                     FROM UNNEST(journal_lists) jl
-                    WHERE jl IN ({','.join(journal_lists)})
+                    WHERE jl IN UNNEST({journal_lists})
                 )
             """)
 
         if filters.get('openAccess'):
             conditions.append("""
-                (ARRAY_LENGTH(COALESCE(open_access_categories, [])) > 0 OR 
+                (ARRAY_LENGTH(COALESCE(open_access_categories, [])) > 0 OR
                 ARRAY_LENGTH(COALESCE(open_access_categories_v2, [])) > 0)
             """)
 
@@ -125,22 +172,18 @@ class DimensionsFilter:
             conditions.append("doi IS NOT NULL")
 
         if filters.get('publisherFilters'):
-            if filters['publisherFilters'].get('publishers') and len(filters['publisherFilters']['publishers']) > 0:
-                publishers = [f"'{p}'" for p in filters['publisherFilters']['publishers']]
-                conditions.append(f"publisher.name IN ({','.join(publishers)})")
-            if filters['publisherFilters'].get('excludePublishers') and len(filters['publisherFilters']['excludePublishers']) > 0:
-                exclude_publishers = [f"'{p}'" for p in filters['publisherFilters']['excludePublishers']]
-                conditions.append(f"publisher.name NOT IN ({','.join(exclude_publishers)})")
+            if filters['publisherFilters'].get('publishers'):
+                conditions.append(f"publisher.name IN UNNEST({array('publishers', filters['publisherFilters']['publishers'])})")
+            if filters['publisherFilters'].get('excludePublishers'):
+                conditions.append(f"publisher.name NOT IN UNNEST({array('exclude_publishers', filters['publisherFilters']['excludePublishers'])})")
 
         if filters.get('documentTypes'):
-            if filters['documentTypes'].get('include') and len(filters['documentTypes']['include']) > 0:
-                doc_types = [f"'{dt}'" for dt in filters['documentTypes']['include']]
-                conditions.append(f"document_type.classification IN ({','.join(doc_types)})")
-            if filters['documentTypes'].get('exclude') and len(filters['documentTypes']['exclude']) > 0:
-                exclude_types = [f"'{dt}'" for dt in filters['documentTypes']['exclude']]
-                conditions.append(f"document_type.classification NOT IN ({','.join(exclude_types)})")
-
-        # preprint handling 
+            if filters['documentTypes'].get('include'):
+                conditions.append(f"document_type.classification IN UNNEST({array('document_types', filters['documentTypes']['include'])})")
+            if filters['documentTypes'].get('exclude'):
+                conditions.append(f"document_type.classification NOT IN UNNEST({array('exclude_document_types', filters['documentTypes']['exclude'])})")
+
+        # preprint handling
         if filters.get('preprints'):
             if filters['preprints'].get('exclude'):
                 conditions.append("""
@@ -149,8 +192,8 @@ class DimensionsFilter:
                 """)
             elif filters['preprints'].get('only'):
                 conditions.append("""
-                    (repository_dois IS NOT NULL AND ARRAY_LENGTH(repository_dois) > 0) OR
-                    arxiv_id IS NOT NULL
+                    ((repository_dois IS NOT NULL AND ARRAY_LENGTH(repository_dois) > 0) OR
+                    arxiv_id IS NOT NULL)
                 """)
 
         if filters.get('accessType'):
@@ -162,22 +205,122 @@ class DimensionsFilter:
             if access_conditions:
                 conditions.append(f"({' OR '.join(access_conditions)})")
 
-        if filters.get('subjectAreas') and len(filters['subjectAreas']) > 0:
-            subject_conditions = []
-            for subject in filters['subjectAreas']:
-                subject = subject.replace("'", "''")
-                subject_conditions.append(f"""
-                    EXISTS (
-                        SELECT 1 
-                        FROM UNNEST(categories.for_2020_v2022.first_level.full) f
-                        WHERE LOWER(f.name) = LOWER('{subject}')
-                    )
-                """)
-            if subject_conditions:
-                conditions.append(f"({' OR '.join(subject_conditions)})")
-                
+        if filters.get('subjectAreas'):
+            subject_areas = array('subject_areas', sorted({s.lower() for s in filters['subjectAreas']}))
+            conditions.append(f"""
+                EXISTS (
+                    SELECT 1
+                    FROM UNNEST(categories.for_2020_v2022.first_level.full) f
+                    WHERE LOWER(f.name) IN UNNEST({subject_areas})
+                )
+            """)
+
         where_clause = " AND ".join(conditions) if conditions else "1=1"
-        return where_clause
+        return where_clause, params
+
+    def select_rows(self, index: Any, filters: Dict[str, Any]) -> Optional[FrozenBitMap]:
+        """
+        Rows of a local row index (FacetIndex, PublicationStore) matching the filter,
+        with the semantics of build_where_clause: values of one filter are OR-ed,
+        filters are AND-ed and exclude lists are subtracted. As in SQL, `NOT IN` drops
+        rows without a value while `NOT EXISTS` keeps them. Returns None for a search
+        the local search index cannot resolve.
+        """
+        filters = canonicalize_filter(filters)
+        selection = index.all_rows
+
+        if filters.get('dateRange'):
+            date_from = self._format_date(filters['dateRange']['from']) if filters['dateRange'].get('from') else None
+            date_to = self._format_date(filters['dateRange']['to']) if filters['dateRange'].get('to') else None
+            if date_from or date_to:
+                selection &= index.date_range(date_from, date_to)
+
+        year_rows = []
+        if filters.get('years'):
+            year_rows.append(index.any_of('year', filters['years']))
+        if filters.get('yearsFrom'):
+            year_rows.append(index.date_range(f"{int(filters['yearsFrom']):04d}-01-01", None))
+        if year_rows:
+            selection &= year_rows[0] if len(year_rows) == 1 else year_rows[0] | year_rows[1]
+
+        if filters.get('search_query'):
+            search_ids = self.search_ids(filters['search_query'])
+            if search_ids is None:
+                return None
+            selection &= index.rows_for_ids(search_ids)
+
+        if filters.get('citationCount'):
+            citation_min = filters['citationCount'].get('min')
+            citation_max = filters['citationCount'].get('max')
+            if citation_min is not None or citation_max is not None:
+                selection &= index.citation_range(citation_min, citation_max)
+
+        if filters.get('type'):
+            selection &= index.any_of('document_type', filters['type'])
+
+        if filters.get('excludeTypes'):
+            selection &= index.present('document_type') - index.any_of('document_type', filters['excludeTypes'])
+
+        if filters.get('fields'):
+            selection &= index.any_of('field', {f.lower() for f in filters['fields']})
+
+        if filters.get('excludeFields'):
+            selection -= index.any_of('field', {f.lower() for f in filters['excludeFields']})
+
+        if filters.get('organizations'):
+            if filters['organizations'].get('research'):
+                selection &= index.any_of('research_org', filters['organizations']['research'])
+            if filters['organizations'].get('excludeResearch'):
+                selection -= index.any_of('research_org', filters['organizations']['excludeResearch'])
+            if filters['organizations'].get('funding'):
+                selection &= index.any_of('funder', filters['organizations']['funding'])
+
+        if filters.get('journalLists'):
+            selection &= index.any_of('journal_list', filters['journalLists'])
+
+        if filters.get('openAccess'):
+            selection &= index.flag('open_access')
+
+        if filters.get('has_doi'):
+            selection &= index.flag('has_doi')
+
+        if filters.get('publisherFilters'):
+            if filters['publisherFilters'].get('publishers'):
+                selection &= index.any_of('publisher', filters['publisherFilters']['publishers'])
+            if filters['publisherFilters'].get('excludePublishers'):
+                selection &= index.present('publisher') - index.any_of('publisher', filters['publisherFilters']['excludePublishers'])
+
+        if filters.get('documentTypes'):
+            if filters['documentTypes'].get('include'):
+                selection &= index.any_of('document_type', filters['documentTypes']['include'])
+            if filters['documentTypes'].get('exclude'):
+                selection &= index.present('document_type') - index.any_of('document_type', filters['documentTypes']['exclude'])
+
+        if filters.get('preprints'):
+            if filters['preprints'].get('exclude'):
+                selection -= index.flag('preprint')
+            elif filters['preprints'].get('only'):
+                selection &= index.flag('preprint')
+
+        if filters.get('accessType'):
+            access_types = [name for name in ('openAccess', 'subscription') if filters['accessType'].get(name)]
+            if access_types:
+                selection &= index.any_of('access_type', access_types)
+
+        if filters.get('subjectAreas'):
+            selection &= index.any_of('field', {s.lower() for s in filters['subjectAreas']})
+
+        return selection
+
+    def search_ids(self, search_query: str) -> Optional[List[str]]:
+        """Ids matching a search, best first, or None to search with LIKE in the query"""
+        # only stopwords or punctuation: the index would match nothing, LIKE still can
+        if self.search_index is None or not tokenize(search_query):
+            return None
+        matches = self.search_index.search(search_query, limit=MAX_SEARCH_IDS + 1)
+        if len(matches) > MAX_SEARCH_IDS:
+            return None
+        return [publication_id for publication_id, _ in matches]
 
     def _format_date(self, date_input: Any) -> str:
         """Enhanced date formatter with better error handling"""
@@ -201,10 +344,58 @@ class DimensionsFilter:
             print(f"Input: {date_input}, Type: {type(date_input)}")
             return None
 
-    def execute_query(self, dataset_name: str, query: str) -> pd.DataFrame:
+    def _year_shards(self, dataset_name: str) -> Optional[YearShardCache]:
+        cache = getattr(self.bq, 'cache', None)
+        if cache is None or current_batch() is not None or self.bq.datasets[dataset_name].engine != 'bigquery':
+            return None
+        return YearShardCache(cache)
+
+    def can_shard_by_year(self, dataset_name: str, filters: Dict[str, Any]) -> bool:
+        return self._year_shards(dataset_name) is not None and shard_ranges(filters) is not None
+
+    def execute_yearly_query(
+        self,
+        dataset_name: str,
+        filters: Dict[str, Any],
+        build_query: Callable[[str], str],
+        analysis: str
+    ) -> pd.DataFrame:
+        """
+        Run a query whose rows are computed independently per `year`, reusing cached
+        per-year shards and querying only the missing years. `build_query` turns a
+        WHERE clause into the query text.
+        """
+        def run(job_filters: Dict[str, Any]) -> pd.DataFrame:
+            where_clause, params = self.build_where_clause(job_filters)
+            return self.execute_query(dataset_name, build_query(where_clause), params, analysis=analysis)
+
+        shards = self._year_shards(dataset_name)
+        if shards is None:
+            return run(filters)
+        return shards.fetch(self.bq.datasets[dataset_name].full_path, analysis, filters, run)
+
+    def execute_query(
+        self,
+        dataset_name: str,
+        query: str,
+        params: Optional[List[QueryParameter]] = None,
+        analysis: Optional[str] = None
+    ) -> pd.DataFrame:
+        """Run an analytics query, enforcing the byte budget configured for `analysis`"""
+        batch = current_batch()
+        if batch is not None:
+            scan, analysis_name = batch
+            return scan.submit(analysis_name, query, params)
         try:
             print(f"\nExecuting query:\n{query}\n")
-            result = self.bq.query(dataset_name, query)
+            if params:
+                print(f"Parameters: { {p.name: getattr(p, 'value', getattr(p, 'values', None)) for p in params} }")
+            result = self.bq.query(
+                dataset_name,
+                query,
+                params=params,
+                maximum_bytes_billed=self.byte_budgets.get(analysis)
+            )
             print(f"Query returned {len(result) if result is not None else 0} rows")
             return result
         except Exception as e:
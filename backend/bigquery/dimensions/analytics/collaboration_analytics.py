@@ -5,6 +5,7 @@ from ..DimensionsFilter import DimensionsFilter
 class CollaborationAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze collaboration networks and patterns"""
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH base_collaborations AS (
             SELECT 
@@ -17,10 +18,10 @@ class CollaborationAnalytics(DimensionsFilter):
                 categories.for_2020_v2022.first_level.full[SAFE_OFFSET(0)].name as field_name,
                 ARRAY_LENGTH(open_access_categories) > 0 as is_open_access,
                 ARRAY_LENGTH(repository_dois) > 0 as has_data
-            FROM `{self.bq.datasets[dataset_name].full_path}`,
+            FROM `{self.table_ref(dataset_name)}`,
             UNNEST(research_orgs) as org,
             UNNEST(research_org_country_names) as country_name
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             AND org != 'grid.266100.3'  -- Exclude self-collaboration
         ),
         collaboration_metrics AS (
@@ -45,4 +46,4 @@ class CollaborationAnalytics(DimensionsFilter):
         ORDER BY year DESC, publication_count DESC
         LIMIT 500
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        return self.execute_query(dataset_name, query, params, analysis='collaborations')
\ No newline at end of file
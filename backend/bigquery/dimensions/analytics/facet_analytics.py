@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Dict, Any
+from pyroaring import FrozenBitMap
+from ..DimensionsFilter import DimensionsFilter
+from ..facet_index import FACETS, FacetIndex, build_facet_query
+
+# the index is rebuilt in the background once it is older than this
+REFRESH_INTERVAL = 6 * 60 * 60
+# values returned per facet; years are always returned in full
+FACET_LIMIT = 50
+
+class FacetAnalytics(DimensionsFilter):
+    def __init__(self, bq_client, byte_budgets=None, search_index=None, refresh_interval: float = REFRESH_INTERVAL):
+        super().__init__(bq_client, byte_budgets, search_index)
+        self.refresh_interval = refresh_interval
+        self._indexes: Dict[str, FacetIndex] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def get_index(self, dataset_name: str) -> FacetIndex:
+        """The dataset's facet index, built on first use and refreshed in the background"""
+        index = self._indexes.get(dataset_name)
+        if index is None:
+            with self._build_lock:
+                index = self._indexes.get(dataset_name)
+                if index is None:
+                    index = self._indexes[dataset_name] = self.build_index(dataset_name)
+        elif (time.time() - index.built_at.timestamp()) > self.refresh_interval:
+            with self._lock:
+                stale = dataset_name not in self._refreshing
+                self._refreshing.add(dataset_name)
+            if stale:
+                threading.Thread(target=self._refresh, args=(dataset_name,), daemon=True).start()
+        return index
+
+    def build_index(self, dataset_name: str) -> FacetIndex:
+        started = time.perf_counter()
+        publications = self.bq.query(
+            dataset_name,
+            build_facet_query(self.bq.datasets[dataset_name].full_path),
+            use_cache=False,
+            maximum_bytes_billed=self.byte_budgets.get('facet_index')
+        )
+        index = FacetIndex.build(publications)
+        print(f"Built facet index for {dataset_name}: {index.num_rows} publications in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return index
+
+    def _refresh(self, dataset_name: str) -> None:
+        try:
+            self._indexes[dataset_name] = self.build_index(dataset_name)
+        except Exception as e:
+            print(f"Facet index refresh failed for {dataset_name}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(dataset_name)
+
+    def _query_selection(self, dataset_name: str, index: FacetIndex, filters: Dict[str, Any]) -> FrozenBitMap:
+        """Rows matching the filter according to BigQuery, for filters the index cannot evaluate"""
+        where_clause, params = self.build_where_clause(filters)
+        query = f"""
+        SELECT id
+        FROM `{self.table_ref(dataset_name)}`
+        WHERE {where_clause}
+        """
+        result = self.execute_query(dataset_name, query, params, analysis='facet_ids')
+        return index.rows_for_ids(result['id'].astype(str))
+
+    def get_facet_counts(self, dataset_name: str, filters: Dict[str, Any], limit: int = FACET_LIMIT) -> Dict[str, Any]:
+        """Publication count and per-value counts of every sidebar facet for the filter"""
+        started = time.perf_counter()
+        index = self.get_index(dataset_name)
+        selection = self.select_rows(index, filters)
+        source = 'index'
+        if selection is None:
+            selection = self._query_selection(dataset_name, index, filters)
+            source = 'query'
+
+        facets: Dict[str, Any] = {
+            name: index.counts(selection, name, limit=None if name == 'year' else limit)
+            for name in FACETS
+        }
+        return {
+            'total': len(selection),
+            'facets': facets,
+            'source': source,
+            'index_built_at': index.built_at.isoformat(),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
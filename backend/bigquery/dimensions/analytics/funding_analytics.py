@@ -5,6 +5,7 @@ from ..DimensionsFilter import DimensionsFilter
 class FundingAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze funding patterns and impact"""
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH funder_metrics AS (
             SELECT 
@@ -19,12 +20,12 @@ class FundingAnalytics(DimensionsFilter):
                 COUNTIF(ARRAY_LENGTH(open_access_categories) > 0) as open_access_papers,
                 COUNTIF(ARRAY_LENGTH(repository_dois) > 0) as papers_with_data,
                 COUNT(DISTINCT ARRAY_TO_STRING(research_org_countries, ',')) as collaborating_countries
-            FROM `{self.bq.datasets[dataset_name].full_path}`,
+            FROM `{self.table_ref(dataset_name)}`,
             UNNEST(funding_details) as funding
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             GROUP BY year, funding.grid_id
             ORDER BY year DESC, publication_count DESC
         )
         SELECT * FROM funder_metrics
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        return self.execute_query(dataset_name, query, params, analysis='funding_patterns')
\ No newline at end of file
@@ -4,11 +4,20 @@ from ..DimensionsFilter import DimensionsFilter
 
 class InstitutionalAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
-        """Analyze institutional research impact and patterns"""
-        query = f"""
+        """Analyze institutional research impact and patterns, one row per year"""
+        result = self.execute_yearly_query(
+            dataset_name,
+            filters,
+            lambda where_clause: self._impact_query(dataset_name, where_clause),
+            analysis='institutional_impact'
+        )
+        return result.sort_values('year', ascending=False, ignore_index=True)
+
+    def _impact_query(self, dataset_name: str, where_clause: str) -> str:
+        return f"""
         WITH impact_metrics AS (
             SELECT 
-                year,
+                EXTRACT(YEAR FROM date_normal) as year,
                 COUNT(DISTINCT id) as publication_count,
                 AVG(citations_count) as avg_citations,
                 AVG(metrics.field_citation_ratio) as field_weighted_impact,
@@ -27,12 +36,11 @@ class InstitutionalAnalytics(DimensionsFilter):
                 -- Funding success
                 COUNT(DISTINCT funding_details.grant_id) as total_grants,
                 COUNT(DISTINCT funding_details.grid_id) as unique_funders
-            FROM `{self.bq.datasets[dataset_name].full_path}`,
+            FROM `{self.table_ref(dataset_name)}`,
             UNNEST(funding_details) as funding_details
-            WHERE {self.build_where_clause(filters)}
-            GROUP BY year
+            WHERE {where_clause}
+            GROUP BY EXTRACT(YEAR FROM date_normal)
             ORDER BY year DESC
         )
         SELECT * FROM impact_metrics
-        """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        """
\ No newline at end of file
@@ -1,18 +1,222 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+import numpy as np
 import pandas as pd
+from google.cloud import bigquery
 from ..DimensionsFilter import DimensionsFilter
+from ..batch import current_batch
+from ..pagination import InvalidCursor, decode_cursor, encode_cursor, listing_filter
+from ..publication_store import PublicationStore
+from ..rollup import DOC_TYPE_COLUMNS, build_rollup_stats_query, build_rollup_where_clause
+
+ALL_STATS_OUTPUT = """
+SELECT * FROM yearly_stats
+UNION ALL
+SELECT * FROM all_years_stats"""
+
+SHARD_TOTALS = """,
+
+shard_totals AS (
+    SELECT
+        pub_year AS year,
+        SUM(citations_count) AS shard_sum_citations,
+        SUM(recent_citations) AS shard_sum_recent_citations,
+        SUM(field_citation_ratio) AS shard_sum_field_citation_ratio,
+        SUM(relative_citation_ratio) AS shard_sum_relative_citation_ratio,
+        SUM(altmetric_score) AS shard_sum_altmetric_score,
+        SUM(collaboration_count) AS shard_sum_collaborating_institutions,
+        SUM(international_collaboration_count) AS shard_sum_collaborating_countries,
+        SUM(author_count) AS shard_sum_authors,
+        SUM(citation_references_count) AS shard_sum_references,
+        ARRAY_AGG(DISTINCT EXTRACT(MONTH FROM date_normal)) AS shard_months
+    FROM filtered_pubs
+    WHERE pub_year IS NOT NULL
+    GROUP BY pub_year
+)"""
+
+# get_timeline granularities and their DATE_TRUNC parts
+TIMELINE_GRANULARITIES = {'month': 'MONTH', 'quarter': 'QUARTER', 'year': 'YEAR'}
+
+# shard_* sums and months of the per-year grouping sets query, from filtered_pubs
+GROUPING_SETS_SHARD_COLUMNS = [
+    ('shard_sum_citations', 'SUM(citations_count)'),
+    ('shard_sum_recent_citations', 'SUM(recent_citations)'),
+    ('shard_sum_field_citation_ratio', 'SUM(field_citation_ratio)'),
+    ('shard_sum_relative_citation_ratio', 'SUM(relative_citation_ratio)'),
+    ('shard_sum_altmetric_score', 'SUM(altmetric_score)'),
+    ('shard_sum_collaborating_institutions', 'SUM(collaboration_count)'),
+    ('shard_sum_collaborating_countries', 'SUM(international_collaboration_count)'),
+    ('shard_sum_authors', 'SUM(author_count)'),
+    ('shard_sum_references', 'SUM(citation_references_count)'),
+    ('shard_months', 'ARRAY_AGG(DISTINCT EXTRACT(MONTH FROM date_normal))')
+]
+GROUPING_SETS_SHARD_TOTALS = ''.join(f",\n        {expr} AS {column}" for column, expr in GROUPING_SETS_SHARD_COLUMNS)
+
+# leaderboards of the grouping sets stats query:
+# (column, FROM clause, item (expression, alias) pairs, WHERE, count column, struct fields, limit)
+GROUPING_SETS_FACETS = [
+    ('doc_type_counts', 'filtered_pubs p', [('p.doc_type', 'doc_type')], None,
+     'doc_count', 'doc_type, doc_count', None),
+    ('top_concepts', 'filtered_pubs p, UNNEST(concepts) AS concept', [('concept.concept', 'concept_text')],
+     'concept.concept IS NOT NULL', 'concept_count', 'concept_text, concept_count', 200),
+    ('top_mesh_terms', 'filtered_pubs p, UNNEST(mesh_terms) AS mesh_term', [('mesh_term', 'term')],
+     'mesh_term IS NOT NULL', 'term_count', 'term, term_count', 100),
+    ('sdg_categories', 'filtered_pubs p, UNNEST(sdg_categories) AS sdg', [('sdg.code', 'code'), ('sdg.name', 'name')],
+     'sdg.code IS NOT NULL', 'sdg_count', 'code, name, sdg_count', 17),
+    ('top_countries', 'filtered_pubs p, UNNEST(research_org_countries) AS research_country', [('research_country', 'country')],
+     'research_country IS NOT NULL', 'count', 'country, count', 20),
+    ('top_collaborating_institutions', 'filtered_pubs p, UNNEST(research_orgs) AS research_org', [('research_org', 'org')],
+     'research_org IS NOT NULL', 'count', 'org, count', 20),
+    ('top_journals', 'filtered_pubs p', [('p.source.title', 'journal')],
+     'p.source.title IS NOT NULL', 'count', 'journal, count', 20),
+    ('top_authors', 'filtered_pubs p, UNNEST(authors) AS author', [("CONCAT(author.first_name, ' ', author.last_name)", 'author')],
+     None, 'count', 'author, count', 20),
+    ('open_access_types', 'filtered_pubs p, UNNEST(open_access_categories) AS cat', [('cat', 'category')],
+     'cat IS NOT NULL', 'count', 'category, count', 20),
+    ('top_funders', 'filtered_pubs p, UNNEST(funder_orgs) AS funder_org', [('funder_org', 'funder')],
+     'funder_org IS NOT NULL', 'count', 'funder, count', 20),
+    ('top_publishers', 'filtered_pubs p', [('p.publisher.name', 'publisher')],
+     'p.publisher.name IS NOT NULL', 'count', 'publisher, count', 20)
+]
+
+# per-year shard_<column> list size, None to keep every item (as rollup.py's CELL_FACETS top-k)
+SHARD_TOP_K = {
+    'doc_type_counts': None,
+    'top_concepts': 500,
+    'top_mesh_terms': 300,
+    'sdg_categories': None,
+    'top_countries': None,
+    'top_collaborating_institutions': 200,
+    'top_journals': 200,
+    'top_authors': 200,
+    'open_access_types': None,
+    'top_funders': 200,
+    'top_publishers': 200
+}
+
+
+def _shard_list(column: str, fields: str, count_name: str) -> str:
+    """ARRAY_AGG of a year's shard_<column> list, its top SHARD_TOP_K items when capped"""
+    top_k = SHARD_TOP_K[column]
+    order = f" ORDER BY {count_name} DESC LIMIT {top_k}" if top_k else ""
+    return f"ARRAY_AGG(STRUCT({fields}){order}) AS shard_{column}"
+
+
+def _shard_stats_output() -> str:
+    """
+    Output of the legacy query's per-year variant: yearly_stats plus the shard_* sums
+    and, for every leaderboard, the year's shard_<column> {item, count} list, which
+    _merge_stats_years sums into the all-years leaderboard.
+    """
+    ctes = [SHARD_TOTALS]
+    joins = ['JOIN shard_totals t USING (year)']
+    columns = ['t.* EXCEPT (year)']
+    for column, source, items, where, count_name, fields, _ in GROUPING_SETS_FACETS:
+        item_select = ', '.join(f"{expr} AS {alias}" for expr, alias in items)
+        item_names = ', '.join(alias for _, alias in items)
+        conditions = ' AND '.join(['p.pub_year IS NOT NULL'] + ([where] if where else []))
+        ctes.append(f""",
+
+shard_{column} AS (
+    SELECT
+        pub_year AS year,
+        {_shard_list(column, fields, count_name)}
+    FROM (
+        SELECT pub_year, {item_names}, COUNT(*) AS {count_name}
+        FROM (
+            SELECT p.pub_year, {item_select}
+            FROM {source}
+            WHERE {conditions}
+        )
+        GROUP BY pub_year, {item_names}
+    )
+    GROUP BY pub_year
+)""")
+        joins.append(f"LEFT JOIN shard_{column} USING (year)")
+        columns.append(f"shard_{column}.shard_{column}")
+    return f"""{''.join(ctes)}
+
+SELECT
+    y.*,
+    {', '.join(columns)}
+FROM yearly_stats y
+{' '.join(joins)}"""
+
+
+SHARD_STATS_OUTPUT = _shard_stats_output()
+
+# all-years averages derived from the per-year sums: (column, shard sum column, digits)
+SHARD_AVERAGES = [
+    ('avg_citations', 'shard_sum_citations', 2),
+    ('avg_recent_citations', 'shard_sum_recent_citations', 2),
+    ('avg_field_citation_ratio', 'shard_sum_field_citation_ratio', 3),
+    ('avg_relative_citation_ratio', 'shard_sum_relative_citation_ratio', 3),
+    ('avg_altmetric_score', 'shard_sum_altmetric_score', 2),
+    ('avg_collaborating_institutions', 'shard_sum_collaborating_institutions', 2),
+    ('avg_collaborating_countries', 'shard_sum_collaborating_countries', 2),
+    ('avg_authors_per_publication', 'shard_sum_authors', 2),
+    ('avg_references_per_publication', 'shard_sum_references', 2)
+]
+
+# all-years leaderboards summed from the per-year shard_<column> lists: (column, key fields, count field, limit)
+SHARD_LEADERBOARDS = [
+    ('doc_type_counts', ('doc_type',), 'doc_count', None),
+    ('top_countries', ('country',), 'count', 20),
+    ('top_concepts', ('concept_text',), 'concept_count', 200),
+    ('top_mesh_terms', ('term',), 'term_count', 100),
+    ('sdg_categories', ('code', 'name'), 'sdg_count', 17),
+    ('top_collaborating_institutions', ('org',), 'count', 20),
+    ('top_journals', ('journal',), 'count', 20),
+    ('top_authors', ('author',), 'count', 20),
+    ('open_access_types', ('category',), 'count', 20),
+    ('top_funders', ('funder',), 'count', 20),
+    ('top_publishers', ('publisher',), 'count', 20)
+]
+
+
+def _items(value: Any) -> List[Dict[str, Any]]:
+    """Array-of-struct cell as a list of dicts (NULL arrays, whether None, NaN or NA, become empty lists)"""
+    if not isinstance(value, (list, tuple, np.ndarray)):
+        return []
+    return list(value)
+
+
+def _merge_counts(
+    arrays: Iterable[Any],
+    key_fields: Tuple[str, ...],
+    count_field: str,
+    limit: Optional[int] = None
+) -> Optional[List[Dict[str, Any]]]:
+    """Sum per-year {key..., count} arrays and rank them, NULL when there is nothing to rank"""
+    totals: Dict[Tuple, int] = {}
+    for array in arrays:
+        for item in _items(array):
+            key = tuple(item[f] for f in key_fields)
+            totals[key] = totals.get(key, 0) + int(item[count_field])
+    ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    if not ranked:
+        return None
+    return [{**dict(zip(key_fields, key)), count_field: count} for key, count in ranked]
 
 class PublicationAnalytics(DimensionsFilter):
+    # default get_basic_stats implementation, a key of STATS_IMPLEMENTATIONS
+    stats_implementation = 'grouping_sets'
+
+    def __init__(self, bq_client, byte_budgets=None, search_index=None, publication_store: Optional[PublicationStore] = None):
+        super().__init__(bq_client, byte_budgets, search_index)
+        # local column store answering listings and counts, if one is loaded
+        self.publication_store = publication_store
+
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """
         Analyze publication venues and patterns with improved NULL handling 
         and date range filtering.
         """
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH filtered_pubs AS (
             SELECT *
-            FROM {self.bq.datasets[dataset_name].full_path}
-            WHERE {self.build_where_clause(filters)} 
+            FROM {self.table_ref(dataset_name)}
+            WHERE {where_clause} 
           
         ),
         journal_metrics AS (
@@ -47,7 +251,7 @@ class PublicationAnalytics(DimensionsFilter):
         WHERE year IS NOT NULL 
         ORDER BY year DESC, publication_count DESC
         """
-        return self.execute_query(dataset_name, query)
+        return self.execute_query(dataset_name, query, params, analysis='publication_venues')
     
     def get_publications(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """
@@ -55,53 +259,263 @@ class PublicationAnalytics(DimensionsFilter):
         
         Args:
             dataset_name: Name of the dataset to query
-            filters: Dictionary containing filters including page and per_page
+            filters: Dictionary containing filters including page and per_page, or a cursor
         
         Returns:
-            DataFrame containing publication data and total count
+            DataFrame containing one page of publication data
+        """
+        return self.get_publications_page(dataset_name, filters)[0]
+
+    def get_publications_page(self, dataset_name: str, filters: Dict[str, Any]) -> Tuple[pd.DataFrame, Optional[str]]:
+        """
+        One page of publications, newest first (or by relevance when a search is
+        resolved by the search index), and the cursor of the next page (None on the
+        last page).
+
+        With a `cursor` (see bigquery.dimensions.pagination) the page starts right
+        after the row the cursor was issued for; otherwise `page` is turned into an
+        OFFSET, which is kept for page-number access. The total is not part of the
+        page query; use count_publications.
+
+        With a publication store loaded the page is served from it, honouring the
+        filter's `sort` as well (date_normal and citations_count).
         """
+        if self.publication_store is not None:
+            store_page = self._store_page(filters)
+            if store_page is not None:
+                return store_page
+
+        filters = dict(filters)
         page = filters.pop('page', 1)
         per_page = filters.pop('per_page', 10)
-        offset = (page - 1) * per_page
-        
+        cursor = filters.pop('cursor', None)
+
+        where_clause, params = self.build_where_clause(filters)
+        search_ids = self._search_ranking(params)
+        # one extra row tells whether there is a next page
+        params = params + [bigquery.ScalarQueryParameter('limit', 'INT64', per_page + 1)]
+        if cursor and search_ids is not None:
+            _, cursor_id = decode_cursor(cursor, filters)
+            if cursor_id not in search_ids:
+                raise InvalidCursor("Pagination cursor does not belong to this search")
+            where_clause += """
+                AND search_rank > @cursor_rank"""
+            params.append(bigquery.ScalarQueryParameter('cursor_rank', 'INT64', search_ids.index(cursor_id)))
+            offset_clause = ""
+        elif cursor:
+            cursor_date, cursor_id = decode_cursor(cursor, filters)
+            where_clause += """
+                AND (date_normal < @cursor_date OR (date_normal = @cursor_date AND id < @cursor_id))"""
+            params += [
+                bigquery.ScalarQueryParameter('cursor_date', 'DATE', cursor_date),
+                bigquery.ScalarQueryParameter('cursor_id', 'STRING', cursor_id)
+            ]
+            offset_clause = ""
+        else:
+            params.append(bigquery.ScalarQueryParameter('offset', 'INT64', (page - 1) * per_page))
+            offset_clause = "OFFSET @offset"
+
+        query = self._listing_query(dataset_name, where_clause, offset_clause, search_ids is not None)
+        result = self.execute_query(dataset_name, query, params, analysis='publications')
+        if len(result) <= per_page:
+            return result, None
+        result = result.iloc[:per_page]
+        last = result.iloc[-1]
+        return result, encode_cursor(filters, last['date_normal'], last['id'])
+
+    def _store_page(self, filters: Dict[str, Any]) -> Optional[Tuple[pd.DataFrame, Optional[str]]]:
+        """get_publications_page from the publication store, None when it cannot evaluate the filter"""
+        store = self.publication_store
+        filters = dict(filters)
+        page = filters.pop('page', 1)
+        per_page = filters.pop('per_page', 10)
+        cursor = filters.pop('cursor', None)
+
+        selection = self.select_rows(store, filters)
+        if selection is None:
+            return None
+        if filters.get('search_query'):
+            keys = store.relevance_key(store.row_numbers(self.search_ids(filters['search_query'])))
+        else:
+            keys = store.sort_keys(filters.get('sort'))
+
+        after = None
+        if cursor:
+            _, cursor_id = decode_cursor(cursor, filters)
+            after = store.row_of(cursor_id)
+            if after is None or after not in selection:
+                raise InvalidCursor("Pagination cursor does not belong to this filter")
+        offset = 0 if cursor else (page - 1) * per_page
+
+        # one extra row tells whether there is a next page
+        rows = store.top(np.asarray(selection.to_array(), dtype=np.int64), keys, after, offset, per_page + 1)
+        result = store.frame(rows[:per_page])
+        if len(rows) <= per_page:
+            return result, None
+        last = result.iloc[-1]
+        return result, encode_cursor(filters, last['date_normal'], last['id'])
+
+    def get_publication_block(self, dataset_name: str, filters: Dict[str, Any], offset: int, limit: int) -> pd.DataFrame:
+        """Rows [offset, offset + limit) of the publication listing, for block caching"""
+        where_clause, params = self.build_where_clause(listing_filter(filters))
+        params = params + [
+            bigquery.ScalarQueryParameter('limit', 'INT64', limit),
+            bigquery.ScalarQueryParameter('offset', 'INT64', offset)
+        ]
+        by_relevance = self._search_ranking(params) is not None
+        query = self._listing_query(dataset_name, where_clause, "OFFSET @offset", by_relevance)
+        return self.execute_query(dataset_name, query, params, analysis='publications')
+
+    @staticmethod
+    def _search_ranking(params: List[bigquery.ScalarQueryParameter]) -> Optional[List[str]]:
+        """Ids in relevance order when build_where_clause resolved the search locally"""
+        return next((list(p.values) for p in params if p.name == 'search_ids'), None)
+
+    def _listing_query(self, dataset_name: str, where_clause: str, offset_clause: str, by_relevance: bool = False) -> str:
+        ranking = """
+        JOIN UNNEST(@search_ids) AS search_id WITH OFFSET AS search_rank
+            ON id = search_id""" if by_relevance else ""
+        order = "search_rank" if by_relevance else "date_normal DESC, id DESC"
+        return f"""
+        SELECT 
+            id,
+            title.preferred as title,
+            date_normal,
+            document_type.classification as document_type,
+            COALESCE(citations_count, 0) as citations_count,
+            doi,
+            ARRAY(
+                SELECT AS STRUCT 
+                    STRUCT(
+                        first_name as first_name,
+                        last_name as last_name
+                    ) as author
+                FROM UNNEST(authors)
+            ) as authors
+        FROM {self.table_ref(dataset_name)}{ranking}
+        WHERE {where_clause}
+        ORDER BY {order}
+        LIMIT @limit
+        {offset_clause}
+        """
+
+    def count_publications(self, dataset_name: str, filters: Dict[str, Any]) -> int:
+        """
+        Number of publications matching the filters. Paging keys are ignored, so the
+        count query (and its cached result) is shared by every page of a listing.
+        """
+        if self.publication_store is not None:
+            selection = self.select_rows(self.publication_store, listing_filter(filters))
+            if selection is not None:
+                return len(selection)
+
+        where_clause, params = self.build_where_clause(listing_filter(filters))
+        query = f"""
+        SELECT COUNT(*) as total_count
+        FROM {self.table_ref(dataset_name)}
+        WHERE {where_clause}
+        """
+        result = self.execute_query(dataset_name, query, params, analysis='publications_count')
+        return int(result['total_count'].iloc[0]) if not result.empty else 0
+
+    def get_timeline(self, dataset_name: str, filters: Dict[str, Any], granularity: str = 'year') -> pd.DataFrame:
+        """
+        Publications per DATE_TRUNC bucket of date_normal ('month', 'quarter' or 'year'):
+        period (first day of the bucket), total, cited_by_count, avg_citation and types,
+        an array of {name, count} document types ranked by count. Every bucket comes from
+        one query; buckets without publications are absent.
+        """
+        if granularity not in TIMELINE_GRANULARITIES:
+            raise ValueError(f"Unknown timeline granularity '{granularity}'. Valid granularities are: {list(TIMELINE_GRANULARITIES)}")
+
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH filtered_pubs AS (
-            SELECT 
-                id,
-                title.preferred as title,
-                date_normal,
-                document_type.classification as document_type,
-                COALESCE(citations_count, 0) as citations_count,
-                doi,
-                ARRAY(
-                    SELECT AS STRUCT 
-                        STRUCT(
-                            first_name as first_name,
-                            last_name as last_name
-                        ) as author
-                    FROM UNNEST(authors)
-                ) as authors,
-                COUNT(*) OVER() as total_count
-            FROM {self.bq.datasets[dataset_name].full_path}
-            WHERE date_normal IS NOT NULL
-            {' AND ' + self.build_where_clause(filters) if filters else ''}
+            SELECT
+                DATE_TRUNC(DATE(date_normal), {TIMELINE_GRANULARITIES[granularity]}) as period,
+                document_type.classification as doc_type,
+                COALESCE(citations_count, 0) as citations_count
+            FROM {self.table_ref(dataset_name)}
+            WHERE {where_clause}
+        ),
+        period_totals AS (
+            SELECT
+                period,
+                COUNT(*) as total,
+                SUM(citations_count) as cited_by_count
+            FROM filtered_pubs
+            GROUP BY period
+        ),
+        period_types AS (
+            SELECT
+                period,
+                ARRAY_AGG(STRUCT(doc_type as name, doc_count as count) ORDER BY doc_count DESC, doc_type) as types
+            FROM (
+                SELECT period, doc_type, COUNT(*) as doc_count
+                FROM filtered_pubs
+                WHERE doc_type IS NOT NULL
+                GROUP BY period, doc_type
+            )
+            GROUP BY period
         )
-        
-        SELECT *
-        FROM filtered_pubs
-        ORDER BY date_normal DESC
-        LIMIT {per_page}
-        OFFSET {offset}
+        SELECT
+            t.period,
+            t.total,
+            t.cited_by_count,
+            ROUND(SAFE_DIVIDE(t.cited_by_count, t.total), 1) as avg_citation,
+            p.types
+        FROM period_totals t
+        LEFT JOIN period_types p USING (period)
+        ORDER BY t.period
         """
-        
-        return self.execute_query(dataset_name, query)
+        return self.execute_query(dataset_name, query, params, analysis='publication_timeline')
 
+    def get_basic_stats(
+        self,
+        dataset_name: str,
+        filters: Dict[str, Any],
+        implementation: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Per-year publication statistics plus an all-years row (year 9999).
 
+        `implementation` picks the query: 'grouping_sets' (the default, see
+        stats_implementation) or the original 'legacy' query, kept for verification.
+        Passing it explicitly always runs that query over the publications table.
 
+        Otherwise, when a `<dataset_name>_rollup` dataset is registered and the filters
+        only touch whole years, document types, fields and open access, the stats are
+        merged from the pre-aggregated rollup (see bigquery.dimensions.rollup) instead
+        of scanning the publications table, and filters with a date range are answered
+        from per-year shards of the stats_implementation query.
+        """
+        if implementation is not None and implementation not in STATS_IMPLEMENTATIONS:
+            raise ValueError(f"Unknown stats implementation '{implementation}'. Valid implementations are: {list(STATS_IMPLEMENTATIONS)}")
 
-    def get_basic_stats(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
-        query = f"""
-WITH filtered_pubs AS (
+        if implementation is None:
+            rollup_result = self._basic_stats_from_rollup(dataset_name, filters)
+            if rollup_result is not None:
+                return rollup_result
+
+            if self.can_shard_by_year(dataset_name, filters):
+                build_query = STATS_IMPLEMENTATIONS[self.stats_implementation]
+                yearly = self.execute_yearly_query(
+                    dataset_name,
+                    filters,
+                    lambda where_clause: build_query(self, dataset_name, where_clause, per_year_shards=True),
+                    analysis='publication_stats'
+                )
+                return self._merge_stats_years(yearly)
+
+        implementation = implementation or self.stats_implementation
+
+        where_clause, params = self.build_where_clause(filters)
+        query = STATS_IMPLEMENTATIONS[implementation](self, dataset_name, where_clause)
+        return self.execute_query(dataset_name, query, params, analysis='publication_stats')
+
+    def _stats_source(self, dataset_name: str, where_clause: str) -> str:
+        """Body of the filtered_pubs CTE shared by the stats queries"""
+        return f"""
     SELECT
         EXTRACT(YEAR FROM date_normal) as pub_year,
         document_type.classification as doc_type,
@@ -130,8 +544,137 @@ WITH filtered_pubs AS (
         source,
         title,
         publisher
-    FROM {self.bq.datasets[dataset_name].full_path}
-    WHERE {self.build_where_clause(filters)}
+    FROM {self.table_ref(dataset_name)}
+    WHERE {where_clause}"""
+
+    def _basic_stats_grouping_sets_query(self, dataset_name: str, where_clause: str, per_year_shards: bool = False) -> str:
+        """
+        Single-pass stats query: totals use GROUP BY ROLLUP(pub_year) and every
+        leaderboard is counted once with GROUPING SETS, the all-years grouping
+        becoming the 9999 row. With `per_year_shards` only the per-year groupings are
+        computed, together with the shard_* columns _merge_stats_years needs.
+        """
+        facet_ctes = []
+        facet_joins = []
+        facet_columns = []
+        if per_year_shards:
+            year_column = 'pub_year'
+            facet_grouping = 'pub_year, {items}'
+            totals_grouping = 'pub_year\n    HAVING pub_year IS NOT NULL'
+            shard_totals = GROUPING_SETS_SHARD_TOTALS
+            shard_total_columns = [column for column, _ in GROUPING_SETS_SHARD_COLUMNS]
+        else:
+            year_column = 'IF(GROUPING(pub_year) = 1, 9999, pub_year)'
+            facet_grouping = 'GROUPING SETS ((pub_year, {items}), ({items}))'
+            totals_grouping = 'ROLLUP (pub_year)\n    HAVING GROUPING(pub_year) = 1 OR pub_year IS NOT NULL'
+            shard_totals = ''
+            shard_total_columns = []
+
+        for column, source, items, where, count_name, fields, limit in GROUPING_SETS_FACETS:
+            item_select = ',\n            '.join(f"{expr} AS {alias}" for expr, alias in items)
+            item_names = ', '.join(alias for _, alias in items)
+            where_line = f"\n        WHERE {where}" if where else ""
+            limit_clause = f" LIMIT {limit}" if limit else ""
+            # the year's list, which _merge_stats_years sums into the all-years one
+            shard_list = f",\n        {_shard_list(column, fields, count_name)}" if per_year_shards else ""
+            facet_ctes.append(f"""
+{column}_counts AS (
+    SELECT
+        {year_column} AS year,
+        {item_names},
+        COUNT(*) AS {count_name}
+    FROM (
+        SELECT
+            p.pub_year,
+            {item_select}
+        FROM {source}{where_line}
+    )
+    GROUP BY {facet_grouping.format(items=item_names)}
+),
+
+{column}_stats AS (
+    SELECT
+        year,
+        ARRAY_AGG(STRUCT({fields}) ORDER BY {count_name} DESC{limit_clause}) AS {column}{shard_list}
+    FROM {column}_counts
+    GROUP BY year
+)""")
+            facet_joins.append(f"LEFT JOIN {column}_stats USING (year)")
+            facet_columns.append(f"{column}_stats.{column}")
+        if per_year_shards:
+            facet_columns.extend(f"totals.{column}" for column in shard_total_columns)
+            facet_columns.extend(f"{column}_stats.shard_{column}" for column, *_ in GROUPING_SETS_FACETS)
+
+        return f"""
+WITH filtered_pubs AS ({self._stats_source(dataset_name, where_clause)}),
+
+totals AS (
+    SELECT
+        {year_column} AS year,
+        COUNT(*) AS total_publications,
+        COUNTIF(doc_type = 'RESEARCH_ARTICLE') AS research_article_count,
+        COUNTIF(doc_type = 'REVIEW_ARTICLE') AS review_article_count,
+        COUNTIF(doc_type = 'RESEARCH_CHAPTER') AS research_chapter_count,
+        COUNTIF(doc_type = 'CONFERENCE_PAPER') AS conference_paper_count,
+        COUNTIF(doc_type = 'REFERENCE_WORK') AS reference_work_count,
+        COUNTIF(doc_type = 'EDITORIAL') AS editorial_count,
+        COUNTIF(doc_type = 'OTHER_JOURNAL_CONTENT') AS other_journal_count,
+        COUNTIF(doc_type = 'LETTER_TO_EDITOR') AS letter_to_editor_count,
+        COUNTIF(doc_type = 'OTHER_BOOK_CONTENT') AS book_count,
+        COUNTIF(doc_type = 'BOOK_REVIEW') AS book_review_count,
+        COUNTIF(doc_type = 'OTHER_CONFERENCE_CONTENT') AS other_conference_count,
+
+        ROUND(AVG(citations_count), 2) AS avg_citations,
+        ROUND(AVG(recent_citations), 2) AS avg_recent_citations,
+        ROUND(AVG(field_citation_ratio), 3) AS avg_field_citation_ratio,
+        ROUND(AVG(relative_citation_ratio), 3) AS avg_relative_citation_ratio,
+        COUNTIF(field_citation_ratio > 1) AS above_field_average_count,
+        ROUND(SAFE_DIVIDE(COUNTIF(field_citation_ratio > 1), COUNT(*)), 3) AS above_field_average_ratio,
+        ROUND(AVG(altmetric_score), 2) AS avg_altmetric_score,
+        ROUND(AVG(collaboration_count), 2) AS avg_collaborating_institutions,
+        ROUND(AVG(international_collaboration_count), 2) AS avg_collaborating_countries,
+
+        ROUND(AVG(author_count), 2) AS avg_authors_per_publication,
+        ROUND(AVG(citation_references_count), 2) AS avg_references_per_publication,
+        SUM(clinical_trials_count) AS total_clinical_trials,
+        SUM(patent_count) AS total_patents,
+        SUM(funding_count) AS total_funding_instances,
+        SUM(repository_count) AS total_repository_deposits,
+        COUNTIF(ARRAY_LENGTH(open_access_categories) > 0) AS open_access_count,
+        ROUND(SAFE_DIVIDE(COUNTIF(ARRAY_LENGTH(open_access_categories) > 0), COUNT(*)), 3) AS open_access_ratio,
+        COUNT(DISTINCT FORMAT_DATE('%m', date_normal)) AS months_with_publications{shard_totals}
+    FROM filtered_pubs
+    GROUP BY {totals_grouping}
+),
+{','.join(facet_ctes)},
+
+unique_countries AS (
+    SELECT year, COUNT(*) AS unique_countries_count
+    FROM top_countries_counts
+    GROUP BY year
+)
+
+SELECT
+    totals.* EXCEPT ({', '.join(['months_with_publications'] + shard_total_columns)}),
+    COALESCE(unique_countries.unique_countries_count, 0) AS unique_countries_count,
+    totals.months_with_publications,
+    {', '.join(facet_columns)}
+FROM totals
+LEFT JOIN unique_countries USING (year)
+{' '.join(facet_joins)}
+ORDER BY year = 9999, year DESC
+"""
+
+    def _basic_stats_query(self, dataset_name: str, where_clause: str, per_year_shards: bool = False) -> str:
+        """
+        The stats query. With `per_year_shards` only the per-year rows are returned,
+        together with the shard_* columns _merge_stats_years needs to derive the
+        all-years row locally.
+        """
+        output = SHARD_STATS_OUTPUT if per_year_shards else ALL_STATS_OUTPUT
+        return f"""
+WITH filtered_pubs AS (
+{self._stats_source(dataset_name, where_clause)}
 ),
 
 doc_type_stats AS (
@@ -547,9 +1090,77 @@ all_years_stats AS (
         ) AS top_publishers
     FROM filtered_pubs f
 )
+{output}
+        """
 
-SELECT * FROM yearly_stats
-UNION ALL
-SELECT * FROM all_years_stats
+    def _basic_stats_from_rollup(self, dataset_name: str, filters: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        rollup_dataset = f"{dataset_name}_rollup"
+        if rollup_dataset not in self.bq.datasets or current_batch() is not None:
+            return None
+        rollup_where = build_rollup_where_clause(filters)
+        if rollup_where is None:
+            return None
+
+        where_clause, params = rollup_where
+        query = build_rollup_stats_query(self.bq.datasets[rollup_dataset].full_path, where_clause)
+        try:
+            return self.execute_query(rollup_dataset, query, params, analysis='publication_stats')
+        except Exception as e:
+            print(f"Rollup query failed, falling back to {dataset_name}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _merge_stats_years(yearly: pd.DataFrame) -> pd.DataFrame:
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        Per-year stats shards plus the all-years (9999) row derived from them. Counts,
+        averages, ratios, months, unique countries and the doc-type, country, SDG and
+        open access leaderboards are exact. The other leaderboards are summed from the
+        per-year shard lists, capped at SHARD_TOP_K items, so an item that ranks below
+        the cut in some years is undercounted by at most its count in those years.
+        """
+        shard_columns = [c for c in yearly.columns if c.startswith('shard_')]
+        per_year = yearly.drop(columns=shard_columns).sort_values('year', ascending=False, ignore_index=True)
+
+        total = int(yearly['total_publications'].sum()) if len(yearly) else 0
+
+        def ratio(numerator: Any, digits: int) -> Optional[float]:
+            return round(float(numerator) / total, digits) if total else None
+
+        def summed(column: str) -> Optional[int]:
+            return int(yearly[column].sum()) if len(yearly) else None
+
+        countries = _merge_counts(yearly['shard_top_countries'], ('country',), 'count')
+        months = {int(m) for array in yearly.get('shard_months', []) for m in _items(array)}
+
+        all_years = {column: None for column in per_year.columns}
+        all_years.update({
+            'year': 9999,
+            'total_publications': total,
+            'above_field_average_count': summed('above_field_average_count') or 0,
+            'open_access_count': summed('open_access_count') or 0,
+            'unique_countries_count': len(countries or []),
+            'months_with_publications': len(months)
+        })
+        for _, column in DOC_TYPE_COLUMNS:
+            all_years[column] = summed(column) or 0
+        for column in ('total_clinical_trials', 'total_patents', 'total_funding_instances', 'total_repository_deposits'):
+            all_years[column] = summed(column)
+        for column, sum_column, digits in SHARD_AVERAGES:
+            all_years[column] = ratio(yearly[sum_column].sum(), digits) if len(yearly) else None
+        all_years['above_field_average_ratio'] = ratio(all_years['above_field_average_count'], 3)
+        all_years['open_access_ratio'] = ratio(all_years['open_access_count'], 3)
+        for column, key_fields, count_field, limit in SHARD_LEADERBOARDS:
+            all_years[column] = _merge_counts(yearly[f"shard_{column}"], key_fields, count_field, limit)
+
+        result = pd.concat([per_year, pd.DataFrame([all_years], columns=per_year.columns)], ignore_index=True)
+        for column in per_year.columns:
+            if pd.api.types.is_integer_dtype(per_year[column].dtype):
+                result[column] = result[column].astype('Int64')
+        return result
+
+
+# get_basic_stats implementations: name -> query builder(self, dataset_name, where_clause)
+STATS_IMPLEMENTATIONS = {
+    'grouping_sets': PublicationAnalytics._basic_stats_grouping_sets_query,
+    'legacy': PublicationAnalytics._basic_stats_query
+}
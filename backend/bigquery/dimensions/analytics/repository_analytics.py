@@ -5,6 +5,7 @@ from ..DimensionsFilter import DimensionsFilter
 class RepositoryAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze data repository usage patterns"""
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH repository_metrics AS (
             SELECT 
@@ -16,13 +17,13 @@ class RepositoryAnalytics(DimensionsFilter):
                 COUNT(DISTINCT categories.for_2020_v2022.first_level.full[SAFE_OFFSET(0)].name) as research_fields,
                 STRING_AGG(DISTINCT categories.for_2020_v2022.first_level.full[SAFE_OFFSET(0)].name, ', ') as field_names,
                 COUNT(DISTINCT ARRAY_TO_STRING(research_org_countries, ',')) as contributing_countries
-            FROM `{self.bq.datasets[dataset_name].full_path}`,
+            FROM `{self.table_ref(dataset_name)}`,
             UNNEST(authors) as authors
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             AND ARRAY_LENGTH(repository_dois) > 0
             GROUP BY year, repository_dois[OFFSET(0)]
             ORDER BY year DESC, dataset_count DESC
         )
         SELECT * FROM repository_metrics
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        return self.execute_query(dataset_name, query, params, analysis='data_repositories')
\ No newline at end of file
@@ -5,6 +5,7 @@ from ..DimensionsFilter import DimensionsFilter
 class ResearcherAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze researcher productivity and impact"""
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH researcher_metrics AS (
             SELECT 
@@ -22,14 +23,14 @@ class ResearcherAnalytics(DimensionsFilter):
                 COUNT(DISTINCT funding_details.grant_id) as associated_grants,
                 COUNTIF(ARRAY_LENGTH(open_access_categories) > 0) as open_access_papers,
                 COUNTIF(ARRAY_LENGTH(repository_dois) > 0) as papers_with_data
-            FROM `{self.bq.datasets[dataset_name].full_path}`,
+            FROM `{self.table_ref(dataset_name)}`,
             UNNEST(authors) as authors,
             UNNEST(funding_details) as funding_details
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             GROUP BY authors.researcher_id, authors.first_name, authors.last_name, year
             QUALIFY ROW_NUMBER() OVER(PARTITION BY year ORDER BY publication_count DESC) <= 10
             ORDER BY year DESC, publication_count DESC
         )
         SELECT * FROM researcher_metrics
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        return self.execute_query(dataset_name, query, params, analysis='researcher_productivity')
\ No newline at end of file
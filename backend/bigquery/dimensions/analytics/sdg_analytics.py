@@ -5,6 +5,7 @@ from ..DimensionsFilter import DimensionsFilter
 class SDGAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze SDG impact and associations"""
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH sdg_metrics AS (
             SELECT 
@@ -19,13 +20,13 @@ class SDGAnalytics(DimensionsFilter):
                 COUNTIF(ARRAY_LENGTH(p.open_access_categories) > 0) as open_access_papers,
                 COUNTIF(ARRAY_LENGTH(p.repository_dois) > 0) as papers_with_data,
                 COUNT(DISTINCT ARRAY_TO_STRING(p.research_org_countries, ',')) as collaborating_countries
-            FROM `{self.bq.datasets[dataset_name].full_path}` p,
+            FROM `{self.table_ref(dataset_name)}` p,
             UNNEST(categories.sdg_v2021.full) as sdg,
             UNNEST(authors) as a
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             GROUP BY p.year, sdg.name, sdg.code
             ORDER BY p.year DESC, publication_count DESC
         )
         SELECT * FROM sdg_metrics
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        return self.execute_query(dataset_name, query, params, analysis='sdg_impact')
\ No newline at end of file
@@ -0,0 +1,14 @@
+from typing import Dict, Any
+import pandas as pd
+from ..DimensionsFilter import DimensionsFilter
+from ..sketches import build_sketch_query
+
+class SketchAnalytics(DimensionsFilter):
+    def get_year_sketches(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
+        """Per-year HyperLogLog registers and top-k lists for every sketch facet"""
+        return self.execute_yearly_query(
+            dataset_name,
+            filters,
+            lambda where_clause: build_sketch_query(self.table_ref(dataset_name), where_clause),
+            analysis='sketches'
+        )
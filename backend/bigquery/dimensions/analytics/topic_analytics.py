@@ -1,13 +1,26 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import pandas as pd
 from ..DimensionsFilter import DimensionsFilter
 class TopicAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze research topics and themes, with aggregated data for all years"""
-        query = f"""
+        yearly = self.execute_yearly_query(
+            dataset_name,
+            filters,
+            lambda where_clause: self._topic_summary_query(dataset_name, where_clause),
+            analysis='research_topics'
+        )
+        return self._merge_topic_years(yearly)
+
+    def _topic_summary_query(self, dataset_name: str, where_clause: str) -> str:
+        """
+        Per (year, concept) summary; growth and the all-years rows are derived locally.
+        The year is taken from date_normal, as the year filter and shards are.
+        """
+        return f"""
         WITH base_metrics AS (
             SELECT 
-                year,
+                EXTRACT(YEAR FROM date_normal) as year,
                 concepts.concept,
                 concepts.relevance,
                 id,
@@ -16,87 +29,61 @@ class TopicAnalytics(DimensionsFilter):
                 journal.title as journal_title,
                 categories.for_2020_v2022.first_level.full[SAFE_OFFSET(0)].name as field_name,
                 research_org_countries
-            FROM `{self.bq.datasets[dataset_name].full_path}`,
+            FROM `{self.table_ref(dataset_name)}`,
             UNNEST(concepts) as concepts
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             AND concepts.relevance > 0.6
-        ),
-        topic_summary AS (
-            SELECT 
-                year,
-                concept,
-                COUNT(*) as publication_count,
-                AVG(citations_count) as avg_citations,
-                AVG(field_citation_ratio) as field_impact,
-                COUNT(DISTINCT field_name) as research_fields,
-                COUNT(DISTINCT ARRAY_TO_STRING(research_org_countries, ',')) as collaborating_countries,
-                STRING_AGG(DISTINCT journal_title ORDER BY journal_title LIMIT 5) as top_journals
-            FROM base_metrics
-            GROUP BY year, concept
-            HAVING publication_count >= 5
-        ),
-        topic_trends AS (
-            SELECT 
-                year,  -- Keep year as an integer
-                concept,
-                publication_count,
-                avg_citations,
-                field_impact,
-                research_fields,
-                collaborating_countries,
-                top_journals,
-                LAG(publication_count) OVER(PARTITION BY concept ORDER BY year) as prev_count,
-                LAG(publication_count, 2) OVER(PARTITION BY concept ORDER BY year) as prev_prev_count
-            FROM topic_summary
-        ),
-        aggregated_topics AS (
-            SELECT 
-                9999 as year,  -- Use integer 9999 for aggregated data
-                concept,
-                SUM(publication_count) as publication_count,
-                AVG(avg_citations) as avg_citations,
-                AVG(field_impact) as field_impact,
-                MAX(research_fields) as research_fields,
-                MAX(collaborating_countries) as collaborating_countries,
-                STRING_AGG(DISTINCT top_journals ORDER BY top_journals LIMIT 5) as top_journals,
-                NULL as yoy_growth,
-                NULL as two_year_growth
-            FROM topic_trends
-            GROUP BY concept
         )
         SELECT 
             year,
             concept,
-            publication_count,
-            avg_citations,
-            field_impact,
-            research_fields,
-            collaborating_countries,
-            top_journals,
-            CASE 
-                WHEN prev_count > 0 THEN (publication_count - prev_count) / prev_count
-                ELSE 0 
-            END as yoy_growth,
-            CASE 
-                WHEN prev_prev_count > 0 
-                THEN (publication_count - prev_prev_count) / prev_prev_count 
-                ELSE 0
-            END as two_year_growth
-        FROM topic_trends
-        UNION ALL
-        SELECT 
-            year,
-            concept,
-            publication_count,
-            avg_citations,
-            field_impact,
-            research_fields,
-            collaborating_countries,
-            top_journals,
-            yoy_growth,
-            two_year_growth
-        FROM aggregated_topics
-        ORDER BY year DESC, publication_count DESC
-        LIMIT 1000
+            COUNT(*) as publication_count,
+            AVG(citations_count) as avg_citations,
+            AVG(field_citation_ratio) as field_impact,
+            COUNT(DISTINCT field_name) as research_fields,
+            COUNT(DISTINCT ARRAY_TO_STRING(research_org_countries, ',')) as collaborating_countries,
+            STRING_AGG(DISTINCT journal_title ORDER BY journal_title LIMIT 5) as top_journals
+        FROM base_metrics
+        GROUP BY year, concept
+        HAVING publication_count >= 5
+        """
+
+    @staticmethod
+    def _merge_topic_years(yearly: pd.DataFrame, limit: int = 1000) -> pd.DataFrame:
+        """
+        Add year-over-year growth per concept and the all-years (9999) rows, then keep
+        the first `limit` rows ordered by year and publication count.
         """
-        return self.execute_query(dataset_name, query)
+        columns = [
+            'year', 'concept', 'publication_count', 'avg_citations', 'field_impact', 'research_fields',
+            'collaborating_countries', 'top_journals', 'yoy_growth', 'two_year_growth'
+        ]
+        if yearly.empty:
+            return pd.DataFrame(columns=columns)
+
+        trends = yearly.sort_values(['concept', 'year'], ignore_index=True)
+        counts = trends['publication_count'].astype(float)
+        by_concept = counts.groupby(trends['concept'], sort=False)
+        for column, periods in (('yoy_growth', 1), ('two_year_growth', 2)):
+            previous = by_concept.shift(periods)
+            trends[column] = ((counts - previous) / previous).where(previous > 0, 0.0)
+
+        def top_journals(values: pd.Series) -> Optional[str]:
+            journals = sorted(set(values.dropna()))[:5]
+            return ','.join(journals) if journals else None
+
+        aggregated = trends.groupby('concept', sort=False).agg(
+            publication_count=('publication_count', 'sum'),
+            avg_citations=('avg_citations', 'mean'),
+            field_impact=('field_impact', 'mean'),
+            research_fields=('research_fields', 'max'),
+            collaborating_countries=('collaborating_countries', 'max'),
+            top_journals=('top_journals', top_journals)
+        ).reset_index()
+        aggregated.insert(0, 'year', 9999)
+        aggregated['yoy_growth'] = None
+        aggregated['two_year_growth'] = None
+
+        result = pd.concat([trends[columns], aggregated[columns]], ignore_index=True)
+        result = result.sort_values(['year', 'publication_count'], ascending=False, ignore_index=True)
+        return result.head(limit)
@@ -5,6 +5,7 @@ from ..DimensionsFilter import DimensionsFilter
 class TrendAnalytics(DimensionsFilter):
     def analyze(self, dataset_name: str, filters: Dict[str, Any]) -> pd.DataFrame:
         """Analyze research trends and patterns over time"""
+        where_clause, params = self.build_where_clause(filters)
         query = f"""
         WITH yearly_field_metrics AS (
             SELECT 
@@ -27,11 +28,11 @@ class TrendAnalytics(DimensionsFilter):
                         ELSE NULL 
                     END, 
                     ', ' LIMIT 5) as top_concepts
-            FROM `{self.bq.datasets[dataset_name].full_path}` p,
+            FROM `{self.table_ref(dataset_name)}` p,
             UNNEST(categories.for_2020_v2022.first_level.full) as field,
             UNNEST(authors) as a,
             UNNEST(funding_details) as f
-            WHERE {self.build_where_clause(filters)}
+            WHERE {where_clause}
             GROUP BY p.year, field.name
         ),
         trend_analysis AS (
@@ -62,4 +63,4 @@ class TrendAnalytics(DimensionsFilter):
         FROM trend_analysis
         ORDER BY year DESC, publication_count DESC
         """
-        return self.execute_query(dataset_name, query)
\ No newline at end of file
+        return self.execute_query(dataset_name, query, params, analysis='research_trends')
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Shared-scan execution of several analyses.
+
+Every analysis in a batch runs in its own thread as usual, but while a batch is active
+DimensionsFilter.table_ref points at a temp table and execute_query hands its query to
+the BatchScan instead of running it. Once every analysis has handed over its query (or
+finished without one), the batch runs a single multi-statement script: one statement
+materializes the filtered publications, restricted to the columns the captured queries
+reference, and one statement per analysis reads from that temp table. Each analysis
+then receives its own result and finishes its local post-processing.
+"""
+import threading
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+
+from ..bq import QueryParameter
+
+BATCH_TABLE = '_batch_filtered_publications'
+
+_current_batch: ContextVar[Optional[Tuple['BatchScan', str]]] = ContextVar('dimensions_batch', default=None)
+
+
+def current_batch() -> Optional[Tuple['BatchScan', str]]:
+    """(batch, analysis name) when the calling thread runs an analysis inside a batch"""
+    return _current_batch.get()
+
+
+def referenced_columns(queries: Iterable[str], table_columns: Iterable[str]) -> List[str]:
+    """Top-level table columns named anywhere in the queries (a superset of what they read)"""
+    table_columns = list(table_columns)
+    available = {c.lower(): c for c in table_columns}
+    names: Set[str] = set()
+    for query in queries:
+        for column in sqlglot.parse_one(query, read='bigquery').find_all(exp.Column):
+            for part in column.parts:
+                if part.name.lower() in available:
+                    names.add(available[part.name.lower()])
+    return [c for c in table_columns if c in names]
+
+
+def _merge_params(param_lists: Iterable[List[QueryParameter]]) -> List[QueryParameter]:
+    """Script parameters are shared by every statement, so equal names must carry equal values"""
+    merged: Dict[str, QueryParameter] = {}
+    for params in param_lists:
+        for param in params or []:
+            existing = merged.get(param.name)
+            if existing is not None and existing.to_api_repr() != param.to_api_repr():
+                raise ValueError(f"Conflicting values for query parameter '{param.name}' in batch")
+            merged[param.name] = param
+    return list(merged.values())
+
+
+class BatchScan:
+    """Collects one query per analysis and runs them all against a single filtered scan"""
+
+    def __init__(
+        self,
+        bq,
+        dataset_name: str,
+        analysis_names: Iterable[str],
+        where_clause: str,
+        params: List[QueryParameter],
+        maximum_bytes_billed: Optional[int] = None
+    ):
+        self.bq = bq
+        self.dataset_name = dataset_name
+        self.where_clause = where_clause
+        self.params = params
+        self.maximum_bytes_billed = maximum_bytes_billed
+
+        self.queries: Dict[str, Tuple[str, List[QueryParameter]]] = {}
+        self.futures: Dict[str, Future] = {}
+        self._waiting = set(analysis_names)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def activate(self, analysis_name: str):
+        """Mark the calling thread as running `analysis_name` in this batch"""
+        return _current_batch.set((self, analysis_name))
+
+    @staticmethod
+    def deactivate(token) -> None:
+        _current_batch.reset(token)
+
+    def submit(self, analysis_name: str, query: str, params: Optional[List[QueryParameter]]) -> pd.DataFrame:
+        """Hand over an analysis query and block until the batch has produced its result"""
+        future: Future = Future()
+        with self._lock:
+            if analysis_name in self.queries:
+                raise RuntimeError(f"Analysis '{analysis_name}' ran more than one query in a batch")
+            self.queries[analysis_name] = (query, params or [])
+            self.futures[analysis_name] = future
+            self._waiting.discard(analysis_name)
+            ready = self._take_ready()
+        if ready:
+            self._run()
+        return future.result()
+
+    def finish(self, analysis_name: str) -> None:
+        """Called when an analysis returns or fails, whether or not it submitted a query"""
+        with self._lock:
+            self._waiting.discard(analysis_name)
+            ready = self._take_ready()
+        if ready:
+            self._run()
+
+    def _take_ready(self) -> bool:
+        if self._started or self._waiting or not self.queries:
+            return False
+        self._started = True
+        return True
+
+    def _materialize_statement(self) -> str:
+        dataset = self.bq.datasets[self.dataset_name]
+        queries = [query for query, _ in self.queries.values()]
+        columns = referenced_columns(queries, self.bq.table_columns(self.dataset_name))
+        projection = ', '.join(f"`{c}`" for c in columns) if columns else '*'
+        return (
+            f"CREATE TEMP TABLE {BATCH_TABLE} AS\n"
+            f"SELECT {projection}\n"
+            f"FROM `{dataset.full_path}`\n"
+            f"WHERE {self.where_clause}"
+        )
+
+    def _run(self) -> None:
+        names = list(self.queries)
+        try:
+            statements = [self._materialize_statement()] + [self.queries[name][0] for name in names]
+            params = _merge_params([self.params] + [self.queries[name][1] for name in names])
+            frames = self.bq.query_script(
+                self.dataset_name,
+                statements,
+                params=params,
+                maximum_bytes_billed=self.maximum_bytes_billed
+            )
+            for name, frame in zip(names, frames[1:]):
+                self.futures[name].set_result(frame)
+        except Exception as e:
+            for name in names:
+                if not self.futures[name].done():
+                    self.futures[name].set_exception(e)
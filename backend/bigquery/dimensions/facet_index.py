@@ -0,0 +1,204 @@
+"""
+In-memory facet index for the filter sidebar counts.
+
+Publications are numbered 0..n-1 in the order they were loaded and every facet value
+keeps a compressed (roaring) bitmap of the rows holding it. A filter is evaluated into
+one bitmap of matching rows with unions, intersections and differences of those
+bitmaps (see DimensionsFilter.select_rows for how its predicates map onto them),
+and the count of every facet value is the popcount of its intersection with that
+selection, so the whole sidebar is answered without touching BigQuery.
+
+Facets, named after the sidebar sections:
+- document_type: document_type.classification
+- field: first-level FoR 2020 category, matched case-insensitively like `fields`
+- access_type: openAccess / subscription, as the `accessType` filter decides them
+- funder: funder_orgs
+- publisher: publisher.name
+- year: publication year
+
+research_org and journal_list are indexed the same way but only used for filtering.
+Dates and citation counts are kept as plain arrays for range filters.
+"""
+import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from pyroaring import BitMap, FrozenBitMap
+
+FACETS = ('document_type', 'field', 'access_type', 'funder', 'publisher', 'year')
+FILTER_DIMENSIONS = ('research_org', 'journal_list')
+FLAGS = ('open_access', 'has_doi', 'preprint')
+
+
+def build_facet_query(table_ref: str) -> str:
+    """One row per publication with every column the index is built from"""
+    return f"""
+    SELECT
+        id,
+        date_normal,
+        citations_count,
+        document_type.classification AS document_type,
+        ARRAY(
+            SELECT DISTINCT f.name
+            FROM UNNEST(categories.for_2020_v2022.first_level.full) f
+            WHERE f.name IS NOT NULL
+        ) AS fields,
+        funder_orgs,
+        research_orgs,
+        journal_lists,
+        publisher.name AS publisher,
+        ARRAY_LENGTH(COALESCE(open_access_categories, [])) > 0 AS open_access_v1,
+        ARRAY_LENGTH(COALESCE(open_access_categories_v2, [])) > 0 AS open_access_v2,
+        doi IS NOT NULL AS has_doi,
+        (COALESCE(ARRAY_LENGTH(repository_dois), 0) > 0 OR arxiv_id IS NOT NULL) AS preprint
+    FROM `{table_ref}`
+    WHERE date_normal IS NOT NULL
+    """
+
+
+def _frozen(rows: np.ndarray) -> FrozenBitMap:
+    bitmap = BitMap(rows)
+    bitmap.run_optimize()
+    return FrozenBitMap(bitmap)
+
+
+def _rows(mask: np.ndarray) -> FrozenBitMap:
+    return _frozen(np.flatnonzero(mask).astype(np.uint32))
+
+
+def _value_rows(values: pd.Series) -> Dict[Any, FrozenBitMap]:
+    """Bitmap of the rows holding each value of a scalar or list column"""
+    values = values.reset_index(drop=True)
+    if values.dtype == object:
+        values = values.explode()
+    values = values.dropna()
+    if values.empty:
+        return {}
+    codes, uniques = pd.factorize(values, sort=True)
+    rows = values.index.to_numpy(dtype=np.uint32)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {
+        (value.item() if isinstance(value, np.generic) else value): _frozen(rows[order[start:end]])
+        for value, start, end in zip(uniques, bounds[:-1], bounds[1:])
+    }
+
+
+class FacetIndex:
+    def __init__(
+        self,
+        ids: np.ndarray,
+        days: np.ndarray,
+        citations: np.ndarray,
+        dimensions: Dict[str, Dict[Any, FrozenBitMap]],
+        flags: Dict[str, FrozenBitMap],
+        labels: Dict[str, Dict[Any, str]]
+    ):
+        self.ids = ids
+        self.days = days
+        self.citations = citations
+        self.dimensions = dimensions
+        self.flags = flags
+        self.labels = labels
+        self.num_rows = len(ids)
+        self.all_rows = FrozenBitMap(range(self.num_rows))
+        self.built_at = datetime.datetime.utcnow()
+        self._row_of_id = {publication_id: row for row, publication_id in enumerate(ids)}
+        self._present = {name: FrozenBitMap.union(FrozenBitMap(), *values.values()) for name, values in dimensions.items()}
+
+    @classmethod
+    def build(cls, publications: pd.DataFrame) -> 'FacetIndex':
+        """Index a frame shaped like build_facet_query's result"""
+        publications = publications.reset_index(drop=True)
+        dates = pd.to_datetime(publications['date_normal'])
+        open_access_v1 = publications['open_access_v1'].fillna(False).to_numpy(dtype=bool)
+
+        fields = publications['fields'].explode().dropna()
+        field_labels = dict(zip(fields.str.lower(), fields))
+
+        dimensions = {
+            'document_type': _value_rows(publications['document_type']),
+            'field': _value_rows(publications['fields'].map(
+                lambda names: [name.lower() for name in names] if names is not None else None
+            )),
+            'access_type': {'openAccess': _rows(open_access_v1), 'subscription': _rows(~open_access_v1)},
+            'funder': _value_rows(publications['funder_orgs']),
+            'publisher': _value_rows(publications['publisher']),
+            'year': _value_rows(dates.dt.year.astype('Int64')),
+            'research_org': _value_rows(publications['research_orgs']),
+            'journal_list': _value_rows(publications['journal_lists'])
+        }
+        flags = {
+            'open_access': _rows(open_access_v1 | publications['open_access_v2'].fillna(False).to_numpy(dtype=bool)),
+            'has_doi': _rows(publications['has_doi'].fillna(False).to_numpy(dtype=bool)),
+            'preprint': _rows(publications['preprint'].fillna(False).to_numpy(dtype=bool))
+        }
+        return cls(
+            ids=publications['id'].astype(str).to_numpy(dtype=object),
+            days=dates.to_numpy(dtype='datetime64[D]').astype(np.int64),
+            citations=pd.to_numeric(publications['citations_count']).to_numpy(dtype=np.float64, na_value=np.nan),
+            dimensions=dimensions,
+            flags=flags,
+            labels={'field': field_labels}
+        )
+
+    def any_of(self, dimension: str, values: Iterable[Any]) -> FrozenBitMap:
+        """Rows holding at least one of the values"""
+        index = self.dimensions[dimension]
+        return FrozenBitMap.union(FrozenBitMap(), *(index[value] for value in values if value in index))
+
+    def present(self, dimension: str) -> FrozenBitMap:
+        """Rows holding any value at all, which is what SQL `NOT IN` keeps"""
+        return self._present[dimension]
+
+    def flag(self, name: str) -> FrozenBitMap:
+        return self.flags[name]
+
+    def date_range(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> FrozenBitMap:
+        mask = np.ones(self.num_rows, dtype=bool)
+        if date_from:
+            mask &= self.days >= np.datetime64(date_from, 'D').astype(np.int64)
+        if date_to:
+            mask &= self.days <= np.datetime64(date_to, 'D').astype(np.int64)
+        return _rows(mask)
+
+    def citation_range(self, minimum: Optional[float] = None, maximum: Optional[float] = None) -> FrozenBitMap:
+        mask = np.ones(self.num_rows, dtype=bool)
+        if minimum is not None:
+            mask &= np.nan_to_num(self.citations, nan=0.0) >= minimum
+        if maximum is not None:
+            # NaN compares false, like NULL <= max
+            mask &= self.citations <= maximum
+        return _rows(mask)
+
+    def rows_for_ids(self, ids: Iterable[str]) -> FrozenBitMap:
+        """Rows of these publication ids; ids loaded after the index was built are skipped"""
+        rows = [self._row_of_id[publication_id] for publication_id in ids if publication_id in self._row_of_id]
+        return FrozenBitMap(rows)
+
+    def counts(self, selection: BitMap, dimension: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Non-zero counts of a dimension's values within the selection, largest first (years in order)"""
+        labels = self.labels.get(dimension, {})
+        counts = [
+            (value, selection.intersection_cardinality(rows))
+            for value, rows in self.dimensions[dimension].items()
+        ]
+        if dimension == 'year':
+            counts = sorted(item for item in counts if item[1])
+        else:
+            counts = sorted((item for item in counts if item[1]), key=lambda item: (-item[1], str(item[0])))
+        if limit is not None:
+            counts = counts[:limit]
+        return [{'value': labels.get(value, value), 'count': count} for value, count in counts]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rows': self.num_rows,
+            'built_at': self.built_at.isoformat(),
+            'values': {name: len(values) for name, values in self.dimensions.items()},
+            'bitmap_bytes': sum(
+                len(rows.serialize())
+                for values in self.dimensions.values() for rows in values.values()
+            )
+        }
@@ -0,0 +1,210 @@
+"""
+Keyset pagination for publication listings.
+
+Listings are ordered by (date_normal DESC, id DESC). Instead of an OFFSET, the next
+page is requested with an opaque cursor holding the sort key of the last row served,
+so every page is a top-N over the rows after that key rather than a re-sort of
+everything before it. The cursor also carries the hash of the filter it was issued
+for and is rejected when replayed against a different filter.
+
+PublicationBlockCache sits in front of the page queries. Listings are read in blocks
+of BLOCK_SIZE rows, one job per block, and pages are sliced out of the cached blocks;
+when a page comes within PREFETCH_ROWS of the end of its block, the next block is
+fetched in the background so sequential browsing never waits on BigQuery.
+"""
+import base64
+import datetime
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.canonical_filter import filter_hash
+
+# keys that select a page rather than the publications listed
+PAGING_KEYS = ('page', 'per_page', 'cursor')
+
+BLOCK_SIZE = 500
+PREFETCH_ROWS = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that is malformed or was issued for another filter"""
+
+
+def listing_filter(filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in filters.items() if k not in PAGING_KEYS}
+
+
+def encode_cursor(filters: Dict[str, Any], date_normal: Any, publication_id: str) -> str:
+    """Cursor pointing just past the row with this (date_normal, id)"""
+    if hasattr(date_normal, 'strftime'):
+        date_normal = date_normal.strftime('%Y-%m-%d')
+    payload = {'d': str(date_normal)[:10], 'i': publication_id, 'f': filter_hash(listing_filter(filters))}
+    encoded = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(encoded).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, filters: Dict[str, Any]) -> Tuple[str, str]:
+    """(date_normal, id) of the last row served before this cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        date_normal, publication_id, hashed = payload['d'], payload['i'], payload['f']
+        datetime.date.fromisoformat(date_normal)
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise InvalidCursor("Malformed pagination cursor")
+    if not isinstance(publication_id, str) or hashed != filter_hash(listing_filter(filters)):
+        raise InvalidCursor("Pagination cursor does not belong to this filter")
+    return date_normal, publication_id
+
+
+class PublicationBlockCache:
+    """
+    Serves listing pages from cached blocks of rows.
+
+    `fetch_block(dataset_name, filters, offset, limit)` returns rows [offset, offset +
+    limit) of the listing and `fetch_page(dataset_name, filters)` answers a page on its
+    own (page, cursor) with the next cursor; it is used for cursors that point outside
+    every cached block.
+    """
+
+    def __init__(
+        self,
+        fetch_block: Callable[[str, Dict[str, Any], int, int], pd.DataFrame],
+        fetch_page: Callable[[str, Dict[str, Any]], Tuple[pd.DataFrame, Optional[str]]],
+        block_size: int = BLOCK_SIZE,
+        prefetch_rows: int = PREFETCH_ROWS,
+        max_blocks: int = 64,
+        ttl: float = 10 * 60
+    ):
+        self.fetch_block = fetch_block
+        self.fetch_page = fetch_page
+        self.block_size = block_size
+        self.prefetch_rows = prefetch_rows
+        self.max_blocks = max_blocks
+        self.ttl = ttl
+
+        # block key -> (rows, expires_at, listing offset of every (date_normal, id) in it)
+        self._blocks: 'OrderedDict[tuple, Tuple[pd.DataFrame, float, Dict[Tuple[str, str], int]]]' = OrderedDict()
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='block-prefetch')
+        self._counters = {'page_hits': 0, 'page_misses': 0, 'block_fetches': 0, 'prefetches': 0}
+
+    def get_page(self, dataset_name: str, filters: Dict[str, Any]) -> Tuple[pd.DataFrame, Optional[str]]:
+        """One page (`page` and `per_page`, or `cursor`) and the cursor of the next page"""
+        page = filters.get('page', 1)
+        per_page = filters.get('per_page', 10)
+        listing = listing_filter(filters)
+        scope = (dataset_name, filter_hash(listing))
+
+        if filters.get('cursor'):
+            start = self._position_after(scope, decode_cursor(filters['cursor'], listing))
+            if start is None:
+                self._count('page_misses')
+                return self.fetch_page(dataset_name, filters)
+        else:
+            start = (page - 1) * per_page
+
+        # one extra row tells whether there is a next page
+        rows, complete = self._rows(dataset_name, listing, scope, start, per_page + 1)
+        self._count('page_hits' if complete else 'page_misses')
+        self._maybe_prefetch(dataset_name, listing, scope, start + per_page)
+
+        if len(rows) <= per_page:
+            return rows, None
+        rows = rows.iloc[:per_page]
+        last = rows.iloc[-1]
+        return rows, encode_cursor(listing, last['date_normal'], last['id'])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, 'blocks': len(self._blocks), 'block_size': self.block_size}
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _rows(self, dataset_name: str, listing: Dict[str, Any], scope: tuple, start: int, count: int) -> Tuple[pd.DataFrame, bool]:
+        """Rows [start, start + count) from the blocks covering them, and whether all were cached"""
+        frames: List[pd.DataFrame] = []
+        complete = True
+        position = start
+        while position < start + count:
+            index = position // self.block_size
+            block, cached = self._block(dataset_name, listing, scope, index)
+            complete = complete and cached
+            offset = position - index * self.block_size
+            frames.append(block.iloc[offset:offset + start + count - position])
+            if len(block) < self.block_size:
+                break  # last block of the listing
+            position = (index + 1) * self.block_size
+        rows = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+        return rows, complete
+
+    def _block(self, dataset_name: str, listing: Dict[str, Any], scope: tuple, index: int) -> Tuple[pd.DataFrame, bool]:
+        key = scope + (self.block_size, index)
+        with self._lock:
+            entry = self._blocks.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._blocks.move_to_end(key)
+                return entry[0], True
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if owner:
+            self._load(dataset_name, listing, key, future)
+        return future.result(), False
+
+    def _load(self, dataset_name: str, listing: Dict[str, Any], key: tuple, future: Future) -> None:
+        index = key[-1]
+        try:
+            block = self.fetch_block(dataset_name, listing, index * self.block_size, self.block_size).reset_index(drop=True)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+
+        positions = {
+            (date_normal.strftime('%Y-%m-%d') if hasattr(date_normal, 'strftime') else str(date_normal)[:10], publication_id): index * self.block_size + i
+            for i, (date_normal, publication_id) in enumerate(zip(block['date_normal'], block['id']))
+        }
+        with self._lock:
+            self._counters['block_fetches'] += 1
+            self._blocks[key] = (block, time.time() + self.ttl, positions)
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(block)
+
+    def _position_after(self, scope: tuple, row_key: Tuple[str, str]) -> Optional[int]:
+        """Listing offset just past the row a cursor was issued for, if it is cached"""
+        now = time.time()
+        with self._lock:
+            for key, (_, expires_at, positions) in self._blocks.items():
+                if key[:2] == scope and key[2] == self.block_size and expires_at > now and row_key in positions:
+                    return positions[row_key] + 1
+        return None
+
+    def _maybe_prefetch(self, dataset_name: str, listing: Dict[str, Any], scope: tuple, end: int) -> None:
+        index = end // self.block_size
+        if (index + 1) * self.block_size - end > self.prefetch_rows:
+            return
+        next_key = scope + (self.block_size, index + 1)
+        with self._lock:
+            current = self._blocks.get(scope + (self.block_size, index))
+            if current is None or len(current[0]) < self.block_size:
+                return  # nothing after the last block
+            if next_key in self._blocks or next_key in self._inflight:
+                return
+            future = self._inflight[next_key] = Future()
+            self._counters['prefetches'] += 1
+        self._prefetcher.submit(self._load, dataset_name, listing, next_key, future)
@@ -0,0 +1,451 @@
+"""
+Column store of the publication listing, so pages are served without a warehouse
+round trip.
+
+A single institution's corpus fits comfortably in memory as columns:
+- dates (days since the epoch) and citation counts as NumPy arrays;
+- string columns (document type, title, DOI, publisher) as int32 codes into an
+  interned string table, one UTF-8 blob plus offsets;
+- list columns (author names, fields, research orgs, funders, journal lists) as
+  per-publication offsets into one flat array of codes.
+
+Rows are stored newest first (date_normal DESC, id DESC), the order of the warehouse
+listing, so the default listing is the filtered row numbers in order and every other
+sort falls back on row number to break ties. The store implements the row index
+interface of DimensionsFilter.select_rows, so filters keep their warehouse semantics;
+other sorts (the filter's `sort`, e.g. ['citations_count:desc'], or search relevance)
+take the top rows with np.partition before sorting only those.
+
+On disk a store is a directory of .npy arrays plus meta.json. Loaded arrays stay
+memory-mapped, so every worker process shares one copy through the page cache. Build
+it from the publications table (or a Parquet snapshot) and point the API at it:
+
+    python -m bigquery.dimensions.publication_store --out publication_store/
+    DISCOVER_PUBLICATION_STORE=publication_store/ python app.py
+
+DISCOVER_PUBLICATION_STORE may also name a Parquet snapshot, which is then loaded into
+each process at startup.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pyroaring import FrozenBitMap
+
+from ..bq import BigQuery
+
+FORMAT_VERSION = 1
+
+# string columns: row -> one code
+SCALAR_COLUMNS = ('document_type', 'title', 'doi', 'publisher')
+# list columns: row -> codes[offsets[row]:offsets[row + 1]]
+LIST_COLUMNS = ('fields', 'research_orgs', 'funder_orgs', 'journal_lists', 'author_first_names', 'author_last_names')
+# select_rows dimensions held in list columns
+LIST_DIMENSIONS = {'field': 'fields', 'research_org': 'research_orgs', 'funder': 'funder_orgs', 'journal_list': 'journal_lists'}
+FLAG_COLUMNS = ('open_access_v1', 'open_access_v2', 'preprint')
+
+# `sort` entries the store can order by
+SORT_COLUMNS = {'date_normal': 'days', 'citations_count': 'citations'}
+
+
+def build_store_query(table_ref: str) -> str:
+    """One row per listed publication with every column the store keeps, newest first"""
+    return f"""
+    SELECT
+        id,
+        date_normal,
+        citations_count,
+        document_type.classification AS document_type,
+        title.preferred AS title,
+        doi,
+        publisher.name AS publisher,
+        ARRAY(SELECT COALESCE(a.first_name, '') FROM UNNEST(authors) a) AS author_first_names,
+        ARRAY(SELECT COALESCE(a.last_name, '') FROM UNNEST(authors) a) AS author_last_names,
+        ARRAY(
+            SELECT DISTINCT f.name
+            FROM UNNEST(categories.for_2020_v2022.first_level.full) f
+            WHERE f.name IS NOT NULL
+        ) AS fields,
+        research_orgs,
+        funder_orgs,
+        journal_lists,
+        ARRAY_LENGTH(COALESCE(open_access_categories, [])) > 0 AS open_access_v1,
+        ARRAY_LENGTH(COALESCE(open_access_categories_v2, [])) > 0 AS open_access_v2,
+        (COALESCE(ARRAY_LENGTH(repository_dois), 0) > 0 OR arxiv_id IS NOT NULL) AS preprint
+    FROM `{table_ref}`
+    WHERE date_normal IS NOT NULL
+    ORDER BY date_normal DESC, id DESC
+    """
+
+
+def _pack(strings: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.uint64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _intern(values: pd.Series) -> Tuple[np.ndarray, List[str]]:
+    """Codes (-1 for null) into the sorted distinct values"""
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int32), [str(value) for value in uniques]
+
+
+def _group_lowered(codes: Dict[str, int]) -> Dict[str, List[int]]:
+    grouped: Dict[str, List[int]] = {}
+    for value, code in codes.items():
+        grouped.setdefault(value.lower(), []).append(code)
+    return grouped
+
+
+class StringTable:
+    """Interned strings stored as one UTF-8 blob and offsets"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+        self._codes: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code: int) -> Optional[str]:
+        if code < 0:
+            return None
+        start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    def codes(self) -> Dict[str, int]:
+        """String -> code, decoded once per process"""
+        if self._codes is None:
+            self._codes = {self[code]: code for code in range(len(self))}
+        return self._codes
+
+
+class PublicationStore:
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.arrays = arrays
+        self.meta = meta
+        self.num_rows = int(meta['num_rows'])
+        self.all_rows = FrozenBitMap(range(self.num_rows))
+        self.days = arrays['days']
+        self.citations = arrays['citations']
+        self.tables = {
+            name: StringTable(arrays[f"{name}_blob"], arrays[f"{name}_offsets"])
+            for name in ('ids',) + SCALAR_COLUMNS + ('fields', 'research_orgs', 'funder_orgs', 'journal_lists', 'names')
+        }
+        self._derived: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, publications: pd.DataFrame) -> 'PublicationStore':
+        """
+        Store a frame shaped like build_store_query's result. Rows are sorted here
+        (day DESC, id DESC) rather than trusting the download order, which parallel
+        Storage API streams do not keep.
+        """
+        days = pd.to_datetime(publications['date_normal']).to_numpy(dtype='datetime64[D]').astype(np.int32)
+        ids = publications['id'].astype(str).to_numpy(dtype=str)
+        # lexsort is ascending with the last key primary; reversing gives day DESC, id DESC
+        order = np.lexsort((ids, days))[::-1]
+        publications = publications.iloc[order].reset_index(drop=True)
+        arrays: Dict[str, np.ndarray] = {
+            'days': days[order],
+            'citations': pd.to_numeric(publications['citations_count']).to_numpy(dtype=np.float64, na_value=np.nan)
+        }
+        arrays['ids_blob'], arrays['ids_offsets'] = _pack(publications['id'].astype(str))
+
+        for name in SCALAR_COLUMNS:
+            codes, table = _intern(publications[name])
+            arrays[f"{name}_codes"] = codes
+            arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = _pack(table)
+
+        # author first and last names share one table
+        names = pd.concat([publications['author_first_names'].explode(), publications['author_last_names'].explode()])
+        _, name_table = _intern(names.fillna(''))
+        arrays['names_blob'], arrays['names_offsets'] = _pack(name_table)
+        name_index = {name: code for code, name in enumerate(name_table)}
+
+        for name in LIST_COLUMNS:
+            lists = publications[name].map(
+                lambda items: [item for item in items if item is not None] if isinstance(items, (list, tuple, np.ndarray)) else []
+            )
+            offsets = np.zeros(len(lists) + 1, dtype=np.uint64)
+            offsets[1:] = np.cumsum(lists.map(len).to_numpy(), dtype=np.uint64)
+            flat = pd.Series([item for items in lists for item in items], dtype=object)
+            arrays[f"{name}_row_offsets"] = offsets
+            if name.startswith('author_'):
+                arrays[f"{name}_codes"] = np.array([name_index[item] for item in flat], dtype=np.int32)
+            else:
+                codes, table = _intern(flat)
+                arrays[f"{name}_codes"] = codes
+                arrays[f"{name}_blob"], arrays[f"{name}_offsets"] = _pack(table)
+
+        for name in FLAG_COLUMNS:
+            arrays[name] = publications[name].fillna(False).to_numpy(dtype=bool)
+
+        meta = {
+            'version': FORMAT_VERSION,
+            'num_rows': len(publications),
+            'built_at': datetime.datetime.utcnow().isoformat()
+        }
+        return cls(arrays, meta)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(array))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({**self.meta, 'arrays': sorted(self.arrays)}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> 'PublicationStore':
+        """Open a saved store; the arrays stay memory-mapped and are shared between processes"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Publication store at {path} has format {meta.get('version')}, expected {FORMAT_VERSION}")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in meta['arrays']}
+        return cls(arrays, meta)
+
+    def _cached(self, key: str, compute) -> Any:
+        """Per-process arrays derived from the stored ones on first use"""
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = compute()
+            return self._derived[key]
+
+    def _list_rows(self, column: str) -> np.ndarray:
+        """Row number of every entry of a list column"""
+        return self._cached(f"{column}_rows", lambda: np.repeat(
+            np.arange(self.num_rows, dtype=np.uint32),
+            np.diff(self.arrays[f"{column}_row_offsets"]).astype(np.int64)
+        ))
+
+    def _rows(self, mask: np.ndarray) -> FrozenBitMap:
+        return FrozenBitMap(np.flatnonzero(mask).astype(np.uint32))
+
+    # row index interface of DimensionsFilter.select_rows
+
+    def any_of(self, dimension: str, values: Iterable[Any]) -> FrozenBitMap:
+        """Rows holding at least one of the values"""
+        if dimension == 'year':
+            years = self._cached('years', lambda: self.days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int32) + 1970)
+            return self._rows(np.isin(years, [int(value) for value in values]))
+        if dimension == 'access_type':
+            open_access = np.asarray(self.arrays['open_access_v1'])
+            masks = {'openAccess': open_access, 'subscription': ~open_access}
+            return self._rows(np.logical_or.reduce([masks[value] for value in values if value in masks] or [np.zeros(self.num_rows, dtype=bool)]))
+
+        column = LIST_DIMENSIONS.get(dimension, dimension)
+        table = self.tables[column]
+        if dimension == 'field':
+            # fields match case-insensitively, so one value may cover several spellings
+            lowered = self._cached('field_codes', lambda: _group_lowered(table.codes()))
+            wanted = [code for value in values for code in lowered.get(value, [])]
+        else:
+            wanted = [table.codes()[value] for value in values if value in table.codes()]
+        hits = np.isin(self.arrays[f"{column}_codes"], wanted)
+        if column in SCALAR_COLUMNS:
+            return self._rows(hits)
+        return FrozenBitMap(self._list_rows(column)[hits])
+
+    def present(self, dimension: str) -> FrozenBitMap:
+        """Rows holding any value at all, which is what SQL `NOT IN` keeps"""
+        column = LIST_DIMENSIONS.get(dimension, dimension)
+        if column in SCALAR_COLUMNS:
+            return self._rows(np.asarray(self.arrays[f"{column}_codes"]) >= 0)
+        return self._rows(np.diff(self.arrays[f"{column}_row_offsets"]) > 0)
+
+    def flag(self, name: str) -> FrozenBitMap:
+        if name == 'open_access':
+            return self._rows(np.asarray(self.arrays['open_access_v1']) | np.asarray(self.arrays['open_access_v2']))
+        if name == 'has_doi':
+            return self._rows(np.asarray(self.arrays['doi_codes']) >= 0)
+        return self._rows(np.asarray(self.arrays[name]))
+
+    def date_range(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> FrozenBitMap:
+        mask = np.ones(self.num_rows, dtype=bool)
+        if date_from:
+            mask &= self.days >= np.datetime64(date_from, 'D').astype(np.int64)
+        if date_to:
+            mask &= self.days <= np.datetime64(date_to, 'D').astype(np.int64)
+        return self._rows(mask)
+
+    def citation_range(self, minimum: Optional[float] = None, maximum: Optional[float] = None) -> FrozenBitMap:
+        mask = np.ones(self.num_rows, dtype=bool)
+        if minimum is not None:
+            mask &= np.nan_to_num(self.citations, nan=0.0) >= minimum
+        if maximum is not None:
+            # NaN compares false, like NULL <= max
+            mask &= self.citations <= maximum
+        return self._rows(mask)
+
+    def rows_for_ids(self, ids: Iterable[str]) -> FrozenBitMap:
+        return FrozenBitMap(self.row_numbers(ids))
+
+    # listing
+
+    def row_numbers(self, ids: Iterable[str]) -> np.ndarray:
+        """Rows of these publication ids in the order given; unknown ids are skipped"""
+        row_of_id = self.tables['ids'].codes()
+        return np.array([row_of_id[i] for i in ids if i in row_of_id], dtype=np.int64)
+
+    def row_of(self, publication_id: str) -> Optional[int]:
+        return self.tables['ids'].codes().get(publication_id)
+
+    def sort_keys(self, sort: Optional[List[str]]) -> List[Tuple[np.ndarray, bool]]:
+        """(values, descending) per known `column:direction` entry of a filter's sort"""
+        keys = []
+        for entry in sort or []:
+            column, _, direction = entry.partition(':')
+            if column in SORT_COLUMNS:
+                keys.append((column, direction.lower() != 'asc'))
+        # row order already is date_normal DESC, so a trailing one is implied
+        while keys and keys[-1] == ('date_normal', True):
+            keys.pop()
+        return [
+            (np.nan_to_num(self.citations, nan=0.0) if column == 'citations_count' else self.days, descending)
+            for column, descending in keys
+        ]
+
+    def relevance_key(self, ranked_rows: np.ndarray) -> List[Tuple[np.ndarray, bool]]:
+        """Sort key ordering rows as ranked, e.g. by a search"""
+        rank = np.full(self.num_rows, len(ranked_rows), dtype=np.int64)
+        rank[ranked_rows] = np.arange(len(ranked_rows))
+        return [(rank, False)]
+
+    def top(
+        self,
+        rows: np.ndarray,
+        keys: List[Tuple[np.ndarray, bool]],
+        after: Optional[int] = None,
+        offset: int = 0,
+        limit: int = 10
+    ) -> np.ndarray:
+        """
+        Rows [offset, offset + limit) of `rows` ordered by `keys`, then row number. With
+        `after`, only rows ordered after that row are considered.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = [-values[rows].astype(np.float64) if descending else values[rows] for values, descending in keys]
+        if after is not None:
+            later = rows > after
+            for (values, descending), column in reversed(list(zip(keys, columns))):
+                pivot = -float(values[after]) if descending else values[after]
+                later = (column > pivot) | ((column == pivot) & later)
+            rows, columns = rows[later], [column[later] for column in columns]
+
+        end = offset + limit
+        if columns and end < len(rows):
+            # only rows tied with or ahead of the end-th on the first key can make the page
+            threshold = np.partition(columns[0], end - 1)[end - 1]
+            keep = columns[0] <= threshold
+            rows, columns = rows[keep], [column[keep] for column in columns]
+        if columns:
+            rows = rows[np.lexsort([rows] + columns[::-1])]
+        return rows[offset:end]
+
+    def frame(self, rows: np.ndarray) -> pd.DataFrame:
+        """Listing rows shaped like PublicationAnalytics._listing_query's result"""
+        names = self.tables['names']
+        first_offsets = self.arrays['author_first_names_row_offsets']
+        first, last = self.arrays['author_first_names_codes'], self.arrays['author_last_names_codes']
+        records = []
+        for row in (int(row) for row in rows):
+            start, end = int(first_offsets[row]), int(first_offsets[row + 1])
+            citations = self.citations[row]
+            records.append({
+                'id': self.tables['ids'][row],
+                'title': self.tables['title'][int(self.arrays['title_codes'][row])],
+                'date_normal': np.datetime64(int(self.days[row]), 'D').astype(object),
+                'document_type': self.tables['document_type'][int(self.arrays['document_type_codes'][row])],
+                'citations_count': 0 if np.isnan(citations) else int(citations),
+                'doi': self.tables['doi'][int(self.arrays['doi_codes'][row])],
+                'authors': [
+                    {'author': {'first_name': names[int(first[i])], 'last_name': names[int(last[i])]}}
+                    for i in range(start, end)
+                ]
+            })
+        return pd.DataFrame(records, columns=['id', 'title', 'date_normal', 'document_type', 'citations_count', 'doi', 'authors'])
+
+
+_default_store: Optional[PublicationStore] = None
+_default_store_loaded = False
+_default_store_lock = threading.Lock()
+
+
+def get_default_publication_store() -> Optional[PublicationStore]:
+    """Process-wide store from DISCOVER_PUBLICATION_STORE, or None when none is configured"""
+    global _default_store, _default_store_loaded
+    with _default_store_lock:
+        if not _default_store_loaded:
+            _default_store_loaded = True
+            path = os.environ.get('DISCOVER_PUBLICATION_STORE')
+            if path and os.path.exists(os.path.join(path, 'meta.json')):
+                _default_store = PublicationStore.load(path)
+                print(f"Loaded publication store from {path}: {_default_store.num_rows} publications")
+            elif path:
+                _default_store = build_publication_store(_snapshot_client(path), 'publications')
+        return _default_store
+
+
+def _snapshot_client(snapshot_path: str, **dataset: str) -> BigQuery:
+    bq = BigQuery(use_cache=False)
+    bq.add_dataset(
+        name='publications',
+        project_id=dataset.get('project_id', 'ucsd-discover'),
+        dataset=dataset.get('dataset', 'dimensions'),
+        table=dataset.get('table', 'ucsd_publications'),
+        billing_project_id=dataset.get('billing_project_id', 'ucsd-discover'),
+        engine='duckdb',
+        snapshot_path=snapshot_path
+    )
+    return bq
+
+
+def build_publication_store(bq: BigQuery, dataset_name: str, path: Optional[str] = None) -> PublicationStore:
+    dataset = bq.datasets[dataset_name]
+    publications = bq.query(dataset_name, build_store_query(dataset.full_path), use_cache=False)
+    store = PublicationStore.build(publications)
+    if path:
+        store.save(path)
+        print(f"Stored {store.num_rows} publications into {path}")
+    else:
+        print(f"Loaded {store.num_rows} publications into the publication store")
+    return store
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='directory to write the store to')
+    parser.add_argument('--project', default='ucsd-discover')
+    parser.add_argument('--dataset', default='dimensions')
+    parser.add_argument('--table', default='ucsd_publications')
+    parser.add_argument('--billing-project', default='ucsd-discover')
+    parser.add_argument('--snapshot', help='build from this Parquet snapshot instead of BigQuery')
+    args = parser.parse_args(argv)
+
+    dataset = {
+        'project_id': args.project,
+        'dataset': args.dataset,
+        'table': args.table,
+        'billing_project_id': args.billing_project
+    }
+    if args.snapshot:
+        bq = _snapshot_client(args.snapshot, **dataset)
+    else:
+        bq = BigQuery(use_cache=False)
+        bq.add_dataset(name='publications', **dataset)
+    build_publication_store(bq, 'publications', args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
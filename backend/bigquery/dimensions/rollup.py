@@ -0,0 +1,390 @@
+"""
+Pre-aggregated rollup of the publications table for get_basic_stats.
+
+The rollup holds one row per (year, document type, set of first-level fields, open
+access) cell. Each row has additive measures (counts and sums) and per-cell top-k
+arrays for the leaderboard facets. get_basic_stats answers filters that only touch
+those dimensions by merging cells instead of scanning the raw table.
+
+Counts, sums, averages, doc-type counts, months with publications, unique countries
+and the country leaderboard are exact. The other leaderboards are merged from the
+per-cell top-k lists (CELL_TOP_K), so an item that ranks below the cut in some cells
+is undercounted by at most its count in those cells.
+
+    python -m bigquery.dimensions.rollup
+"""
+import argparse
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from ..bq import BigQuery, QueryParameter
+from utils.canonical_filter import canonicalize_filter
+
+CELL_KEYS = ['year', 'doc_type', 'field_key', 'is_open_access']
+
+# facet: (FROM/UNNEST clause, item expression, label expression, WHERE, per-cell top-k or None for all)
+CELL_FACETS = {
+    'concepts': ('UNNEST(concepts) x', 'x.concept', 'NULL', 'x.concept IS NOT NULL', 500),
+    'mesh_terms': ('UNNEST(mesh_terms) x', 'x', 'NULL', 'x IS NOT NULL', 300),
+    'sdgs': ('UNNEST(sdg_categories) x', 'x.code', 'x.name', 'x.code IS NOT NULL', None),
+    'countries': ('UNNEST(research_org_countries) x', 'x', 'NULL', 'x IS NOT NULL', None),
+    'institutions': ('UNNEST(research_orgs) x', 'x', 'NULL', 'x IS NOT NULL', 200),
+    'journals': (None, 'source.title', 'NULL', 'source.title IS NOT NULL', 200),
+    'authors': ('UNNEST(authors) x', "CONCAT(x.first_name, ' ', x.last_name)", 'NULL', 'TRUE', 200),
+    'open_access_types': ('UNNEST(open_access_categories) x', 'x', 'NULL', 'x IS NOT NULL', None),
+    'funders': ('UNNEST(funder_orgs) x', 'x', 'NULL', 'x IS NOT NULL', 200),
+    'publishers': (None, 'publisher.name', 'NULL', 'publisher.name IS NOT NULL', 200)
+}
+
+# output column: (facet, struct fields built from item/label/count, top-k)
+STATS_LEADERBOARDS = [
+    ('top_concepts', 'concepts', 'item AS concept_text, count AS concept_count', 'concept_count', 200),
+    ('top_mesh_terms', 'mesh_terms', 'item AS term, count AS term_count', 'term_count', 100),
+    ('sdg_categories', 'sdgs', 'item AS code, label AS name, count AS sdg_count', 'sdg_count', 17),
+    ('top_countries', 'countries', 'item AS country, count', 'count', 20),
+    ('top_collaborating_institutions', 'institutions', 'item AS org, count', 'count', 20),
+    ('top_journals', 'journals', 'item AS journal, count', 'count', 20),
+    ('top_authors', 'authors', 'item AS author, count', 'count', 20),
+    ('open_access_types', 'open_access_types', 'item AS category, count', 'count', 20),
+    ('top_funders', 'funders', 'item AS funder, count', 'count', 20),
+    ('top_publishers', 'publishers', 'item AS publisher, count', 'count', 20)
+]
+
+DOC_TYPE_COLUMNS = [
+    ('RESEARCH_ARTICLE', 'research_article_count'),
+    ('REVIEW_ARTICLE', 'review_article_count'),
+    ('RESEARCH_CHAPTER', 'research_chapter_count'),
+    ('CONFERENCE_PAPER', 'conference_paper_count'),
+    ('REFERENCE_WORK', 'reference_work_count'),
+    ('EDITORIAL', 'editorial_count'),
+    ('OTHER_JOURNAL_CONTENT', 'other_journal_count'),
+    ('LETTER_TO_EDITOR', 'letter_to_editor_count'),
+    ('OTHER_BOOK_CONTENT', 'book_count'),
+    ('BOOK_REVIEW', 'book_review_count'),
+    ('OTHER_CONFERENCE_CONTENT', 'other_conference_count')
+]
+
+# filter keys the rollup dimensions can answer
+ROLLUP_FILTER_KEYS = {
+    'dateRange', 'years', 'type', 'excludeTypes', 'documentTypes', 'fields', 'excludeFields', 'subjectAreas',
+    'openAccess'
+}
+
+
+def build_rollup_query(source_path: str, target_path: str) -> str:
+    """CREATE OR REPLACE TABLE statement that materializes the rollup from the raw table"""
+    keys = ', '.join(CELL_KEYS)
+    facet_ctes = []
+    facet_joins = []
+    facet_columns = []
+    for facet, (unnest, item, label, where, top_k) in CELL_FACETS.items():
+        source = f"pubs, {unnest}" if unnest else "pubs"
+        limit = f" LIMIT {top_k}" if top_k else ""
+        facet_ctes.append(f"""
+{facet}_cells AS (
+    SELECT
+        cell_id,
+        ARRAY_AGG(STRUCT(item, label, count) ORDER BY count DESC{limit}) AS {facet}
+    FROM (
+        SELECT cell_id, {item} AS item, {label} AS label, COUNT(*) AS count
+        FROM {source}
+        WHERE {where}
+        GROUP BY cell_id, item, label
+    )
+    GROUP BY cell_id
+)""")
+        facet_joins.append(f"LEFT JOIN {facet}_cells USING (cell_id)")
+        facet_columns.append(f"COALESCE({facet}_cells.{facet}, []) AS {facet}")
+
+    return f"""
+CREATE OR REPLACE TABLE `{target_path}`
+CLUSTER BY year, doc_type AS
+WITH pubs AS (
+    SELECT
+        *,
+        TO_JSON_STRING(STRUCT({keys})) AS cell_id
+    FROM (
+        SELECT
+            EXTRACT(YEAR FROM date_normal) AS year,
+            document_type.classification AS doc_type,
+            ARRAY_TO_STRING(ARRAY(
+                SELECT DISTINCT LOWER(f.name)
+                FROM UNNEST(categories.for_2020_v2022.first_level.full) f
+                WHERE f.name IS NOT NULL
+                ORDER BY 1
+            ), '|') AS field_key,
+            (ARRAY_LENGTH(COALESCE(open_access_categories, [])) > 0 OR
+             ARRAY_LENGTH(COALESCE(open_access_categories_v2, [])) > 0) AS is_open_access,
+            date_normal,
+            COALESCE(citations_count, 0) AS citations_count,
+            COALESCE(metrics.field_citation_ratio, 0) AS field_citation_ratio,
+            COALESCE(metrics.relative_citation_ratio, 0) AS relative_citation_ratio,
+            COALESCE(metrics.recent_citations, 0) AS recent_citations,
+            COALESCE(altmetrics.score, 0) AS altmetric_score,
+            ARRAY_LENGTH(COALESCE(research_orgs, [])) AS collaboration_count,
+            ARRAY_LENGTH(COALESCE(research_org_countries, [])) AS international_collaboration_count,
+            ARRAY_LENGTH(COALESCE(authors, [])) AS author_count,
+            ARRAY_LENGTH(COALESCE(citations, [])) AS citation_references_count,
+            ARRAY_LENGTH(COALESCE(clinical_trial_ids, [])) AS clinical_trials_count,
+            ARRAY_LENGTH(COALESCE(patent_ids, [])) AS patent_count,
+            ARRAY_LENGTH(COALESCE(funding_details, [])) AS funding_count,
+            ARRAY_LENGTH(COALESCE(repository_dois, [])) AS repository_count,
+            ARRAY_LENGTH(open_access_categories) > 0 AS has_oa_category,
+            concepts,
+            pubmed.mesh.terms AS mesh_terms,
+            categories.sdg_v2021.full AS sdg_categories,
+            research_org_countries,
+            research_orgs,
+            source,
+            authors,
+            open_access_categories,
+            funder_orgs,
+            publisher
+        FROM `{source_path}`
+        WHERE date_normal IS NOT NULL
+    )
+),
+
+cells AS (
+    SELECT
+        cell_id,
+        {keys},
+        ANY_VALUE(SPLIT(NULLIF(field_key, ''), '|')) AS fields,
+        COUNT(*) AS publication_count,
+        SUM(citations_count) AS sum_citations,
+        SUM(recent_citations) AS sum_recent_citations,
+        SUM(field_citation_ratio) AS sum_field_citation_ratio,
+        SUM(relative_citation_ratio) AS sum_relative_citation_ratio,
+        COUNTIF(field_citation_ratio > 1) AS above_field_average_count,
+        SUM(altmetric_score) AS sum_altmetric_score,
+        SUM(collaboration_count) AS sum_collaborating_institutions,
+        SUM(international_collaboration_count) AS sum_collaborating_countries,
+        SUM(author_count) AS sum_authors,
+        SUM(citation_references_count) AS sum_references,
+        SUM(clinical_trials_count) AS total_clinical_trials,
+        SUM(patent_count) AS total_patents,
+        SUM(funding_count) AS total_funding_instances,
+        SUM(repository_count) AS total_repository_deposits,
+        COUNTIF(has_oa_category) AS open_access_count,
+        BIT_OR(1 << EXTRACT(MONTH FROM date_normal)) AS month_mask
+    FROM pubs
+    GROUP BY cell_id, {keys}
+),
+{','.join(facet_ctes)}
+
+SELECT
+    cells.* EXCEPT (cell_id),
+    {', '.join(facet_columns)}
+FROM cells
+{' '.join(facet_joins)}
+"""
+
+
+def build_rollup_stats_query(rollup_path: str, where_clause: str) -> str:
+    """get_basic_stats over the rollup: per-year rows plus the 9999 all-years row"""
+    doc_type_columns = ',\n        '.join(
+        f"SUM(IF(doc_type = '{doc_type}', publication_count, 0)) AS {column}"
+        for doc_type, column in DOC_TYPE_COLUMNS
+    )
+    leaderboard_ctes = []
+    leaderboard_joins = []
+    leaderboard_columns = []
+    for column, facet, fields, order_field, top_k in STATS_LEADERBOARDS:
+        leaderboard_ctes.append(f"""
+{column}_stats AS (
+    SELECT
+        year,
+        ARRAY_AGG(STRUCT({fields}) ORDER BY count DESC LIMIT {top_k}) AS {column}
+    FROM (
+        SELECT c.year, x.item, ANY_VALUE(x.label) AS label, SUM(x.count) AS count
+        FROM cells c, UNNEST(c.{facet}) x
+        GROUP BY c.year, x.item
+    )
+    GROUP BY year
+)""")
+        leaderboard_joins.append(f"LEFT JOIN {column}_stats USING (year)")
+        leaderboard_columns.append(f"{column}_stats.{column}")
+
+    return f"""
+WITH matching_cells AS (
+    SELECT *
+    FROM `{rollup_path}`
+    WHERE {where_clause}
+),
+
+-- every cell contributes to its own year and to the 9999 all-years row
+cells AS (
+    SELECT * FROM matching_cells
+    UNION ALL
+    SELECT * REPLACE (9999 AS year) FROM matching_cells
+),
+
+totals AS (
+    SELECT
+        year,
+        SUM(publication_count) AS total_publications,
+        {doc_type_columns},
+
+        ROUND(SAFE_DIVIDE(SUM(sum_citations), SUM(publication_count)), 2) AS avg_citations,
+        ROUND(SAFE_DIVIDE(SUM(sum_recent_citations), SUM(publication_count)), 2) AS avg_recent_citations,
+        ROUND(SAFE_DIVIDE(SUM(sum_field_citation_ratio), SUM(publication_count)), 3) AS avg_field_citation_ratio,
+        ROUND(SAFE_DIVIDE(SUM(sum_relative_citation_ratio), SUM(publication_count)), 3) AS avg_relative_citation_ratio,
+        SUM(above_field_average_count) AS above_field_average_count,
+        ROUND(SAFE_DIVIDE(SUM(above_field_average_count), SUM(publication_count)), 3) AS above_field_average_ratio,
+        ROUND(SAFE_DIVIDE(SUM(sum_altmetric_score), SUM(publication_count)), 2) AS avg_altmetric_score,
+        ROUND(SAFE_DIVIDE(SUM(sum_collaborating_institutions), SUM(publication_count)), 2) AS avg_collaborating_institutions,
+        ROUND(SAFE_DIVIDE(SUM(sum_collaborating_countries), SUM(publication_count)), 2) AS avg_collaborating_countries,
+
+        ROUND(SAFE_DIVIDE(SUM(sum_authors), SUM(publication_count)), 2) AS avg_authors_per_publication,
+        ROUND(SAFE_DIVIDE(SUM(sum_references), SUM(publication_count)), 2) AS avg_references_per_publication,
+        SUM(total_clinical_trials) AS total_clinical_trials,
+        SUM(total_patents) AS total_patents,
+        SUM(total_funding_instances) AS total_funding_instances,
+        SUM(total_repository_deposits) AS total_repository_deposits,
+        SUM(open_access_count) AS open_access_count,
+        ROUND(SAFE_DIVIDE(SUM(open_access_count), SUM(publication_count)), 3) AS open_access_ratio,
+        BIT_COUNT(BIT_OR(month_mask)) AS months_with_publications
+    FROM cells
+    GROUP BY year
+),
+
+unique_countries AS (
+    SELECT c.year, COUNT(DISTINCT x.item) AS unique_countries_count
+    FROM cells c, UNNEST(c.countries) x
+    GROUP BY c.year
+),
+
+doc_type_stats AS (
+    SELECT
+        year,
+        ARRAY_AGG(STRUCT(doc_type, doc_count) ORDER BY doc_count DESC) AS doc_type_counts
+    FROM (
+        SELECT year, doc_type, SUM(publication_count) AS doc_count
+        FROM cells
+        GROUP BY year, doc_type
+    )
+    GROUP BY year
+),
+{','.join(leaderboard_ctes)}
+
+SELECT
+    totals.* EXCEPT (months_with_publications),
+    COALESCE(unique_countries.unique_countries_count, 0) AS unique_countries_count,
+    totals.months_with_publications,
+    doc_type_stats.doc_type_counts,
+    {', '.join(leaderboard_columns)}
+FROM totals
+LEFT JOIN unique_countries USING (year)
+LEFT JOIN doc_type_stats USING (year)
+{' '.join(leaderboard_joins)}
+ORDER BY year = 9999, year DESC
+"""
+
+
+def _year_bound(value: Optional[str], boundary: str) -> Optional[int]:
+    """Year of a YYYY-MM-DD bound if it sits on the given year boundary ('01-01' or '12-31')"""
+    if not value:
+        return None
+    if len(value) != 10 or value[5:] != boundary:
+        raise ValueError(f"{value} is not aligned to a year boundary")
+    return int(value[:4])
+
+
+def build_rollup_where_clause(filters: Dict[str, Any]) -> Optional[Tuple[str, List[QueryParameter]]]:
+    """
+    WHERE clause over rollup cells equivalent to DimensionsFilter.build_where_clause,
+    or None when the filter touches something the rollup cannot answer exactly.
+    """
+    filters = canonicalize_filter(filters)
+    if not set(filters) <= ROLLUP_FILTER_KEYS:
+        return None
+
+    conditions = ["TRUE"]
+    params: List[QueryParameter] = []
+
+    date_range = filters.get('dateRange', {})
+    if not set(date_range) <= {'from', 'to'}:
+        return None
+    try:
+        year_from = _year_bound(date_range.get('from'), '01-01')
+        year_to = _year_bound(date_range.get('to'), '12-31')
+    except ValueError:
+        return None
+    if year_from is not None:
+        conditions.append("year >= @year_from")
+        params.append(bigquery.ScalarQueryParameter('year_from', 'INT64', year_from))
+    if year_to is not None:
+        conditions.append("year <= @year_to")
+        params.append(bigquery.ScalarQueryParameter('year_to', 'INT64', year_to))
+
+    def array(name: str, values: List[Any], type_: str = 'STRING') -> str:
+        params.append(bigquery.ArrayQueryParameter(name, type_, list(values)))
+        return f"@{name}"
+
+    if filters.get('years'):
+        conditions.append(f"year IN UNNEST({array('years', filters['years'], 'INT64')})")
+
+    document_types = filters.get('documentTypes', {})
+    if not set(document_types) <= {'include', 'exclude'}:
+        return None
+    if filters.get('type'):
+        conditions.append(f"doc_type IN UNNEST({array('types', filters['type'])})")
+    if filters.get('excludeTypes'):
+        conditions.append(f"doc_type NOT IN UNNEST({array('exclude_types', filters['excludeTypes'])})")
+    if document_types.get('include'):
+        conditions.append(f"doc_type IN UNNEST({array('document_types', document_types['include'])})")
+    if document_types.get('exclude'):
+        conditions.append(f"doc_type NOT IN UNNEST({array('exclude_document_types', document_types['exclude'])})")
+
+    if filters.get('fields'):
+        fields = array('fields', sorted({f.lower() for f in filters['fields']}))
+        conditions.append(f"EXISTS (SELECT 1 FROM UNNEST(fields) f WHERE f IN UNNEST({fields}))")
+    if filters.get('excludeFields'):
+        exclude_fields = array('exclude_fields', sorted({f.lower() for f in filters['excludeFields']}))
+        conditions.append(f"NOT EXISTS (SELECT 1 FROM UNNEST(fields) f WHERE f IN UNNEST({exclude_fields}))")
+    if filters.get('subjectAreas'):
+        subject_areas = array('subject_areas', sorted({s.lower() for s in filters['subjectAreas']}))
+        conditions.append(f"EXISTS (SELECT 1 FROM UNNEST(fields) f WHERE f IN UNNEST({subject_areas}))")
+
+    if filters.get('openAccess'):
+        conditions.append("is_open_access")
+
+    return " AND ".join(conditions), params
+
+
+def build_rollup(bq: BigQuery, source_dataset: str, target_dataset: str) -> None:
+    """(Re)materialize the rollup table for `source_dataset` into `target_dataset`"""
+    query = build_rollup_query(
+        bq.datasets[source_dataset].full_path,
+        bq.datasets[target_dataset].full_path
+    )
+    print(f"Building rollup {bq.datasets[target_dataset].full_path}")
+    bq.query(target_dataset, query, use_cache=False)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--project', default='ucsd-discover')
+    parser.add_argument('--dataset', default='dimensions')
+    parser.add_argument('--table', default='ucsd_publications')
+    parser.add_argument('--rollup-table', default='ucsd_publications_rollup')
+    parser.add_argument('--billing-project', default='ucsd-discover')
+    args = parser.parse_args(argv)
+
+    bq = BigQuery(use_cache=False)
+    for name, table in [('publications', args.table), ('publications_rollup', args.rollup_table)]:
+        bq.add_dataset(
+            name=name,
+            project_id=args.project,
+            dataset=args.dataset,
+            table=table,
+            billing_project_id=args.billing_project
+        )
+    build_rollup(bq, 'publications', 'publications_rollup')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
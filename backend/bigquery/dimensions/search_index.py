@@ -0,0 +1,259 @@
+"""
+Local full-text index over publication titles and abstracts, ranked with BM25.
+
+`search_query` used to become a pair of LIKE '%term%' predicates, a full scan of every
+abstract for each search. With an index loaded, DimensionsFilter resolves the query
+here and pushes only `id IN UNNEST(@search_ids)` to the warehouse, with the ids in
+relevance order so listings can sort by rank.
+
+Matching: text is lowercased and split into alphanumeric tokens; a publication matches
+when it contains every query token, the last one as a prefix (so results keep up with
+a query being typed). Unlike LIKE, tokens do not match inside longer words.
+
+Scoring: BM25 (k1=1.2, b=0.75) over the title, counted TITLE_WEIGHT times, plus the
+abstract.
+
+On disk an index is a directory of .npy arrays plus meta.json, memory-mapped on load:
+- terms_blob / terms_offsets: the sorted vocabulary as one UTF-8 blob
+- postings_offsets: where each term's postings start in postings_docs / postings_tf
+- postings_docs (uint32 document numbers), postings_tf (uint16 weighted term counts)
+- doc_lengths, ids_blob / ids_offsets: per-document length and publication id
+
+Build it from the publications table (or a Parquet snapshot) and point the API at it:
+
+    python -m bigquery.dimensions.search_index --out search_index/
+    DISCOVER_SEARCH_INDEX=search_index/ python app.py
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..bq import BigQuery
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has in is it of on or that the to was were with'.split()
+)
+TITLE_WEIGHT = 3
+K1 = 1.2
+B = 0.75
+FORMAT_VERSION = 1
+# above this many matches the id list is larger than the scan it saves; fall back to LIKE
+MAX_SEARCH_IDS = 50_000
+
+ARRAYS = (
+    'terms_blob', 'terms_offsets', 'postings_offsets', 'postings_docs', 'postings_tf',
+    'doc_lengths', 'ids_blob', 'ids_offsets'
+)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not isinstance(text, str):
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _pack_strings(values: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded], dtype=np.uint64)
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class SearchIndex:
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, object]):
+        self.arrays = arrays
+        self.meta = meta
+        self.num_docs = int(meta['num_docs'])
+        self.avg_doc_length = float(meta['avg_doc_length']) or 1.0
+        self.num_terms = len(arrays['terms_offsets']) - 1
+        self._terms_blob = arrays['terms_blob']
+        self._terms_offsets = arrays['terms_offsets']
+
+    @classmethod
+    def build(cls, publications: pd.DataFrame) -> 'SearchIndex':
+        """Index a frame with `id`, `title` and `abstract` columns"""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(publications), dtype=np.uint32)
+        for doc, (title, abstract) in enumerate(zip(publications['title'], publications['abstract'])):
+            counts = Counter()
+            for token in tokenize(title):
+                counts[token] += TITLE_WEIGHT
+            counts.update(tokenize(abstract))
+            doc_lengths[doc] = sum(counts.values())
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc, min(count, np.iinfo(np.uint16).max)))
+
+        terms = sorted(postings)
+        lengths = np.array([len(postings[term]) for term in terms], dtype=np.uint64)
+        postings_offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        postings_offsets[1:] = np.cumsum(lengths)
+        flat = [pair for term in terms for pair in postings[term]]
+        terms_blob, terms_offsets = _pack_strings(terms)
+        ids_blob, ids_offsets = _pack_strings(str(value) for value in publications['id'])
+
+        arrays = {
+            'terms_blob': terms_blob,
+            'terms_offsets': terms_offsets,
+            'postings_offsets': postings_offsets,
+            'postings_docs': np.array([doc for doc, _ in flat], dtype=np.uint32),
+            'postings_tf': np.array([count for _, count in flat], dtype=np.uint16),
+            'doc_lengths': doc_lengths,
+            'ids_blob': ids_blob,
+            'ids_offsets': ids_offsets
+        }
+        meta = {
+            'version': FORMAT_VERSION,
+            'num_docs': len(publications),
+            'avg_doc_length': float(doc_lengths.mean()) if len(doc_lengths) else 0.0,
+            'built_at': datetime.datetime.utcnow().isoformat()
+        }
+        return cls(arrays, meta)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(self.arrays[name]))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> 'SearchIndex':
+        """Open a saved index; the arrays stay memory-mapped and are shared between processes"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Search index at {path} has format {meta.get('version')}, expected {FORMAT_VERSION}")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+        return cls(arrays, meta)
+
+    def _term(self, i: int) -> str:
+        start, end = int(self._terms_offsets[i]), int(self._terms_offsets[i + 1])
+        return bytes(self._terms_blob[start:end]).decode('utf-8')
+
+    def _lower_bound(self, term: str) -> int:
+        low, high = 0, self.num_terms
+        while low < high:
+            mid = (low + high) // 2
+            if self._term(mid) < term:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _term_ids(self, token: str, prefix: bool) -> range:
+        start = self._lower_bound(token)
+        if not prefix:
+            return range(start, start + 1) if start < self.num_terms and self._term(start) == token else range(0)
+        end = self._lower_bound(token + '\U0010ffff')
+        return range(start, end)
+
+    def _doc_id(self, doc: int) -> str:
+        start, end = int(self.arrays['ids_offsets'][doc]), int(self.arrays['ids_offsets'][doc + 1])
+        return bytes(self.arrays['ids_blob'][start:end]).decode('utf-8')
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """(publication id, BM25 score) of every match, best first, at most `limit`"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        postings_offsets = self.arrays['postings_offsets']
+        postings_docs = self.arrays['postings_docs']
+        postings_tf = self.arrays['postings_tf']
+        doc_lengths = self.arrays['doc_lengths']
+
+        tokens = list(dict.fromkeys(tokens))
+        # the last token may still be being typed, unless the query ends with a space
+        typing = query == query.rstrip()
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        matched = np.ones(self.num_docs, dtype=bool)
+        for position, token in enumerate(tokens):
+            prefix = typing and position == len(tokens) - 1
+            token_hits = np.zeros(self.num_docs, dtype=bool)
+            for term in self._term_ids(token, prefix):
+                start, end = int(postings_offsets[term]), int(postings_offsets[term + 1])
+                docs = np.asarray(postings_docs[start:end])
+                tf = np.asarray(postings_tf[start:end], dtype=np.float32)
+                idf = np.log1p((self.num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = K1 * (1 - B + B * doc_lengths[docs] / self.avg_doc_length)
+                scores[docs] += idf * tf * (K1 + 1) / (tf + norm)
+                token_hits[docs] = True
+            matched &= token_hits
+            if not matched.any():
+                return []
+
+        docs = np.flatnonzero(matched)
+        order = np.argsort(-scores[docs], kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        return [(self._doc_id(int(docs[i])), float(scores[docs[i]])) for i in order]
+
+
+_default_index: Optional[SearchIndex] = None
+_default_index_loaded = False
+_default_index_lock = threading.Lock()
+
+
+def get_default_search_index() -> Optional[SearchIndex]:
+    """Process-wide index from DISCOVER_SEARCH_INDEX, or None when no index is configured"""
+    global _default_index, _default_index_loaded
+    with _default_index_lock:
+        if not _default_index_loaded:
+            _default_index_loaded = True
+            path = os.environ.get('DISCOVER_SEARCH_INDEX')
+            if path:
+                _default_index = SearchIndex.load(path)
+                print(f"Loaded search index from {path}: {_default_index.num_docs} publications, {_default_index.num_terms} terms")
+        return _default_index
+
+
+def build_search_index(bq: BigQuery, dataset_name: str, path: str) -> SearchIndex:
+    dataset = bq.datasets[dataset_name]
+    query = f"""
+    SELECT id, title.preferred AS title, abstract.preferred AS abstract
+    FROM `{dataset.full_path}`
+    WHERE id IS NOT NULL
+    """
+    publications = bq.query(dataset_name, query, use_cache=False)
+    index = SearchIndex.build(publications)
+    index.save(path)
+    print(f"Indexed {index.num_docs} publications ({index.num_terms} terms) into {path}")
+    return index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='directory to write the index to')
+    parser.add_argument('--project', default='ucsd-discover')
+    parser.add_argument('--dataset', default='dimensions')
+    parser.add_argument('--table', default='ucsd_publications')
+    parser.add_argument('--billing-project', default='ucsd-discover')
+    parser.add_argument('--snapshot', help='build from this Parquet snapshot instead of BigQuery')
+    args = parser.parse_args(argv)
+
+    bq = BigQuery(use_cache=False)
+    engine = {'engine': 'duckdb', 'snapshot_path': args.snapshot} if args.snapshot else {}
+    bq.add_dataset(
+        name='publications',
+        project_id=args.project,
+        dataset=args.dataset,
+        table=args.table,
+        billing_project_id=args.billing_project,
+        **engine
+    )
+    build_search_index(bq, 'publications', args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
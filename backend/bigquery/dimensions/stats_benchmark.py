@@ -0,0 +1,87 @@
+"""
+Side-by-side benchmark of the get_basic_stats implementations.
+
+Runs each implementation of the stats query for the same filter with every cache
+bypassed and reports the median bytes processed and billed, slot time, job time,
+download time and end-to-end latency, then checks that the implementations return the
+same stats.
+
+    python -m bigquery.dimensions.stats_benchmark --filter '{"dateRange": {"from": "2015-01-01"}}'
+    python -m bigquery.dimensions.stats_benchmark --snapshot snapshot/ --repeats 5
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from ..bq import BigQuery
+from ..parity import DATASET, DATASET_NAME, compare_frames
+from .analytics.publication_analytics import GROUPING_SETS_FACETS, STATS_IMPLEMENTATIONS, PublicationAnalytics
+
+# leaderboards cut at a fixed length may break ties differently between implementations
+TRUNCATED_COLUMNS = {column for column, *_, limit in GROUPING_SETS_FACETS if limit}
+
+
+def benchmark(
+    bq: BigQuery,
+    dataset_name: str,
+    filters: Dict[str, Any],
+    implementations: Optional[List[str]] = None,
+    repeats: int = 3
+) -> pd.DataFrame:
+    """One row per implementation with the median cost over `repeats` runs"""
+    analytics = PublicationAnalytics(bq)
+    implementations = implementations or list(STATS_IMPLEMENTATIONS)
+    where_clause, params = analytics.build_where_clause(filters)
+
+    rows = []
+    results = {}
+    for name in implementations:
+        query = STATS_IMPLEMENTATIONS[name](analytics, dataset_name, where_clause)
+        runs = []
+        for _ in range(repeats):
+            frame, stats = bq.profile(dataset_name, query, params)
+            runs.append(stats)
+        results[name] = frame
+
+        row = {'implementation': name, 'rows': runs[-1]['rows']}
+        for metric in ('bytes_processed', 'bytes_billed', 'slot_ms', 'job_ms', 'download_ms', 'latency_ms'):
+            values = [run[metric] for run in runs if run[metric] is not None]
+            row[metric] = statistics.median(values) if values else None
+        rows.append(row)
+
+    reference = implementations[0]
+    report = pd.DataFrame(rows)
+    report['matches_' + reference] = [
+        not compare_frames(results[reference], results[name], TRUNCATED_COLUMNS) for name in implementations
+    ]
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', default='{}', help='dashboard filter as JSON')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--implementations', nargs='+', choices=list(STATS_IMPLEMENTATIONS))
+    parser.add_argument('--snapshot', help='run on the local DuckDB engine over this Parquet snapshot')
+    args = parser.parse_args(argv)
+
+    bq = BigQuery(use_cache=False)
+    if args.snapshot:
+        bq.add_dataset(name=DATASET_NAME, **DATASET, engine='duckdb', snapshot_path=args.snapshot)
+    else:
+        bq.add_dataset(name=DATASET_NAME, **DATASET)
+
+    with redirect_stdout(io.StringIO()):
+        report = benchmark(bq, DATASET_NAME, json.loads(args.filter), args.implementations, args.repeats)
+    print(report.to_string(index=False))
+    return 0 if report.iloc[:, -1].all() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
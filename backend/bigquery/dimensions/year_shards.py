@@ -0,0 +1,139 @@
+"""
+Per-year result shards for analyses whose rows are computed independently per year.
+
+A result is split into one shard per publication year, keyed on the filter without its
+date range plus the part of the date range that falls inside that year. Widening or
+sliding the date window reuses the shards already cached; the missing years are
+computed together in a single job restricted with the `years` filter and stored
+back as shards. Past years are cached much longer than the current year, which is
+the only one that normally changes.
+
+Shards are split on the `year` column of the result and selected with the year of
+`date_normal`, so an analysis is only shardable if its rows are grouped that way.
+A filter without an upper bound ends in an open shard holding every year after the
+current one (selected with `yearsFrom`), cached like the current year.
+"""
+import datetime
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ..cache import QueryCache
+from utils.canonical_filter import canonicalize_filter
+
+SHARD_KEY_PREFIX = 'year-shard-'
+# part of every shard key; bump it when the columns of a sharded query change
+SHARD_VERSION = 3
+
+
+def shard_ranges(filters: Dict[str, Any], today: Optional[datetime.date] = None) -> Optional[List[Tuple[int, str, Optional[str]]]]:
+    """
+    (year, from, to) for every year the filter's date range touches, with the range
+    clamped to that year, or None when the filter cannot be sharded (no lower bound
+    or an explicit `years` restriction).
+
+    Without an upper bound the years up to the current one get a shard each and a
+    last, open shard (`to` None) covers every later year, so forthcoming
+    publications dated in the future are kept.
+    """
+    filters = canonicalize_filter(filters)
+    date_range = filters.get('dateRange', {})
+    if 'years' in filters or 'yearsFrom' in filters or not date_range.get('from'):
+        return None
+    try:
+        date_from = datetime.date.fromisoformat(date_range['from'])
+        date_to = datetime.date.fromisoformat(date_range['to']) if date_range.get('to') else None
+    except ValueError:
+        return None
+    if date_to is not None and date_to < date_from:
+        return []
+
+    last_year = date_to.year if date_to is not None else (today or datetime.date.today()).year
+    ranges = []
+    for year in range(date_from.year, last_year + 1):
+        start = max(date_from, datetime.date(year, 1, 1))
+        end = min(date_to, datetime.date(year, 12, 31)) if date_to is not None else datetime.date(year, 12, 31)
+        ranges.append((year, start.isoformat(), end.isoformat()))
+    if date_to is None:
+        rest_year = max(date_from.year, last_year + 1)
+        ranges.append((rest_year, max(date_from, datetime.date(rest_year, 1, 1)).isoformat(), None))
+    return ranges
+
+
+class YearShardCache:
+    def __init__(
+        self,
+        cache: QueryCache,
+        current_year_ttl: float = 60 * 60,
+        past_year_ttl: float = 7 * 24 * 60 * 60
+    ):
+        self.cache = cache
+        self.current_year_ttl = current_year_ttl
+        self.past_year_ttl = past_year_ttl
+
+    @staticmethod
+    def key(table_path: str, analysis: str, filters: Dict[str, Any], year: int, date_from: str, date_to: Optional[str]) -> str:
+        scope = {k: v for k, v in canonicalize_filter(filters).items() if k != 'dateRange'}
+        payload = {
+            'table': table_path,
+            'analysis': analysis,
+            'filters': scope,
+            'year': year,
+            'from': date_from,
+            'to': date_to,
+            'version': SHARD_VERSION
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str)
+        return SHARD_KEY_PREFIX + hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _ttl(self, year: int) -> float:
+        return self.current_year_ttl if year >= datetime.date.today().year else self.past_year_ttl
+
+    @staticmethod
+    def _rows(computed: pd.DataFrame, year: int, open_ended: bool) -> pd.DataFrame:
+        in_shard = computed['year'] >= year if open_ended else computed['year'] == year
+        return computed[in_shard].reset_index(drop=True)
+
+    def fetch(
+        self,
+        table_path: str,
+        analysis: str,
+        filters: Dict[str, Any],
+        run: Callable[[Dict[str, Any]], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """
+        Per-year rows for the filter, assembled from cached shards. `run` computes the
+        rows for a filter and is called at most once, for the years that are missing.
+        """
+        ranges = shard_ranges(filters)
+        if not ranges:
+            return run(filters)
+
+        shards: Dict[int, Optional[pd.DataFrame]] = {}
+        keys = {}
+        for year, date_from, date_to in ranges:
+            keys[year] = self.key(table_path, analysis, filters, year, date_from, date_to)
+            shards[year] = self.cache.get(keys[year])
+
+        open_year = next((year for year, _, date_to in ranges if date_to is None), None)
+        missing = [year for year, shard in shards.items() if shard is None]
+        if missing:
+            print(f"Year shards for {analysis}: {len(ranges) - len(missing)} cached, computing {missing}")
+            job_filters = {**filters, 'years': [year for year in missing if year != open_year]}
+            if open_year in missing:
+                job_filters['yearsFrom'] = open_year
+            computed = run(job_filters)
+            for year in missing:
+                shard = self._rows(computed, year, open_ended=year == open_year)
+                self.cache.put(keys[year], shard, ttl=self._ttl(year))
+                shards[year] = shard
+        else:
+            print(f"Year shards for {analysis}: all {len(ranges)} years cached")
+
+        frames = [shards[year] for year, _, _ in ranges]
+        non_empty = [frame for frame in frames if len(frame)]
+        if not non_empty:
+            return frames[0].iloc[0:0]
+        return pd.concat(non_empty, ignore_index=True)
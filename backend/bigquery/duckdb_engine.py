@@ -0,0 +1,246 @@
+import datetime
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Any
+
+import duckdb
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+
+
+def _unnested_name(name: str) -> str:
+    return f"{name}__element"
+
+
+def _slice(array: exp.Expression, limit: exp.Expression) -> exp.Expression:
+    return exp.Anonymous(this='list_slice', expressions=[array, exp.Literal.number(1), limit])
+
+
+def _drop_nulls(array: exp.Expression) -> exp.Expression:
+    """list_filter(array, x -> x IS NOT NULL), matching BigQuery aggregates that skip NULLs"""
+    lambda_ = exp.Lambda(
+        this=exp.Not(this=exp.Is(this=exp.column('x'), expression=exp.Null())),
+        expressions=[exp.to_identifier('x')]
+    )
+    return exp.Anonymous(this='list_filter', expressions=[array, lambda_])
+
+
+def _rewrite_limited_aggregates(node: exp.Expression) -> exp.Expression:
+    """
+    BigQuery allows `ARRAY_AGG(x ORDER BY y LIMIT n)` and `STRING_AGG(x, sep ORDER BY y LIMIT n)`;
+    DuckDB has no LIMIT inside aggregates, so aggregate into an ordered list and slice it.
+    """
+    if isinstance(node, exp.ArrayAgg) and isinstance(node.this, exp.Limit):
+        limit = node.this
+        return _slice(exp.ArrayAgg(this=limit.this), limit.expression)
+
+    if isinstance(node, exp.GroupConcat) and isinstance(node.this, exp.Limit):
+        limit = node.this
+        separator = node.args.get('separator') or exp.Literal.string(',')
+        aggregated = _drop_nulls(exp.ArrayAgg(this=limit.this))
+        return exp.Anonymous(
+            this='array_to_string',
+            expressions=[_slice(aggregated, limit.expression), separator]
+        )
+    return node
+
+
+def _rewrite_shadowing_unnest(select: exp.Select) -> None:
+    """
+    `FROM t, UNNEST(authors) AS authors` shadows the `authors` column in BigQuery; DuckDB
+    reports the reference as ambiguous. Rename the range variable and every reference to it
+    in the same SELECT.
+    """
+    renamed = {}
+    for unnest in select.find_all(exp.Unnest):
+        if unnest.parent_select is not select:
+            continue
+        alias = unnest.args.get('alias')
+        source = unnest.expressions[0] if unnest.expressions else None
+        if not alias or not isinstance(source, exp.Column) or source.table:
+            continue
+        # the BigQuery parser stores `UNNEST(x) AS y` as a column alias
+        identifiers = alias.args.get('columns') or []
+        name = identifiers[0].name if identifiers else alias.name
+        if name != source.name:
+            continue
+        new_name = _unnested_name(name)
+        if identifiers:
+            alias.set('columns', [exp.to_identifier(new_name)])
+        else:
+            alias.set('this', exp.to_identifier(new_name))
+        renamed[source.name] = (new_name, unnest)
+
+    if not renamed:
+        return
+
+    for column in select.find_all(exp.Column):
+        if column.parent_select is not select:
+            continue
+        if any(column is u.expressions[0] for _, u in renamed.values()):
+            continue
+        if column.table in renamed:
+            column.set('table', exp.to_identifier(renamed[column.table][0]))
+        elif not column.table and column.name in renamed:
+            column.set('this', exp.to_identifier(renamed[column.name][0]))
+
+
+def _rewrite_unnest_offset(select: exp.Select) -> None:
+    """
+    `UNNEST(x) WITH OFFSET AS i` counts from 0 in BigQuery, but it becomes
+    `WITH ORDINALITY`, which counts from 1 in DuckDB. Rename the ordinality column and
+    read every reference to the offset as ordinality - 1.
+    """
+    offsets = {}
+    for unnest in select.find_all(exp.Unnest):
+        offset = unnest.args.get('offset')
+        if unnest.parent_select is not select or not isinstance(offset, exp.Identifier):
+            continue
+        ordinality = f"{offset.name}_ordinality"
+        unnest.set('offset', exp.to_identifier(ordinality))
+        offsets[offset.name] = ordinality
+
+    for column in list(select.find_all(exp.Column)):
+        if column.parent_select is select and not column.table and column.name in offsets:
+            column.replace(exp.paren(exp.Sub(this=exp.column(offsets[column.name]), expression=exp.Literal.number(1))))
+
+
+def _rewrite_struct_unnest(node: exp.Expression) -> exp.Expression:
+    """
+    An un-aliased `FROM UNNEST(structs)` exposes the struct fields as columns in BigQuery.
+    DuckDB does the same for `SELECT UNNEST(structs, recursive := true)`.
+    """
+    if not isinstance(node, exp.From) or not isinstance(node.this, exp.Unnest):
+        return node
+    unnest = node.this
+    if unnest.args.get('alias') or len(unnest.expressions) != 1:
+        return node
+    recursive = exp.Anonymous(
+        this='UNNEST',
+        expressions=[
+            unnest.expressions[0].copy(),
+            exp.PropertyEQ(this=exp.to_identifier('recursive'), expression=exp.true())
+        ]
+    )
+    return exp.From(this=exp.Subquery(this=exp.select(recursive)))
+
+
+def _rewrite_farm_fingerprint(node: exp.Expression) -> exp.Expression:
+    """
+    DuckDB has no FARM_FINGERPRINT; map its unsigned 64-bit hash() onto the signed INT64
+    range instead. The values differ from BigQuery's, only their distribution matches.
+    """
+    if not isinstance(node, exp.FarmFingerprint):
+        return node
+    hashed = exp.cast(exp.Anonymous(this='hash', expressions=[e.copy() for e in node.expressions]), 'HUGEINT')
+    shifted = exp.Sub(this=hashed, expression=exp.Literal.number(2 ** 63))
+    return exp.cast(exp.Paren(this=shifted), 'BIGINT')
+
+
+@lru_cache(maxsize=512)
+def translate(query: str, tables: tuple) -> str:
+    """
+    Translate a BigQuery Standard SQL query into DuckDB SQL.
+
+    `tables` maps fully qualified BigQuery table paths to DuckDB relation names, as a
+    tuple of (path, relation) pairs so the translation can be memoized. Parameters keep
+    their names (`@name` becomes `$name`).
+    """
+    table_map = dict(tables)
+    tree = sqlglot.parse_one(query, read='bigquery')
+
+    for table in tree.find_all(exp.Table):
+        path = '.'.join(part.name for part in table.parts)
+        if path in table_map:
+            replacement = exp.to_table(table_map[path])
+            alias = table.args.get('alias')
+            if alias:
+                replacement.set('alias', alias)
+            table.replace(replacement)
+
+    for select in list(tree.find_all(exp.Select)):
+        _rewrite_shadowing_unnest(select)
+        _rewrite_unnest_offset(select)
+    tree = tree.transform(_rewrite_limited_aggregates)
+    tree = tree.transform(_rewrite_struct_unnest)
+    tree = tree.transform(_rewrite_farm_fingerprint)
+    return tree.sql(dialect='duckdb')
+
+
+def _parameter_value(param: Any) -> Any:
+    if hasattr(param, 'values'):
+        return list(param.values)
+    value = param.value
+    if param.type_ == 'DATE' and isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+class DuckDBEngine:
+    """
+    Runs BigQuery-dialect analytics queries locally with DuckDB over Parquet snapshots.
+
+    Each registered dataset becomes a view over its snapshot (a single Parquet file or a
+    directory of them); queries that reference the dataset's BigQuery path are translated
+    to DuckDB SQL and run against that view.
+    """
+
+    def __init__(self, database: str = ':memory:'):
+        self.connection = duckdb.connect(database)
+        self.relations: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, full_path: str, snapshot_path: str) -> None:
+        """Expose a Parquet snapshot as a view standing in for `full_path`"""
+        source = snapshot_path
+        if os.path.isdir(snapshot_path):
+            source = os.path.join(snapshot_path, '**', '*.parquet')
+        relation = f"dataset_{name}"
+        escaped = source.replace("'", "''")
+        with self._lock:
+            self.connection.execute(
+                f"CREATE OR REPLACE VIEW {relation} AS "
+                f"SELECT * FROM read_parquet('{escaped}', hive_partitioning = false, union_by_name = true)"
+            )
+            self.relations[full_path] = relation
+
+    def translate(self, query: str) -> str:
+        return translate(query, tuple(sorted(self.relations.items())))
+
+    def query(self, query: str, params: Optional[List[Any]] = None) -> pd.DataFrame:
+        translated = self.translate(query)
+        values = {p.name: _parameter_value(p) for p in (params or [])}
+        cursor = self.connection.cursor()
+        try:
+            return cursor.execute(translated, values).df()
+        finally:
+            cursor.close()
+
+    def script(self, statements: List[str], params: Optional[List[Any]] = None) -> List[Optional[pd.DataFrame]]:
+        """
+        Run statements in order on one connection, so temp tables are shared, and return
+        a DataFrame per SELECT statement, None for the others.
+        """
+        values = {p.name: _parameter_value(p) for p in (params or [])}
+        cursor = self.connection.cursor()
+        try:
+            results = []
+            for statement in statements:
+                translated = self.translate(statement)
+                used = {k: v for k, v in values.items() if re.search(rf"\${k}\b", translated)}
+                cursor.execute(translated, used)
+                is_select = isinstance(sqlglot.parse_one(statement, read='bigquery'), (exp.Select, exp.SetOperation))
+                results.append(cursor.df() if is_select else None)
+            return results
+        finally:
+            cursor.close()
+
+    def describe(self, full_path: str) -> pd.DataFrame:
+        cursor = self.connection.cursor()
+        try:
+            return cursor.execute(f"DESCRIBE {self.relations[full_path]}").df()
+        finally:
+            cursor.close()
@@ -0,0 +1,395 @@
+"""
+Parity suite for the DuckDB engine.
+
+The parity check proper: `record` runs every DimensionsAnalytics analysis for a set
+of representative filters against BigQuery and stores the results as Parquet fixtures.
+`check` replays the same cases on the local engine over a Parquet snapshot and reports
+any differences. Record the fixtures from the same table state the snapshot was
+exported from. This needs BigQuery credentials and is the only check here that shows
+the engine returns what BigQuery does.
+
+    python -m bigquery.parity record --fixtures parity_fixtures
+    python -m bigquery.parity check --fixtures parity_fixtures --snapshot snapshot/
+
+Two offline checks run without credentials. `translate` runs BigQuery constructs the
+engine rewrites (shadowing UNNEST aliases, WITH OFFSET, SAFE_OFFSET, COUNTIF, QUALIFY,
+aggregates with LIMIT, FARM_FINGERPRINT) on DuckDB against values known from BigQuery's
+semantics. The committed fixtures in parity_fixtures/ hold a small synthetic snapshot
+(written by `synthesize`) and the local engine's own outputs over it (`record
+--snapshot`), not BigQuery's: `check` against them is a DuckDB-against-DuckDB
+regression test that catches changes in what the engine returns, not a parity check.
+
+    python -m bigquery.parity translate
+    python -m bigquery.parity check --fixtures bigquery/parity_fixtures/expected \\
+        --snapshot bigquery/parity_fixtures/snapshot.parquet
+"""
+import argparse
+import datetime
+import io
+import json
+import math
+import os
+import random
+import sys
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .bq import BigQuery
+from .dimensions import DimensionsAnalytics
+from .duckdb_engine import translate
+
+DATASET_NAME = 'publications'
+DATASET = {
+    'project_id': 'ucsd-discover',
+    'dataset': 'dimensions',
+    'table': 'ucsd_publications',
+    'billing_project_id': 'ucsd-discover'
+}
+
+FILTER_CASES = {
+    'recent_years': {'dateRange': {'from': '2020-01-01', 'to': '2023-12-31'}},
+    'articles_in_fields': {
+        'dateRange': {'from': '2015-01-01', 'to': '2023-12-31'},
+        'type': ['RESEARCH_ARTICLE', 'REVIEW_ARTICLE'],
+        'fields': ['Biomedical And Clinical Sciences', 'Engineering']
+    },
+    'open_access_search': {
+        'dateRange': {'from': '2018-01-01', 'to': '2023-12-31'},
+        'openAccess': True,
+        'search_query': 'climate'
+    },
+    'citations_and_exclusions': {
+        'dateRange': {'from': '2010-01-01', 'to': '2023-12-31'},
+        'citationCount': {'min': 10},
+        'excludeFields': ['Engineering'],
+        'preprints': {'exclude': True}
+    }
+}
+
+# columns whose BigQuery value is not deterministic (STRING_AGG ... LIMIT without ORDER BY)
+NONDETERMINISTIC_COLUMNS = {
+    'researcher_productivity': {'top_journals', 'field_names'},
+    'research_trends': {'top_concepts'},
+    'collaborations': {'field_names'},
+    'funding_patterns': {'field_names'},
+    'data_repositories': {'field_names'},
+    'institutional_impact': {'field_distribution'}
+}
+
+
+# BigQuery queries the engine has to rewrite, and the rows BigQuery returns for them
+TRANSLATION_CASES = [
+    (
+        'unnest_shadowing_column',
+        "WITH t AS (SELECT 1 AS id, ['b', 'a'] AS authors) "
+        "SELECT id, authors FROM t, UNNEST(authors) AS authors ORDER BY authors",
+        [(1, 'a'), (1, 'b')]
+    ),
+    (
+        'unnest_with_offset',
+        "SELECT x, i FROM UNNEST(['a', 'b', 'c']) AS x WITH OFFSET AS i WHERE i > 0 ORDER BY i",
+        [('b', 1), ('c', 2)]
+    ),
+    (
+        'safe_offset',
+        "SELECT [10, 20][SAFE_OFFSET(1)] AS second, [10, 20][SAFE_OFFSET(5)] AS missing",
+        [(20, None)]
+    ),
+    (
+        'countif',
+        "SELECT COUNTIF(x > 1) AS n, COUNTIF(x IS NULL) AS nulls FROM UNNEST([1, 2, 3, NULL]) AS x",
+        [(2, 1)]
+    ),
+    (
+        'qualify',
+        "WITH t AS (SELECT 'a' AS g, 1 AS v UNION ALL SELECT 'a', 2 UNION ALL SELECT 'b', 3) "
+        "SELECT g, v FROM t WHERE TRUE QUALIFY ROW_NUMBER() OVER (PARTITION BY g ORDER BY v DESC) = 1 ORDER BY g",
+        [('a', 2), ('b', 3)]
+    ),
+    (
+        'string_agg_limit',
+        "SELECT STRING_AGG(x, ', ' ORDER BY x LIMIT 2) AS s FROM UNNEST(['c', NULL, 'a', 'b']) AS x",
+        [('a, b',)]
+    ),
+    (
+        'array_agg_limit',
+        "SELECT ARRAY_AGG(x ORDER BY x DESC LIMIT 2) AS top FROM UNNEST([1, 3, 2]) AS x",
+        [([3, 2],)]
+    ),
+    (
+        'struct_unnest',
+        "SELECT name, n FROM UNNEST([STRUCT('x' AS name, 1 AS n), STRUCT('y' AS name, 2 AS n)]) ORDER BY n",
+        [('x', 1), ('y', 2)]
+    ),
+    (
+        # the values differ from BigQuery's; only determinism and the INT64 range carry over
+        'farm_fingerprint',
+        "SELECT FARM_FINGERPRINT('a') = FARM_FINGERPRINT('a') AS stable, "
+        "FARM_FINGERPRINT('a') != FARM_FINGERPRINT('b') AS distinct_values, "
+        "FARM_FINGERPRINT('a') BETWEEN -9223372036854775807 - 1 AND 9223372036854775807 AS in_range",
+        [(True, True, True)]
+    )
+]
+
+
+def _normalize(value: Any, digits: int) -> Any:
+    """Reduce a cell to plain, comparable Python values"""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        items = [_normalize(v, digits) for v in value]
+        return sorted(items, key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    if isinstance(value, dict):
+        return {k: _normalize(v, digits) for k, v in value.items()}
+    if isinstance(value, (np.generic,)):
+        value = value.item()
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return round(float(value), digits)
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return value.isoformat()[:10]
+    return value
+
+
+def compare_frames(
+    expected: pd.DataFrame,
+    actual: pd.DataFrame,
+    ignore_columns: Optional[set] = None,
+    digits: int = 3
+) -> List[str]:
+    """Compare two results as multisets of normalized rows, returning human readable differences"""
+    ignore_columns = ignore_columns or set()
+    problems = []
+
+    missing = set(expected.columns) - set(actual.columns)
+    extra = set(actual.columns) - set(expected.columns)
+    if missing:
+        problems.append(f"missing columns: {sorted(missing)}")
+    if extra:
+        problems.append(f"unexpected columns: {sorted(extra)}")
+    if len(expected) != len(actual):
+        problems.append(f"row count {len(actual)} != expected {len(expected)}")
+
+    columns = [c for c in expected.columns if c in actual.columns and c not in ignore_columns]
+
+    def rows(df: pd.DataFrame) -> List[str]:
+        return sorted(
+            json.dumps({c: _normalize(v, digits) for c, v in zip(columns, values)}, sort_keys=True, default=str)
+            for values in df[columns].itertuples(index=False, name=None)
+        )
+
+    expected_rows, actual_rows = rows(expected), rows(actual)
+    if expected_rows != actual_rows:
+        only_expected = [r for r in expected_rows if r not in set(actual_rows)]
+        only_actual = [r for r in actual_rows if r not in set(expected_rows)]
+        problems.append(
+            f"{len(only_expected)} expected rows not matched, {len(only_actual)} unexpected rows"
+        )
+        for row in only_expected[:3]:
+            problems.append(f"  expected: {row[:300]}")
+        for row in only_actual[:3]:
+            problems.append(f"  actual:   {row[:300]}")
+    return problems
+
+
+def _cases(analytics: DimensionsAnalytics):
+    for filter_name, filters in FILTER_CASES.items():
+        for analysis_name, analysis in analytics.analyses.items():
+            yield f"{analysis_name}__{filter_name}", analysis_name, analysis, filters
+        yield f"publications__{filter_name}", 'publications', analytics.publication_analytics.get_publications, {
+            **filters, 'page': 2, 'per_page': 10
+        }
+
+
+def _run(analysis, filters: Dict[str, Any]) -> pd.DataFrame:
+    with redirect_stdout(io.StringIO()):
+        return analysis(DATASET_NAME, json.loads(json.dumps(filters)))
+
+
+def record(fixtures_dir: str, snapshot_path: Optional[str] = None) -> None:
+    """Record every case from BigQuery, or from the local engine over `snapshot_path`"""
+    bq = BigQuery(use_cache=False)
+    if snapshot_path:
+        bq.add_dataset(name=DATASET_NAME, **DATASET, engine='duckdb', snapshot_path=snapshot_path)
+    else:
+        bq.add_dataset(name=DATASET_NAME, **DATASET)
+    analytics = DimensionsAnalytics(bq)
+    os.makedirs(fixtures_dir, exist_ok=True)
+
+    manifest = {
+        'recorded_at': datetime.datetime.utcnow().isoformat(),
+        'engine': 'duckdb' if snapshot_path else 'bigquery',
+        'cases': {}
+    }
+    for case, analysis_name, analysis, filters in _cases(analytics):
+        result = _run(analysis, filters)
+        result.to_parquet(os.path.join(fixtures_dir, f"{case}.parquet"), index=False)
+        manifest['cases'][case] = {'analysis': analysis_name, 'filters': filters, 'rows': len(result)}
+        print(f"recorded {case}: {len(result)} rows")
+
+    with open(os.path.join(fixtures_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def check(fixtures_dir: str, snapshot_path: str) -> bool:
+    bq = BigQuery(use_cache=False)
+    bq.add_dataset(name=DATASET_NAME, **DATASET, engine='duckdb', snapshot_path=snapshot_path)
+    analytics = DimensionsAnalytics(bq)
+
+    with open(os.path.join(fixtures_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    if manifest.get('engine') == 'duckdb':
+        print("Fixtures were recorded by the local engine: this is a regression check, not BigQuery parity\n")
+
+    failures = 0
+    for case, analysis_name, analysis, filters in _cases(analytics):
+        if case not in manifest['cases']:
+            continue
+        expected = pd.read_parquet(os.path.join(fixtures_dir, f"{case}.parquet"))
+        try:
+            actual = _run(analysis, filters)
+            problems = compare_frames(expected, actual, NONDETERMINISTIC_COLUMNS.get(analysis_name))
+        except Exception as e:
+            problems = [f"error: {str(e).splitlines()[0]}"]
+        status = 'ok' if not problems else 'FAIL'
+        print(f"{status:4} {case}")
+        for problem in problems:
+            print(f"     {problem}")
+        failures += bool(problems)
+
+    print(f"\n{len(manifest['cases']) - failures}/{len(manifest['cases'])} cases match")
+    return failures == 0
+
+
+def check_translations() -> bool:
+    """Run TRANSLATION_CASES on an in-memory DuckDB and report the ones that differ"""
+    import duckdb
+
+    connection = duckdb.connect()
+    failures = 0
+    for name, query, expected in TRANSLATION_CASES:
+        try:
+            actual = [tuple(row) for row in connection.execute(translate(query, ())).fetchall()]
+            problems = [] if actual == expected else [f"expected {expected}, got {actual}"]
+        except Exception as e:
+            problems = [f"error: {str(e).splitlines()[0]}"]
+        status = 'ok' if not problems else 'FAIL'
+        print(f"{status:4} {name}")
+        for problem in problems:
+            print(f"     {problem}")
+        failures += bool(problems)
+
+    print(f"\n{len(TRANSLATION_CASES) - failures}/{len(TRANSLATION_CASES)} translations match")
+    return failures == 0
+
+
+def synthesize(path: str, rows: int = 300, seed: int = 7) -> None:
+    """Write a synthetic publications snapshot with every column the analyses read"""
+    rng = random.Random(seed)
+    concepts = ['climate', 'protein', 'cancer', 'neural network', 'ocean', 'policy', 'gene', 'quantum']
+    fields = ['Biomedical And Clinical Sciences', 'Biological Sciences', 'Engineering', 'Earth Sciences']
+    doc_types = ['RESEARCH_ARTICLE', 'REVIEW_ARTICLE', 'CONFERENCE_PAPER', 'EDITORIAL']
+    journals = ['Nature', 'Cell', 'PNAS']
+
+    publications = []
+    for i in range(rows):
+        date = datetime.date(2010, 1, 1) + datetime.timedelta(days=rng.randint(0, 5100))
+        journal = rng.choice(journals)
+        publications.append({
+            'id': f"pub.{i}",
+            'year': date.year,
+            'date_normal': date,
+            'title': {'preferred': f"A study of {rng.choice(concepts)} {i}"},
+            'abstract': {'preferred': f"We study {rng.choice(concepts)} and {rng.choice(concepts)}."
+                         if rng.random() < 0.8 else None},
+            'document_type': {'classification': rng.choice(doc_types)},
+            'citations_count': rng.choice([None, 0, 1, 5, 20, 60, 100]),
+            'metrics': {
+                'field_citation_ratio': round(rng.random() * 3, 2),
+                'relative_citation_ratio': round(rng.random() * 2, 2),
+                'recent_citations': rng.randint(0, 10)
+            },
+            'altmetrics': {'score': round(rng.random() * 50, 1)},
+            'concepts': [{'concept': c, 'relevance': round(rng.random(), 2)} for c in rng.sample(concepts, 3)],
+            'pubmed': {'mesh': {'terms': rng.sample(['Humans', 'Mice', 'Adult'], 2)}},
+            'categories': {
+                'sdg_v2021': {'full': [{'code': '3', 'name': 'Good Health'}] if rng.random() < 0.5 else []},
+                'for_2020_v2022': {'first_level': {'full': [{'name': f} for f in rng.sample(fields, rng.randint(1, 2))]}}
+            },
+            'research_orgs': rng.sample(['grid.266100.3', 'grid.1', 'grid.2', 'grid.3'], rng.randint(1, 3)),
+            'research_org_countries': rng.sample(['US', 'GB', 'DE', 'CN'], rng.randint(1, 2)),
+            'research_org_country_names': rng.sample(['United States', 'Germany'], 1),
+            'authors': [
+                {
+                    'first_name': rng.choice(['Ann', 'Bob', 'Cy']),
+                    'last_name': rng.choice(['Li', 'Wu', 'Ng']),
+                    'researcher_id': f"ur.{rng.randint(1, 40)}"
+                }
+                for _ in range(rng.randint(1, 5))
+            ],
+            'citations': [{'id': f"pub.{rng.randint(0, rows)}"} for _ in range(rng.randint(0, 4))],
+            'clinical_trial_ids': [],
+            'patent_ids': ['p1'] if rng.random() < 0.1 else [],
+            'funding_details': [
+                {'grant_id': f"g{rng.randint(1, 30)}", 'grid_id': rng.choice(['grid.nih', 'grid.nsf'])}
+                for _ in range(rng.randint(1, 2))
+            ],
+            'repository_dois': ['10.5061/x'] if rng.random() < 0.2 else [],
+            'open_access_categories': ['gold'] if rng.random() < 0.4 else [],
+            'open_access_categories_v2': ['gold'] if rng.random() < 0.4 else [],
+            'funder_orgs': rng.sample(['grid.nih', 'grid.nsf'], 1),
+            'source': {'title': journal},
+            'journal': {'id': f"j{journals.index(journal)}", 'title': journal},
+            'publisher': {'name': rng.choice(['Springer', 'Elsevier', None])},
+            'doi': f"10.1/{i}" if rng.random() < 0.9 else None,
+            'arxiv_id': None,
+            'journal_lists': ['DOAJ'] if rng.random() < 0.3 else []
+        })
+    pq.write_table(pa.Table.from_pylist(publications), path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='record BigQuery outputs as fixtures (the real parity baseline)')
+    record_parser.add_argument('--fixtures', required=True)
+    record_parser.add_argument(
+        '--snapshot',
+        help='record from the local engine over this snapshot instead, for a regression baseline only'
+    )
+    check_parser = subparsers.add_parser(
+        'check',
+        help='compare the DuckDB engine against recorded fixtures; parity only if they were recorded from BigQuery'
+    )
+    check_parser.add_argument('--fixtures', required=True)
+    check_parser.add_argument('--snapshot', required=True)
+    subparsers.add_parser('translate', help='check BigQuery-to-DuckDB translations without credentials')
+    synthesize_parser = subparsers.add_parser('synthesize', help='write a synthetic publications snapshot')
+    synthesize_parser.add_argument('--out', required=True)
+    synthesize_parser.add_argument('--rows', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(args.fixtures, args.snapshot)
+        return 0
+    if args.command == 'synthesize':
+        synthesize(args.out, args.rows)
+        return 0
+    if args.command == 'translate':
+        return 0 if check_translations() else 1
+    return 0 if check(args.fixtures, args.snapshot) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Single-flight coalescing of identical in-flight queries.
+
+When the same dashboard filter arrives from several tabs at once, every request
+misses the result cache before the first job has finished and would start its own
+job. SingleFlight lets the first caller for a key run the work while later callers
+for the same key block until it finishes and share its result (or its exception).
+Nothing is kept once the call completes; that is the result cache's job.
+"""
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._counters = {'executions': 0, 'coalesced': 0, 'failures': 0}
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        fn's result, running fn only if no call for `key` is already in flight.
+        The flag is True when the result is shared with other callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['executions'] += 1
+            else:
+                call.waiters += 1
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._counters['failures'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters > 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = len(self._calls)
+        requests = counters['executions'] + counters['coalesced']
+        return {
+            **counters,
+            'coalesced_rate': round(counters['coalesced'] / requests, 4) if requests else 0.0,
+            'in_flight': in_flight
+        }
+
+
+_default_singleflight: Optional[SingleFlight] = None
+_default_singleflight_lock = threading.Lock()
+
+
+def get_default_singleflight() -> SingleFlight:
+    """Process-wide instance, so identical queries coalesce across BigQuery instances"""
+    global _default_singleflight
+    with _default_singleflight_lock:
+        if _default_singleflight is None:
+            _default_singleflight = SingleFlight()
+        return _default_singleflight
@@ -0,0 +1,259 @@
+"""
+Incremental local mirror of a BigQuery table as a year-partitioned Parquet dataset.
+
+The first run exports the whole table through the BigQuery Storage Read API using
+several parallel streams. Later runs only read rows whose watermark column is newer
+than the last sync, and rewrite just the partitions those rows touch. Every run leaves
+a `_manifest.json` with per-partition row counts, the schema hash and the watermark.
+Rows deleted upstream are only dropped by a full re-export (`--full`).
+
+    python -m bigquery.sync --output snapshot/
+    python -m bigquery.sync --output snapshot/ --full --streams 16
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from google.cloud import bigquery_storage_v1
+from google.cloud.bigquery_storage_v1 import types
+
+from .bq import BigQuery
+
+MANIFEST_NAME = '_manifest.json'
+NULL_PARTITION = '__null__'
+
+
+def schema_hash(schema: pa.Schema) -> str:
+    """Hash of the column names and types, ignoring schema metadata"""
+    description = schema.remove_metadata().to_string(show_field_metadata=False)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+class ParquetMirror:
+    def __init__(
+        self,
+        bq: BigQuery,
+        dataset_name: str,
+        output_dir: str,
+        partition_column: str = 'year',
+        id_column: str = 'id',
+        watermark_column: str = 'date_inserted',
+        max_streams: int = 8
+    ):
+        self.bq = bq
+        self.dataset = bq.datasets[dataset_name]
+        self.output_dir = output_dir
+        self.partition_column = partition_column
+        self.id_column = id_column
+        self.watermark_column = watermark_column
+        self.max_streams = max_streams
+
+        credentials = bq.clients[self.dataset.billing_project_id]._credentials
+        self.read_client = bigquery_storage_v1.BigQueryReadClient(credentials=credentials)
+
+    # reading
+
+    def _read_table(self, row_restriction: Optional[str] = None) -> Optional[pa.Table]:
+        """Read (a filtered slice of) the table as Arrow, one thread per read stream"""
+        read_options = types.ReadSession.TableReadOptions(row_restriction=row_restriction or '')
+        session = self.read_client.create_read_session(
+            parent=f"projects/{self.dataset.billing_project_id}",
+            read_session=types.ReadSession(
+                table=f"projects/{self.dataset.project_id}/datasets/{self.dataset.dataset}/tables/{self.dataset.table}",
+                data_format=types.DataFormat.ARROW,
+                read_options=read_options
+            ),
+            max_stream_count=self.max_streams
+        )
+        if not session.streams:
+            return None
+
+        def read_stream(stream) -> pa.Table:
+            return self.read_client.read_rows(stream.name).to_arrow(session)
+
+        print(f"Reading {self.dataset.full_path} with {len(session.streams)} streams"
+              f"{' where ' + row_restriction if row_restriction else ''}")
+        with ThreadPoolExecutor(max_workers=len(session.streams)) as executor:
+            tables = [t for t in executor.map(read_stream, session.streams) if t.num_rows]
+        if not tables:
+            return None
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    # partitions
+
+    def _partition_name(self, key: Any) -> str:
+        return f"{self.partition_column}={NULL_PARTITION if key is None else key}"
+
+    def _split_by_partition(self, table: pa.Table) -> Dict[str, pa.Table]:
+        column = table[self.partition_column]
+        parts = {}
+        for key in pc.unique(column).to_pylist():
+            mask = pc.is_null(column) if key is None else pc.equal(column, key)
+            parts[self._partition_name(key)] = table.filter(mask)
+        return parts
+
+    def _write_partition(self, root: str, name: str, table: pa.Table) -> None:
+        directory = os.path.join(root, name)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, 'part-00000.parquet.tmp')
+        pq.write_table(table, tmp_path, compression='zstd')
+        for file_name in os.listdir(directory):
+            if file_name.endswith('.parquet'):
+                os.remove(os.path.join(directory, file_name))
+        os.replace(tmp_path, os.path.join(directory, 'part-00000.parquet'))
+
+    def _partition_files(self) -> Dict[str, List[str]]:
+        partitions = {}
+        if not os.path.isdir(self.output_dir):
+            return partitions
+        for name in sorted(os.listdir(self.output_dir)):
+            directory = os.path.join(self.output_dir, name)
+            if os.path.isdir(directory) and name.startswith(f"{self.partition_column}="):
+                partitions[name] = sorted(
+                    os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet')
+                )
+        return partitions
+
+    # manifest
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.output_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, mode: str, watermark: Optional[str], table_schema: pa.Schema) -> Dict[str, Any]:
+        partitions = {}
+        for name, files in self._partition_files().items():
+            partitions[name.split('=', 1)[1]] = sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+        manifest = {
+            'table': self.dataset.full_path,
+            'mode': mode,
+            'synced_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'partition_column': self.partition_column,
+            'watermark_column': self.watermark_column,
+            'watermark': watermark,
+            'schema_hash': schema_hash(table_schema),
+            'total_rows': sum(partitions.values()),
+            'partitions': partitions
+        }
+        tmp_path = os.path.join(self.output_dir, MANIFEST_NAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.output_dir, MANIFEST_NAME))
+        return manifest
+
+    def _max_watermark(self, table: pa.Table, previous: Optional[str] = None) -> Optional[str]:
+        value = pc.max(table[self.watermark_column]).as_py()
+        if value is None:
+            return previous
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    # sync
+
+    def sync(self, full: bool = False) -> Dict[str, Any]:
+        """Bring the mirror up to date, exporting everything on the first run or when asked to"""
+        manifest = self.read_manifest()
+        if full or manifest is None or not manifest.get('watermark'):
+            return self._full_export()
+        return self._incremental(manifest)
+
+    def _full_export(self) -> Dict[str, Any]:
+        table = self._read_table()
+        if table is None:
+            raise ValueError(f"{self.dataset.full_path} returned no rows")
+
+        staging = self.output_dir.rstrip(os.sep) + '.staging'
+        shutil.rmtree(staging, ignore_errors=True)
+        for name, part in self._split_by_partition(table).items():
+            self._write_partition(staging, name, part)
+
+        previous = self.output_dir.rstrip(os.sep) + '.previous'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(self.output_dir):
+            os.replace(self.output_dir, previous)
+        os.replace(staging, self.output_dir)
+        shutil.rmtree(previous, ignore_errors=True)
+
+        manifest = self._write_manifest('full', self._max_watermark(table), table.schema)
+        print(f"Exported {manifest['total_rows']} rows into {len(manifest['partitions'])} partitions")
+        return manifest
+
+    def _incremental(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        watermark = manifest['watermark']
+        changed = self._read_table(f"{self.watermark_column} > TIMESTAMP('{watermark}')")
+        if changed is None:
+            print(f"No rows changed since {watermark}")
+            return manifest
+        if schema_hash(changed.schema) != manifest.get('schema_hash'):
+            print("Schema changed since the last sync, running a full export")
+            return self._full_export()
+
+        changed_ids = pc.unique(changed[self.id_column])
+        new_parts = self._split_by_partition(changed)
+        touched = 0
+        for name, files in self._partition_files().items():
+            ids = pa.concat_arrays([
+                pq.read_table(f, columns=[self.id_column])[self.id_column].combine_chunks() for f in files
+            ])
+            if name not in new_parts and not pc.any(pc.is_in(ids, value_set=changed_ids)).as_py():
+                continue
+            existing = pa.concat_tables([pq.read_table(f) for f in files], promote_options='permissive')
+            kept = existing.filter(pc.invert(pc.is_in(existing[self.id_column], value_set=changed_ids)))
+            if name in new_parts:
+                kept = pa.concat_tables([kept, new_parts.pop(name)], promote_options='permissive')
+            self._write_partition(self.output_dir, name, kept)
+            touched += 1
+        for name, part in new_parts.items():
+            self._write_partition(self.output_dir, name, part)
+            touched += 1
+
+        manifest = self._write_manifest('incremental', self._max_watermark(changed, watermark), changed.schema)
+        print(f"Merged {changed.num_rows} changed rows into {touched} partitions")
+        return manifest
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', required=True, help='directory of the Parquet mirror')
+    parser.add_argument('--full', action='store_true', help='re-export the whole table')
+    parser.add_argument('--streams', type=int, default=8, help='maximum parallel read streams')
+    parser.add_argument('--project', default='ucsd-discover')
+    parser.add_argument('--dataset', default='dimensions')
+    parser.add_argument('--table', default='ucsd_publications')
+    parser.add_argument('--billing-project', default='ucsd-discover')
+    parser.add_argument('--watermark-column', default='date_inserted')
+    args = parser.parse_args(argv)
+
+    bq = BigQuery(use_cache=False)
+    bq.add_dataset(
+        name='publications',
+        project_id=args.project,
+        dataset=args.dataset,
+        table=args.table,
+        billing_project_id=args.billing_project
+    )
+    mirror = ParquetMirror(
+        bq,
+        'publications',
+        args.output,
+        watermark_column=args.watermark_column,
+        max_streams=args.streams
+    )
+    manifest = mirror.sync(full=args.full)
+    print(json.dumps({k: v for k, v in manifest.items() if k != 'partitions'}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
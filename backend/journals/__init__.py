@@ -1,6 +1,8 @@
 from flask import Blueprint
+from utils.works_filter import attach_filter_hash
 
 
 journal_data_bp = Blueprint('journal_data', __name__)
+journal_data_bp.after_request(attach_filter_hash)
 
 from .journals_metrics import get_journals_stats
\ No newline at end of file
@@ -1,10 +1,13 @@
 import json
+import os
 from flask import jsonify, request
 import numpy as np
 import pandas as pd
 import requests
 from . import journal_data_bp
-from bigquery.bq import BigQuery
+from utils.canonical_filter import filter_hash
+from utils.serialization import arrow_response, json_response, to_records, wants_arrow
+from bigquery.bq import BigQuery, QueryBudgetExceeded
 from bigquery.dimensions import DimensionsAnalytics
 import datetime
 import asyncio
@@ -16,7 +19,9 @@ bq.add_dataset(
     project_id='ucsd-discover',
     dataset='dimensions',
     table='ucsd_publications',
-    billing_project_id='ucsd-discover'
+    billing_project_id='ucsd-discover',
+    engine=os.environ.get('DISCOVER_PUBLICATIONS_ENGINE', 'bigquery'),
+    snapshot_path=os.environ.get('DISCOVER_PUBLICATIONS_SNAPSHOT')
 )
 analytics = DimensionsAnalytics(bq)
 
@@ -28,26 +33,13 @@ def get_journals_stats():
         
         if 'publication_count' in result.columns:
             result = result.sort_values('publication_count', ascending=False)
-            
-        journals_list = []
-        for _, row in result.iterrows():
-            journal_dict = {}
-            for col in result.columns:
-                value = row[col]
-                # Handle different data types
-                if isinstance(value, np.ndarray):
-                    journal_dict[col] = value.tolist()
-                elif isinstance(value, np.integer):
-                    journal_dict[col] = int(value)
-                elif isinstance(value, np.floating):
-                    journal_dict[col] = float(value)
-                elif pd.isna(value):
-                    journal_dict[col] = None
-                else:
-                    journal_dict[col] = value
-            journals_list.append(journal_dict)
 
-        return jsonify({
+        if wants_arrow():
+            return arrow_response(result, {'filters_applied': filter, 'filter_hash': filter_hash(filter)})
+
+        journals_list = to_records(result)
+
+        return json_response({
             'status': 'success',
             'data': journals_list,
             'summary': {
@@ -57,9 +49,13 @@ def get_journals_stats():
                     'latest': int(result['year'].max()) if not result.empty else None
                 }
             },
-            'metadata': {'filters_applied': filter}
+            'metadata': {'filters_applied': filter, 'filter_hash': filter_hash(filter)}
         })
         
+    except QueryBudgetExceeded as e:
+        print(f"Query budget exceeded: {str(e)}")
+        return jsonify({'status': 'error', **e.to_dict()}), 413
+
     except Exception as e:
         print(f"Error in get_dimensions_stats: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
\ No newline at end of file
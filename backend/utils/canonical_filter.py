@@ -0,0 +1,58 @@
+"""
+Canonical form and hash of a works filter, shared by the blueprints and the BigQuery
+layer. Kept free of Flask so query code can import it outside a request.
+"""
+import hashlib
+import json
+
+# keys whose list order carries meaning and must not be sorted
+ORDERED_LIST_KEYS = {'sort'}
+
+
+def _format_date(date_input):
+    if isinstance(date_input, dict):
+        date_input = date_input.get('$date')
+    if hasattr(date_input, 'strftime'):
+        return date_input.strftime('%Y-%m-%d')
+    if isinstance(date_input, str):
+        return date_input.strip().split('T')[0][:10] or None
+    return None
+
+
+def _canonicalize_value(key, value):
+    if isinstance(value, dict):
+        if key == 'dateRange':
+            value = {k: _format_date(v) for k, v in value.items()}
+        return canonicalize_filter(value)
+    if isinstance(value, (list, tuple)):
+        items = [item.strip() if isinstance(item, str) else item for item in value]
+        items = [item for item in items if item not in (None, '')]
+        if key in ORDERED_LIST_KEYS or not all(isinstance(item, (str, int, float)) for item in items):
+            unique = dict.fromkeys(json.dumps(item, sort_keys=True) for item in items)
+            return [json.loads(item) for item in unique]
+        return sorted(set(items), key=lambda item: (str(type(item)), item))
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def canonicalize_filter(filter):
+    """
+    Return an equivalent filter in canonical form so that filters which ask the same
+    question produce identical query text. List entries are deduped and sorted
+    (except order-significant ones like `sort`), dates are truncated to YYYY-MM-DD and
+    missing, empty, null and false-valued keys are dropped.
+    """
+    canonical = {}
+    for key in sorted(filter or {}):
+        value = _canonicalize_value(key, filter[key])
+        if value is None or value is False or value == '' or value == [] or value == {}:
+            continue
+        canonical[key] = value
+    return canonical
+
+
+def filter_hash(filter):
+    """Stable short hash of the canonical form of a filter"""
+    encoded = json.dumps(canonicalize_filter(filter), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:16]
@@ -1,5 +1,5 @@
 # Optimized date sanitization function
-from datetime import datetime
+from datetime import datetime, timedelta
 
 def sanitize_date(date_str):
     try:
@@ -12,10 +12,10 @@ def determine_scale(date_from, date_to, user_specified_scale=None):
     date_from = sanitize_date(date_from)
     date_to = sanitize_date(date_to)
     
-    if user_specified_scale and user_specified_scale == 'quarterly':
-        return 'quarterly'
+    if user_specified_scale in ('quarterly', 'monthly'):
+        return user_specified_scale
     
-    # Default to yearly if scale is not specified or not quarterly
+    # Default to yearly if scale is not specified or not quarterly/monthly
     return 'yearly'
 
 # Optimized quarter date generator
@@ -29,7 +29,7 @@ def get_quarter_dates(year, quarter):
     
     start_month, start_day = quarter_starts[quarter]
     start_date = datetime(year, start_month, start_day)
-    end_date = datetime(year + 1, 1, 1) - datetime.timedelta(days=1) if quarter == 4 else datetime(year, start_month + 3, 1) - datetime.timedelta(days=1)
+    end_date = datetime(year + 1, 1, 1) - timedelta(days=1) if quarter == 4 else datetime(year, start_month + 3, 1) - timedelta(days=1)
     
     return start_date, end_date
 
@@ -56,6 +56,16 @@ def generate_filters(date_from, date_to, scale):
             current_quarter = 1 if current_quarter == 4 else current_quarter + 1
             if current_quarter == 1:
                 current_year += 1
+    elif scale == 'monthly':
+        current_month = start_date.replace(day=1)
+        while current_month <= end_date:
+            next_month = (current_month + timedelta(days=32)).replace(day=1)
+            filters.append({
+                'from': current_month.strftime("%Y-%m-%d"),
+                'to': (next_month - timedelta(days=1)).strftime("%Y-%m-%d"),
+                'display': current_month.strftime("%Y-%m")
+            })
+            current_month = next_month
     else:  # yearly scale (default behavior)
         for year in range(start_date.year, end_date.year + 1):
             year_start = datetime(year, 1, 1)
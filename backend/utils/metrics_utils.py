@@ -1,7 +1,12 @@
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import requests
-from utils import OPENALEX_API_URL
-import time
+from utils.openalex_client import get_openalex_client
+
+# groups per group_by page, the most OpenAlex returns
+GROUP_PAGE_SIZE = 200
+# upper bound on group_by pages a request may ask for
+MAX_GROUP_PAGES = 10
+
 def transform_group_data(group_data, key):
     return {
         item['name']: item['count']
@@ -17,54 +22,51 @@ def transform_open_access_data(group_data, key):
         if item['name'] is not None
     }
 
-def fetch_metrics(base_params, group_by=None):
-    try:
-        metrics = {}
-        time.sleep(1)
-        response = requests.get(
-            OPENALEX_API_URL,
-            params={**base_params, 'select': 'id', 'cited_by_count_sum': 'true'}
-        )
-        response.raise_for_status()  
+def _basic_metrics(data):
+    if 'meta' not in data:
+        raise ValueError("Missing 'meta' data in API response.")
 
-        data = response.json()
+    total_count = data['meta'].get('count', 0)
+    cited_by_count = data['meta'].get('cited_by_count_sum', 0)
 
-        if 'meta' not in data:
-            raise ValueError("Missing 'meta' data in API response.")
+    avg_citation = round(cited_by_count / total_count, 1) if total_count > 0 else 0
 
-        total_count = data['meta'].get('count', 0)
-        cited_by_count = data['meta'].get('cited_by_count_sum', 0)
+    return {
+        'total': total_count,
+        'cited_by_count': cited_by_count,
+        'avg_citation': avg_citation
+    }
 
-        avg_citation = round(cited_by_count / total_count, 1) if total_count > 0 else 0
+def _group_metrics(data, group_by):
+    if 'group_by' not in data:
+        raise ValueError(f"Missing 'group_by' data in API response for group_by: {group_by}")
 
-        metrics['basic'] = {
-            'total': total_count,
-            'cited_by_count': cited_by_count,
-            'avg_citation': avg_citation
+    return [
+        {
+            'name': group.get('key_display_name', str(group.get('key', 'Unknown'))),
+            'count': group.get('count', 0)
         }
+        for group in data.get('group_by', [])
+        if group.get('key') is not None
+    ]
 
-        if group_by:
-            response = requests.get(
-                OPENALEX_API_URL,
-                params={**base_params, 'group_by': group_by}
-            )
-            response.raise_for_status()
-            data = response.json()
-
-
-            if 'group_by' not in data:
-                raise ValueError(f"Missing 'group_by' data in API response for group_by: {group_by}")
+async def fetch_metrics_async(base_params, group_by=None, client=None):
+    """Basic metrics (and a group_by breakdown), with both requests in flight at once"""
+    client = client or get_openalex_client()
+    requests_params = [{**base_params, 'select': 'id', 'cited_by_count_sum': 'true'}]
+    if group_by:
+        requests_params.append({**base_params, 'group_by': group_by})
+    responses = await client.fetch_all(requests_params)
 
-            metrics[group_by] = [
-                {
-                    'name': group.get('key_display_name', str(group.get('key', 'Unknown'))),
-                    'count': group.get('count', 0)
-                }
-                for group in data.get('group_by', [])
-                if group.get('key') is not None
-            ]
+    metrics = {'basic': _basic_metrics(responses[0])}
+    if group_by:
+        metrics[group_by] = _group_metrics(responses[1], group_by)
+    return metrics
 
-        return metrics
+def fetch_metrics(base_params, group_by=None):
+    try:
+        client = get_openalex_client()
+        return client.run(fetch_metrics_async(base_params, group_by, client))
 
     except requests.exceptions.RequestException as e:
         print(f"Error in fetch_metrics: {str(e)}")
@@ -75,14 +77,129 @@ def fetch_metrics(base_params, group_by=None):
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
         raise
-    
-def fetch_groupings(base_params, groupings):
-    results = {}
-    
-    for group_name, group_by in groupings.items():
-        # Fetch the metrics for each group one by one
-        result = fetch_metrics(base_params, group_by=group_by)
-        results[group_name] = result
-    
-    return results
 
+async def fetch_group_by_async(base_params, group_by, max_pages=1, client=None):
+    """
+    Groups of one group_by, without the basic metrics request. OpenAlex returns up to
+    GROUP_PAGE_SIZE groups per page; with max_pages > 1 the long tail is followed with
+    cursor paging until it runs out or max_pages have been read.
+    """
+    client = client or get_openalex_client()
+    params = {**base_params, 'group_by': group_by, 'per_page': GROUP_PAGE_SIZE}
+    if max_pages <= 1:
+        return _group_metrics(await client.fetch(params), group_by)
+
+    groups = []
+    cursor = '*'
+    for _ in range(max_pages):
+        data = await client.fetch({**params, 'cursor': cursor})
+        groups.extend(_group_metrics(data, group_by))
+        cursor = data.get('meta', {}).get('next_cursor')
+        if not cursor:
+            break
+    return groups
+
+def fetch_groupings(base_params, groupings, max_pages=1):
+    """{name: {group_by: [{'name', 'count'}]}} for every grouping, fetched concurrently"""
+    client = get_openalex_client()
+
+    async def fetch_all():
+        results = await asyncio.gather(*(
+            fetch_group_by_async(base_params, group_by, max_pages, client)
+            for group_by in groupings.values()
+        ))
+        return {
+            name: {group_by: groups}
+            for (name, group_by), groups in zip(groupings.items(), results)
+        }
+
+    try:
+        return client.run(fetch_all())
+    except requests.exceptions.RequestException as e:
+        print(f"Error in fetch_groupings: {str(e)}")
+        raise
+
+def _period_params(base_params, time_filter):
+    return {
+        **base_params,
+        'filter': f"{base_params['filter']},from_publication_date:{time_filter['from']},to_publication_date:{time_filter['to']}"
+    }
+
+def _year_counts(data):
+    return {
+        int(group['key']): group.get('count', 0)
+        for group in data.get('group_by', [])
+        if group.get('key') is not None
+    }
+
+def _timeline_entry(time_filter, total, cited_by_count, types):
+    return {
+        'period': time_filter['display'] if 'display' in time_filter else time_filter['from'][:4],
+        **_basic_metrics({'meta': {'count': total, 'cited_by_count_sum': cited_by_count}}),
+        'types': types
+    }
+
+async def fetch_timeline_async(base_params, time_filters, client=None):
+    """
+    Timeline entries (period, total, cited_by_count, avg_citation, types) for yearly
+    periods in a handful of calls: works per year and per type and year come from
+    group_by=publication_year, and only citation sums, which OpenAlex cannot bucket,
+    are fetched per period, all at once. Other scales fetch every period separately.
+    """
+    client = client or get_openalex_client()
+    if not time_filters:
+        return []
+
+    if any('display' in time_filter for time_filter in time_filters):
+        period_metrics = await asyncio.gather(*(
+            fetch_metrics_async(_period_params(base_params, time_filter), 'type', client)
+            for time_filter in time_filters
+        ))
+        return [
+            _timeline_entry(time_filter, metrics['basic']['total'], metrics['basic']['cited_by_count'], metrics['type'])
+            for time_filter, metrics in zip(time_filters, period_metrics)
+        ]
+
+    span_params = _period_params(base_params, {'from': time_filters[0]['from'], 'to': time_filters[-1]['to']})
+    by_year, by_type = await client.fetch_all([
+        {**span_params, 'group_by': 'publication_year'},
+        {**span_params, 'group_by': 'type'}
+    ])
+    types = [
+        (str(group['key']).rstrip('/').rsplit('/', 1)[-1], group.get('key_display_name', str(group['key'])))
+        for group in by_type.get('group_by', [])
+        if group.get('key') is not None
+    ]
+
+    type_years, citations = await asyncio.gather(
+        client.fetch_all([
+            {**span_params, 'filter': f"{span_params['filter']},type:{type_id}", 'group_by': 'publication_year'}
+            for type_id, _ in types
+        ]),
+        client.fetch_all([
+            {**_period_params(base_params, time_filter), 'select': 'id', 'cited_by_count_sum': 'true'}
+            for time_filter in time_filters
+        ])
+    )
+
+    year_totals = _year_counts(by_year)
+    type_counts = [(name, _year_counts(data)) for (_, name), data in zip(types, type_years)]
+    timeline = []
+    for time_filter, period_citations in zip(time_filters, citations):
+        year = int(time_filter['from'][:4])
+        period_types = sorted(
+            ({'name': name, 'count': counts[year]} for name, counts in type_counts if counts.get(year)),
+            key=lambda item: item['count'],
+            reverse=True
+        )
+        timeline.append(_timeline_entry(
+            time_filter,
+            year_totals.get(year, 0),
+            period_citations.get('meta', {}).get('cited_by_count_sum', 0),
+            period_types
+        ))
+    return timeline
+
+def fetch_timeline(base_params, time_filters):
+    client = get_openalex_client()
+    return client.run(fetch_timeline_async(base_params, time_filters, client))
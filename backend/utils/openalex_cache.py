@@ -0,0 +1,183 @@
+"""
+Persistent HTTP response cache for the OpenAlex client.
+
+Institution-level aggregates change at most daily, so responses are kept in a SQLite
+file shared by every worker process and across restarts. Entries are keyed on the
+URL and its canonically ordered parameters. A fresh entry is served without touching
+the network. Once it expires, the client revalidates it with If-None-Match /
+If-Modified-Since when OpenAlex sent an ETag or Last-Modified, and a 304 renews it
+for another TTL. When a refresh fails the stale entry is served rather than an error.
+
+Bodies are stored zlib-compressed and the file is kept under `max_bytes` by evicting
+the least recently used entries. Each process keeps a running total of the stored
+bytes rather than summing the table on every store. Other workers write to the same
+file, so the total is re-read before anything is evicted and whenever this process has
+written RESYNC_FRACTION of `max_bytes` since it last did, which bounds how far the file
+can overshoot unnoticed.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+RESYNC_FRACTION = 1 / 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size INTEGER NOT NULL
+)
+"""
+
+
+@dataclass
+class CachedResponse:
+    key: str
+    data: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers revalidating this entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class OpenAlexCache:
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, default_ttl: float = 24 * 60 * 60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+        self._lock = threading.Lock()
+        self._total = 0
+        # written since the total was last read; starts full so the first store reads it
+        self._unsynced = max_bytes
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'revalidations': 0,
+            'refreshes': 0,
+            'stale_served': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        encoded = json.dumps({'url': url, 'params': params or {}}, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def lookup(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[CachedResponse]:
+        """The cached response, fresh or not; a fresh one counts as a hit, anything else as a miss"""
+        key = self.make_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self._counters['misses'] += 1
+                return None
+            body, etag, last_modified, expires_at = row
+            fresh = expires_at > now
+            self._counters['hits' if fresh else 'misses'] += 1
+            self._db.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+        return CachedResponse(key, json.loads(zlib.decompress(body)), etag, last_modified, fresh)
+
+    def store(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        data: Any,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        ttl: Optional[float] = None
+    ) -> None:
+        key = self.make_key(url, params)
+        body = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            replaced = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, body, etag, last_modified, now + (ttl or self.default_ttl), now, len(body))
+            )
+            self._total += len(body) - (replaced[0] if replaced else 0)
+            self._unsynced += len(body)
+            self._counters['refreshes'] += 1
+            if self._total > self.max_bytes or self._unsynced >= self.max_bytes * RESYNC_FRACTION:
+                self._evict()
+
+    def renew(self, entry: CachedResponse, ttl: Optional[float] = None) -> None:
+        """Extend an entry OpenAlex confirmed unchanged (304)"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?',
+                (now + (ttl or self.default_ttl), now, entry.key)
+            )
+            self._counters['revalidations'] += 1
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _evict(self) -> None:
+        """
+        Re-read the stored bytes and drop least recently used entries until the cache
+        fits (callers hold self._lock)
+        """
+        self._total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self._unsynced = 0
+        if self._total <= self.max_bytes:
+            return
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall():
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._counters['evictions'] += 1
+            self._total -= size
+            if self._total <= self.max_bytes:
+                break
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._total = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        lookups = counters['hits'] + counters['misses']
+        return {
+            **counters,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'path': self.path
+        }
+
@@ -0,0 +1,246 @@
+"""
+Shared asynchronous OpenAlex client.
+
+Every OpenAlex request goes through one aiohttp session, so connections (and TLS
+sessions) to api.openalex.org are pooled instead of opened per call. Requests are
+paced by a token bucket sized for the polite pool (10 requests per second for clients
+sending `mailto`), at most `max_concurrency` are in flight, and 429 / 5xx responses
+and connection errors are retried with exponential backoff, honouring Retry-After.
+
+The session lives on an event loop in a background thread, so Flask routes use the
+sync facade (`get`, `get_many`, `run`) and independent requests overlap instead of
+running one after the other. The process-wide client's rate and concurrency can be
+set with DISCOVER_OPENALEX_RATE and DISCOVER_OPENALEX_CONCURRENCY.
+
+Responses go through a persistent cache (see utils.openalex_cache), configured with
+DISCOVER_OPENALEX_CACHE_PATH / _BYTES / _TTL and turned off with DISCOVER_OPENALEX_CACHE=off.
+Its SQLite reads and writes run in the loop's default executor, so a slow disk does not
+stall the other requests in flight.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, TypeVar
+
+import aiohttp
+import requests
+
+from utils import OPENALEX_API_URL
+from utils.openalex_cache import OpenAlexCache
+
+T = TypeVar('T')
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# polite pool: 10 requests per second with a mailto
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+DEFAULT_CONCURRENCY = 8
+
+
+class OpenAlexError(requests.exceptions.RequestException):
+    """An OpenAlex request that failed for good; routes handle it like any failed request"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> float:
+        """Take one token, waiting for it if needed; returns the seconds waited"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class OpenAlexClient:
+    def __init__(
+        self,
+        base_url: str = OPENALEX_API_URL,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_concurrency: int = DEFAULT_CONCURRENCY,
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        timeout: float = 30,
+        cache: Optional[OpenAlexCache] = None
+    ):
+        self.base_url = base_url
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'failures': 0, 'throttled_ms': 0.0}
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='openalex-client', daemon=True).start()
+            return self._loop
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Run a coroutine on the client's loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._event_loop()).result()
+
+    def get(self, params: Dict[str, Any], url: Optional[str] = None) -> Dict[str, Any]:
+        return self.run(self.fetch(params, url))
+
+    def get_many(self, requests_params: List[Dict[str, Any]], url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Responses for several requests, issued concurrently, in the order given"""
+        return self.run(self.fetch_all(requests_params, url))
+
+    async def fetch_all(self, requests_params: List[Dict[str, Any]], url: Optional[str] = None) -> List[Dict[str, Any]]:
+        return list(await asyncio.gather(*(self.fetch(params, url) for params in requests_params)))
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                raise_for_status=False
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), 60.0)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+    async def fetch(self, params: Dict[str, Any], url: Optional[str] = None) -> Dict[str, Any]:
+        """JSON body of one GET, from the response cache when it is fresh there"""
+        url = url or self.base_url
+        cached = await self._in_cache(self.cache.lookup, url, params) if self.cache is not None else None
+        if cached is not None and cached.fresh:
+            return cached.data
+
+        try:
+            status, data, headers = await self._request(url, params, cached.validators() if cached else None)
+        except OpenAlexError as e:
+            if cached is None:
+                raise
+            print(f"Serving stale OpenAlex response after failed refresh: {str(e)}")
+            self.cache.count('stale_served')
+            return cached.data
+
+        if status == 304 and cached is not None:
+            await self._in_cache(self.cache.renew, cached)
+            return cached.data
+        if self.cache is not None:
+            await self._in_cache(self.cache.store, url, params, data, headers.get('ETag'), headers.get('Last-Modified'))
+        return data
+
+    @staticmethod
+    async def _in_cache(method: Callable[..., T], *args: Any) -> T:
+        """Run a blocking cache call off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def _request(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Optional[Dict[str, Any]], Mapping[str, str]]:
+        """(status, JSON body, headers) of one GET, retried on throttling, server errors and dropped connections"""
+        session = await self._get_session()
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                waited = await self.bucket.acquire()
+                self._count('requests')
+                self._count('throttled_ms', waited * 1000)
+                try:
+                    async with session.get(url, params=params, headers=headers) as response:
+                        if response.status == 304:
+                            return response.status, None, response.headers
+                        if response.status < 400:
+                            return response.status, await response.json(), response.headers
+                        if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                            self._count('failures')
+                            body = (await response.text())[:200]
+                            raise OpenAlexError(f"OpenAlex returned {response.status} for {response.url}: {body}", response.status)
+                        delay = self._retry_delay(attempt, response.headers.get('Retry-After'))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == self.max_retries:
+                        self._count('failures')
+                        raise OpenAlexError(f"OpenAlex request failed: {type(e).__name__}: {e}") from e
+                    delay = self._retry_delay(attempt)
+            self._count('retries')
+            print(f"Retrying OpenAlex request in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries})")
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def _count(self, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[counter] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {**self._counters, 'throttled_ms': round(self._counters['throttled_ms'], 1)}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+    def close(self) -> None:
+        if self._loop is not None and self._session is not None:
+            self.run(self._session.close())
+
+
+_default_client: Optional[OpenAlexClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_openalex_client() -> OpenAlexClient:
+    """Process-wide client, so every route shares one connection pool and rate limit"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            cache = None
+            if os.environ.get('DISCOVER_OPENALEX_CACHE', 'on').lower() not in ('0', 'off', 'false'):
+                cache = OpenAlexCache(
+                    path=os.environ.get(
+                        'DISCOVER_OPENALEX_CACHE_PATH',
+                        os.path.join(tempfile.gettempdir(), 'discover-openalex-cache.sqlite3')
+                    ),
+                    max_bytes=int(os.environ.get('DISCOVER_OPENALEX_CACHE_BYTES', 256 * 1024 * 1024)),
+                    default_ttl=float(os.environ.get('DISCOVER_OPENALEX_CACHE_TTL', 24 * 60 * 60))
+                )
+            _default_client = OpenAlexClient(
+                rate=float(os.environ.get('DISCOVER_OPENALEX_RATE', DEFAULT_RATE)),
+                max_concurrency=int(os.environ.get('DISCOVER_OPENALEX_CONCURRENCY', DEFAULT_CONCURRENCY)),
+                cache=cache
+            )
+        return _default_client
@@ -0,0 +1,173 @@
+"""
+Columnar DataFrame / Arrow table to JSON conversion for the dashboard endpoints.
+
+Results are converted one column at a time and the rows are zipped together at the
+end, instead of walking every cell through a chain of isinstance checks:
+- typed columns (numbers, booleans, strings, dates) go through Arrow, which turns
+  numpy scalars into Python values and NaN / pandas NA into null in vectorized code;
+- object columns holding nested struct arrays are unwrapped with ndarray.tolist(),
+  which already yields plain lists of dicts;
+- Arrow tables are converted natively, with NaN nulled at every nesting level.
+
+The payload is encoded once, straight to bytes. NaN nested inside an object column is
+rare, so it is caught by the encoder and only then scrubbed in Python.
+
+Clients that send `Accept: application/vnd.apache.arrow.stream` get the result table as
+an Arrow IPC stream instead (see `wants_arrow` / `arrow_response`), skipping the
+conversion to Python objects entirely. The JSON envelope's metadata travels in the
+schema metadata under the `discover` key.
+"""
+import datetime
+import decimal
+import io
+import json
+import math
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from flask import Response, request
+
+Tabular = Union[pd.DataFrame, pa.Table]
+
+JSON_MIMETYPE = 'application/json'
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+ARROW_BATCH_ROWS = 16_384
+
+
+def _nan_to_null(array: pa.Array) -> pa.Array:
+    """Replace float NaN with null, including inside nested lists and structs"""
+    if isinstance(array, pa.ChunkedArray):
+        return pa.chunked_array([_nan_to_null(chunk) for chunk in array.chunks], type=array.type)
+    value_type = array.type
+    if pa.types.is_floating(value_type):
+        return pc.if_else(pc.is_nan(array), pa.scalar(None, value_type), array)
+    if pa.types.is_list(value_type) or pa.types.is_large_list(value_type):
+        values = _nan_to_null(array.values)
+        cls = pa.LargeListArray if pa.types.is_large_list(value_type) else pa.ListArray
+        return cls.from_arrays(array.offsets, values, mask=array.is_null() if array.null_count else None)
+    if pa.types.is_struct(value_type):
+        return pa.StructArray.from_arrays(
+            [_nan_to_null(array.field(i)) for i in range(value_type.num_fields)],
+            fields=list(value_type),
+            mask=array.is_null() if array.null_count else None
+        )
+    return array
+
+
+def _object_value(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and value != value):
+        return None
+    return value
+
+
+def _column_values(data: Tabular, name: str) -> List[Any]:
+    if isinstance(data, pa.Table):
+        return _nan_to_null(data.column(name)).to_pylist()
+    series = data[name]
+    if series.dtype == object:
+        return [_object_value(value) for value in series.tolist()]
+    return pa.array(series, from_pandas=True).to_pylist()
+
+
+def _scrub(value: Any) -> Any:
+    """Null out non-finite floats anywhere in a payload"""
+    if isinstance(value, dict):
+        return {key: _scrub(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def to_records(data: Tabular, exclude: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Rows as JSON-ready dicts, converted column by column"""
+    names = [name for name in (data.column_names if isinstance(data, pa.Table) else data.columns) if name not in (exclude or [])]
+    columns = [_column_values(data, name) for name in names]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def group_by_year(data: Tabular, many: bool = False, year_column: str = 'year') -> Dict[int, Any]:
+    """
+    Rows keyed by year, without the year column. With `many` each year holds the list
+    of its rows, otherwise its single row. Rows without a year are dropped.
+    """
+    years = _column_values(data, year_column)
+    rows = to_records(data, exclude=[year_column])
+    grouped: Dict[int, Any] = {}
+    for year, row in zip(years, rows):
+        if year is None:
+            continue
+        if many:
+            grouped.setdefault(int(year), []).append(row)
+        else:
+            grouped[int(year)] = row
+    return grouped
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON bytes with sorted keys, matching Flask's jsonify output"""
+    options = {'default': _default, 'sort_keys': True, 'separators': (',', ':')}
+    try:
+        encoded = json.dumps(payload, allow_nan=False, **options)
+    except ValueError:
+        encoded = json.dumps(_scrub(payload), allow_nan=False, **options)
+    return encoded.encode('utf-8')
+
+
+def json_response(payload: Any, status: int = 200) -> Response:
+    response = Response(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+def wants_arrow() -> bool:
+    """Whether the current request prefers an Arrow IPC stream over JSON (JSON wins ties)"""
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, ARROW_STREAM_MIMETYPE]) == ARROW_STREAM_MIMETYPE
+
+
+def _ipc_stream(table: pa.Table) -> Iterator[bytes]:
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return chunk
+
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        yield drain()
+        for batch in table.to_batches(max_chunksize=ARROW_BATCH_ROWS):
+            writer.write_batch(batch)
+            yield drain()
+    yield drain()
+
+
+def arrow_response(data: Tabular, metadata: Optional[Dict[str, Any]] = None, status: int = 200) -> Response:
+    """Stream a result table as Arrow IPC, one record batch at a time"""
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+    if metadata is not None:
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b'discover': dumps(metadata)
+        })
+    response = Response(_ipc_stream(table), status=status, mimetype=ARROW_STREAM_MIMETYPE)
+    response.headers['Vary'] = 'Accept'
+    return response
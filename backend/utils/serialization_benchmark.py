@@ -0,0 +1,133 @@
+"""
+Microbenchmark of utils.serialization against the per-row loops the dashboard
+endpoints used before, on synthetic results shaped like get_basic_stats (one row per
+year with nested leaderboards) and TopicAnalytics (many rows per year). Both paths
+must decode to the same payload.
+
+    python -m utils.serialization_benchmark --years 30 --leaderboard 200 --repeats 5
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+
+from utils.serialization import dumps, group_by_year, to_records
+
+
+def _legacy_cell(value: Any) -> Any:
+    return (
+        value.tolist() if isinstance(value, np.ndarray)
+        else int(value) if isinstance(value, np.integer)
+        else float(value) if isinstance(value, np.floating)
+        else None if pd.isna(value)
+        else value
+    )
+
+
+def legacy_group_by_year(result: pd.DataFrame, many: bool = False) -> Dict[int, Any]:
+    grouped: Dict[int, Any] = {}
+    for _, row in result.iterrows():
+        year = int(row['year']) if pd.notna(row['year']) else None
+        if year is None:
+            continue
+        row_data = {col: _legacy_cell(row[col]) for col in result.columns if col != 'year'}
+        if many:
+            grouped.setdefault(year, []).append(row_data)
+        else:
+            grouped[year] = row_data
+    return grouped
+
+
+def legacy_records(result: pd.DataFrame) -> List[Dict[str, Any]]:
+    return [{col: _legacy_cell(row[col]) for col in result.columns} for _, row in result.iterrows()]
+
+
+def stats_frame(years: int, leaderboard: int, rng: np.random.Generator) -> pd.DataFrame:
+    def board(label: str) -> List[np.ndarray]:
+        return [
+            np.array([{label: f"{label}-{i}", 'count': int(c)} for i, c in enumerate(rng.integers(1, 500, leaderboard))], dtype=object)
+            for _ in range(years)
+        ]
+    return pd.DataFrame({
+        'year': np.arange(2024 - years + 1, 2025),
+        'total_publications': rng.integers(1000, 20000, years),
+        'avg_citations': rng.random(years) * 30,
+        'avg_field_citation_ratio': np.where(rng.random(years) < 0.2, np.nan, rng.random(years) * 3),
+        'top_concepts': board('concept'),
+        'top_institutions': board('institution'),
+        'top_countries': board('country'),
+        'top_funders': board('funder')
+    })
+
+
+def topics_frame(years: int, per_year: int, rng: np.random.Generator) -> pd.DataFrame:
+    n = years * per_year
+    return pd.DataFrame({
+        'year': np.repeat(np.arange(2024 - years + 1, 2025), per_year),
+        'concept': [f"concept-{i % 1000}" for i in range(n)],
+        'publication_count': rng.integers(5, 500, n),
+        'avg_citations': rng.random(n) * 30,
+        'growth_rate': np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 2 - 1),
+        'top_journals': [f"journal-{i % 37},journal-{i % 11}" for i in range(n)]
+    })
+
+
+def _median_ms(fn: Callable[[], bytes], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 1)
+
+
+def benchmark(years: int = 30, leaderboard: int = 200, topics_per_year: int = 1000, repeats: int = 5) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    app = Flask(__name__)
+    stats = stats_frame(years, leaderboard, rng)
+    topics = topics_frame(years, topics_per_year, rng)
+    cases = {
+        'stats': (stats, lambda: legacy_group_by_year(stats), lambda: group_by_year(stats)),
+        'topics': (topics, lambda: legacy_group_by_year(topics, many=True), lambda: group_by_year(topics, many=True)),
+        'journal_stats': (topics, lambda: legacy_records(topics), lambda: to_records(topics))
+    }
+
+    rows = []
+    with app.app_context():
+        for name, (frame, legacy, columnar) in cases.items():
+            legacy_bytes = lambda: jsonify({'data': legacy()}).get_data()
+            columnar_bytes = lambda: dumps({'data': columnar()})
+            rows.append({
+                'endpoint': name,
+                'rows': len(frame),
+                'legacy_ms': _median_ms(legacy_bytes, repeats),
+                'columnar_ms': _median_ms(columnar_bytes, repeats),
+                'payload_bytes': len(columnar_bytes()),
+                'identical': json.loads(legacy_bytes()) == json.loads(columnar_bytes())
+            })
+    report = pd.DataFrame(rows)
+    report['speedup'] = (report['legacy_ms'] / report['columnar_ms']).round(1)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--leaderboard', type=int, default=200, help='entries per nested leaderboard')
+    parser.add_argument('--topics-per-year', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.years, args.leaderboard, args.topics_per_year, args.repeats)
+    print(report.to_string(index=False))
+    return 0 if report['identical'].all() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,26 @@
+import json
+
+from flask import request
+
+from utils.canonical_filter import canonicalize_filter, filter_hash
+
+
+def attach_filter_hash(response):
+    """after_request hook that exposes the canonical filter hash as X-Filter-Hash"""
+    try:
+        filter = json.loads(request.args.get('filter') or '{}')
+        if isinstance(filter, dict):
+            response.headers['X-Filter-Hash'] = filter_hash(filter)
+    except ValueError:
+        pass
+    return response
+
 # reverse the FIELDS_MAPPING dictionary to map field names to IDs
 FIELDS_MAPPING = {11: ['Agricultural and Biological Sciences'], 12: ['Arts and Humanities'], 13: ['Biochemistry, Genetics and Molecular Biology'], 14: ['Business, Management and Accounting'], 15: ['Chemical Engineering'], 16: ['Chemistry'], 17: ['Computer Science'], 18: ['Decision Sciences'], 19: ['Earth and Planetary Sciences'], 20: ['Economics, Econometrics and Finance'], 21: ['Energy'], 22: ['Engineering'], 23: ['Environmental Science'], 24: ['Immunology and Microbiology'], 25: ['Materials Science'], 26: ['Mathematics'], 27: ['Medicine'], 28: ['Neuroscience'], 29: ['Nursing'], 30: ['Pharmacology, Toxicology and Pharmaceutics'], 31: ['Physics and Astronomy'], 32: ['Psychology'], 33: ['Social Sciences'], 34: ['Veterinary'], 35: ['Dentistry'], 36: ['Health Professions']}
 FIELDS_MAPPING_REVERSED = {v[0]: k for k, v in FIELDS_MAPPING.items()}
 
 def generate_filter_strings(filter):
+    filter = canonicalize_filter(filter)
     sort_list = filter.get('sort') or []
     if filter.get('search_query') and 'relevance_score:desc' not in sort_list:
         sort_list.insert(0, 'relevance_score:desc')
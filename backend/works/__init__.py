@@ -1,7 +1,9 @@
 from flask import Blueprint
+from utils.works_filter import attach_filter_hash
 
 
 work_data_bp = Blueprint('work_data', __name__)
+work_data_bp.after_request(attach_filter_hash)
 
 OPENALEX_API_URL = "https://api.openalex.org/works"
 INSTITUTION_ID = "I36258959"
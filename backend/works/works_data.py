@@ -6,8 +6,10 @@ from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
 from . import work_data_bp
 import json
-from bigquery.bq import BigQuery
+import os
+from bigquery.bq import BigQuery, QueryBudgetExceeded
 from bigquery.dimensions import DimensionsAnalytics
+from bigquery.dimensions.pagination import InvalidCursor
 import datetime
 import asyncio
 import pandas as pd
@@ -18,9 +20,14 @@ bq.add_dataset(
     project_id='ucsd-discover',
     dataset='dimensions',
     table='ucsd_publications',
-    billing_project_id='ucsd-discover'
+    billing_project_id='ucsd-discover',
+    engine=os.environ.get('DISCOVER_PUBLICATIONS_ENGINE', 'bigquery'),
+    snapshot_path=os.environ.get('DISCOVER_PUBLICATIONS_SNAPSHOT')
+)
+analytics = DimensionsAnalytics(
+    bq,
+    publication_block_size=int(os.environ.get('DISCOVER_PUBLICATION_BLOCK_SIZE', 500))
 )
-analytics = DimensionsAnalytics(bq)
 
 @work_data_bp.route('/test', methods=['GET'])
 def test():
@@ -31,9 +38,11 @@ def test():
 def get_dimensions_publications():
     """
     Middleware between Dimensions API and frontend. Accepts filter parameters and returns paginated publication data.
+    Pages are addressed by `page` number or, cheaper for deep pages, by the opaque `cursor` returned as `next_cursor`.
     """
     try:
         page = request.args.get('page', type=int, default=1)
+        cursor = request.args.get('cursor')
         filter_str = request.args.get('filter')
         
         # handle case when no filter is provided
@@ -46,19 +55,21 @@ def get_dimensions_publications():
         }
         if filter:
             query_filter.update(filter)
+        if cursor:
+            query_filter['cursor'] = cursor
+
+        result, next_cursor = analytics.get_publications_page('publications', query_filter)
+        total_count = analytics.publication_analytics.count_publications('publications', filter)
+        total_pages = (total_count // per_page) + (1 if total_count % per_page else 0)
 
-        result = analytics.publication_analytics.get_publications('publications', query_filter)
-        
         if result is None or result.empty:
             return jsonify({
-                'total_count': 0,
+                'total_count': total_count,
                 'publications': [],
-                'total_pages': 0
+                'total_pages': total_pages,
+                'next_cursor': None
             })
 
-        total_count = int(result['total_count'].iloc[0])
-        total_pages = (total_count // per_page) + (1 if total_count % per_page else 0)
-
         publications = []
         for _, row in result.iterrows():
             pub = {
@@ -89,9 +100,17 @@ def get_dimensions_publications():
         return jsonify({
             'total_count': total_count,
             'publications': publications,
-            'total_pages': total_pages
+            'total_pages': total_pages,
+            'next_cursor': next_cursor
         })
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
+    except QueryBudgetExceeded as e:
+        print(f"Query budget exceeded in get_dimensions_publications: {str(e)}")
+        return jsonify({'status': 'error', **e.to_dict()}), 413
+
     except Exception as e:
         print(f"Error in get_dimensions_publications: {str(e)}")
         print(f"Error details: {type(e).__name__}")
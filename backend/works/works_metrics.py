@@ -1,14 +1,16 @@
 import json
+import os
 from flask import jsonify, request
 import numpy as np
 import pandas as pd
 import requests
 from utils import INSTITUTION_ID
-from utils.date_utils import determine_scale, generate_filters
-from utils.metrics_utils import fetch_groupings, fetch_metrics, transform_group_data, transform_open_access_data
-from utils.works_filter import generate_filter_strings
+from utils.date_utils import determine_scale, generate_filters, sanitize_date
+from utils.metrics_utils import MAX_GROUP_PAGES, fetch_groupings, fetch_timeline, transform_group_data, transform_open_access_data
+from utils.works_filter import generate_filter_strings, filter_hash
+from utils.serialization import arrow_response, group_by_year, json_response, wants_arrow
 from . import work_data_bp
-from bigquery.bq import BigQuery
+from bigquery.bq import BigQuery, QueryBudgetExceeded
 from bigquery.dimensions import DimensionsAnalytics
 import datetime
 import asyncio
@@ -19,48 +21,50 @@ bq.add_dataset(
     project_id='ucsd-discover',
     dataset='dimensions',
     table='ucsd_publications',
-    billing_project_id='ucsd-discover'
+    billing_project_id='ucsd-discover',
+    engine=os.environ.get('DISCOVER_PUBLICATIONS_ENGINE', 'bigquery'),
+    snapshot_path=os.environ.get('DISCOVER_PUBLICATIONS_SNAPSHOT')
 )
+if os.environ.get('DISCOVER_PUBLICATIONS_ROLLUP_TABLE'):
+    bq.add_dataset(
+        name='publications_rollup',
+        project_id='ucsd-discover',
+        dataset='dimensions',
+        table=os.environ['DISCOVER_PUBLICATIONS_ROLLUP_TABLE'],
+        billing_project_id='ucsd-discover'
+    )
 analytics = DimensionsAnalytics(bq)
 @work_data_bp.route('/dimensions/stats', methods=['GET'])
 def get_dimensions_stats():
     try:
         filter = json.loads(request.args.get('filter', '{}'))
         result = analytics.publication_analytics.get_basic_stats('publications', filter)
-        
-        stats_dict = {}
-        for _, row in result.iterrows():
-            year = int(row['year']) if pd.notna(row['year']) else None
-            if year is None:
-                continue
-                
-            stats_dict[year] = {
-                col: row[col].tolist() if isinstance(row[col], np.ndarray) 
-                else int(row[col]) if isinstance(row[col], np.integer) 
-                else float(row[col]) if isinstance(row[col], np.floating)
-                else None if pd.isna(row[col])
-                else row[col]
-                for col in result.columns if col != 'year'
-            }
+        if wants_arrow():
+            return arrow_response(result, {'filters_applied': filter, 'filter_hash': filter_hash(filter)})
+        stats_dict = group_by_year(result)
 
         if not stats_dict:
-            return jsonify({
+            return json_response({
                 'status': 'success',
                 'data': {},
                 'summary': {'total_years': 0, 'year_range': {'earliest': None, 'latest': None}},
-                'metadata': {'filters_applied': filter}
+                'metadata': {'filters_applied': filter, 'filter_hash': filter_hash(filter)}
             })
 
-        return jsonify({
+        return json_response({
             'status': 'success',
             'data': stats_dict,
             'summary': {
                 'total_years': len(stats_dict),
                 'year_range': {'earliest': min(stats_dict.keys()), 'latest': max(stats_dict.keys())}
             },
-            'metadata': {'filters_applied': filter}
+            'metadata': {'filters_applied': filter, 'filter_hash': filter_hash(filter)}
         })
 
+    except QueryBudgetExceeded as e:
+        print(f"Query budget exceeded: {str(e)}")
+        return jsonify({'status': 'error', **e.to_dict()}), 413
+
     except Exception as e:
         print(f"Error in get_dimensions_stats: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -72,59 +76,81 @@ def get_dimensions_topics():
     try:
         filter = json.loads(request.args.get('filter', '{}'))
         result = analytics.topic_analytics.analyze('publications', filter)
-        stats_dict = {}
-
-        for _, row in result.iterrows():
-            year = int(row['year']) if pd.notna(row['year']) else None
-            if year is None:
-                continue
-
-            if year not in stats_dict:
-                stats_dict[year] = []
-
-            row_data = {
-                col: row[col].tolist() if isinstance(row[col], np.ndarray)
-                else int(row[col]) if isinstance(row[col], np.integer)
-                else float(row[col]) if isinstance(row[col], np.floating)
-                else None if pd.isna(row[col])
-                else row[col]
-                for col in result.columns if col != 'year'
-            }
-            stats_dict[year].append(row_data)
+        if wants_arrow():
+            return arrow_response(result, {'filters_applied': filter, 'filter_hash': filter_hash(filter)})
+        stats_dict = group_by_year(result, many=True)
 
         if not stats_dict:
-            return jsonify({
+            return json_response({
                 'status': 'success',
                 'data': {},
                 'summary': {'total_years': 0, 'year_range': {'earliest': None, 'latest': None}},
-                'metadata': {'filters_applied': filter}
+                'metadata': {'filters_applied': filter, 'filter_hash': filter_hash(filter)}
             })
 
-        return jsonify({
+        return json_response({
             'status': 'success',
             'data': stats_dict,
             'summary': {
                 'total_years': len(stats_dict),
                 'year_range': {'earliest': min(stats_dict.keys()), 'latest': max(stats_dict.keys())}
             },
-            'metadata': {'filters_applied': filter}
+            'metadata': {'filters_applied': filter, 'filter_hash': filter_hash(filter)}
         })
 
+    except QueryBudgetExceeded as e:
+        print(f"Query budget exceeded: {str(e)}")
+        return jsonify({'status': 'error', **e.to_dict()}), 413
+
     except Exception as e:
         print(f"Error in get_dimensions_stats: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@work_data_bp.route('/dimensions/facets', methods=['GET'])
+def get_dimensions_facets():
+    """
+    Filter sidebar counts (document type, field, access type, funder, publisher, year)
+    for the current filter, answered from the in-memory facet index.
+    """
+    try:
+        filter = json.loads(request.args.get('filter', '{}'))
+        limit = request.args.get('limit', type=int, default=50)
+        result = analytics.facet_analytics.get_facet_counts('publications', filter, limit=limit)
+        return json_response({
+            'status': 'success',
+            'data': result['facets'],
+            'summary': {'total_publications': result['total']},
+            'metadata': {
+                'filters_applied': filter,
+                'filter_hash': filter_hash(filter),
+                'source': result['source'],
+                'index_built_at': result['index_built_at'],
+                'elapsed_ms': result['elapsed_ms']
+            }
+        })
+
+    except QueryBudgetExceeded as e:
+        print(f"Query budget exceeded: {str(e)}")
+        return jsonify({'status': 'error', **e.to_dict()}), 413
+
+    except Exception as e:
+        print(f"Error in get_dimensions_facets: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+
 
-    
 @work_data_bp.route('/group_metrics', methods=['GET'])
 def fetch_groupings_endpoint():
     """
     Fetches group metrics (funders, publishers, open access) based on a filter.
-    Returns the results in a flat structure.
+    Returns the results in a flat structure. `pages` (default 1) reads further pages of
+    200 groups for long funder and publisher tails.
     """
     try:
         filter = json.loads(request.args.get('filter', '{}'))
+        pages = min(max(request.args.get('pages', type=int, default=1), 1), MAX_GROUP_PAGES)
         filter_string = generate_filter_strings(filter)['filter']
 
         # base parameters for the API request
@@ -140,8 +166,8 @@ def fetch_groupings_endpoint():
             'open_access': 'open_access.is_oa'
         }
 
-        # fetch groupings in parallel 
-        group_results = fetch_groupings(base_params, groupings)
+        # fetch groupings concurrently
+        group_results = fetch_groupings(base_params, groupings, max_pages=pages)
 
         # flatten results for frontend parsing
         transformed_results = {
@@ -155,56 +181,109 @@ def fetch_groupings_endpoint():
         return jsonify({'error': f'API request failed: {str(e)}'}), 500
 
 
+# works_metrics scales and the get_timeline granularity of each
+TIMELINE_GRANULARITY = {'yearly': 'year', 'quarterly': 'quarter', 'monthly': 'month'}
+
+
+def _period_label(period, scale):
+    """Timeline period label of a bucket start date, as generate_filters names the period"""
+    period = pd.Timestamp(period)
+    if scale == 'quarterly':
+        return f"{period.year} Q{(period.month - 1) // 3 + 1}"
+    if scale == 'monthly':
+        return f"{period.year}-{period.month:02d}"
+    return str(period.year)
+
+
+def _dimensions_timeline(filter, time_filters, scale):
+    """The OpenAlex timeline's entries from one Dimensions query, with empty periods filled in"""
+    if not time_filters:
+        return []
+    # the periods cover whole months, quarters or years; keep the requested bounds inside them
+    requested = filter.get('dateRange') or {}
+    requested_from, requested_to = sanitize_date(requested.get('from')), sanitize_date(requested.get('to'))
+    span = {
+        'from': max(time_filters[0]['from'], requested_from) if requested_from else time_filters[0]['from'],
+        'to': min(time_filters[-1]['to'], requested_to) if requested_to else time_filters[-1]['to']
+    }
+    result = analytics.publication_analytics.get_timeline('publications', {**filter, 'dateRange': span}, TIMELINE_GRANULARITY[scale])
+    buckets = {_period_label(row['period'], scale): row for row in result.to_dict('records')}
+
+    timeline = []
+    for time_filter in time_filters:
+        period = time_filter['display'] if 'display' in time_filter else time_filter['from'][:4]
+        row = buckets.get(period)
+        if row is None:
+            timeline.append({'period': period, 'total': 0, 'cited_by_count': 0, 'avg_citation': 0, 'types': []})
+            continue
+        # NULL when none of the bucket's publications has a document type
+        types = row['types'] if isinstance(row['types'], (list, np.ndarray)) else []
+        timeline.append({
+            'period': period,
+            'total': int(row['total']),
+            'cited_by_count': int(row['cited_by_count']),
+            'avg_citation': float(row['avg_citation'] or 0),
+            'types': [{'name': item['name'], 'count': int(item['count'])} for item in types]
+        })
+    return timeline
+
+
 @work_data_bp.route('/works_metrics', methods=['GET'])
 def get_works_metrics():
     """
     Given a filter, determines an appropriate time scale and fetches citation count, counts of types of work, and works count over each time step.
     Is used to generate data for charts on frontend.
+    `backend` picks the source: 'openalex' (default) or 'dimensions', which answers every
+    period with one query over the publications table (types are Dimensions document types).
     Returns:
         Time series data on citation counts over time, counts of work over time, and the number of types over time. 
     """
     try:
         filter = json.loads(request.args.get('filter', '{}'))
-        filter_string = generate_filter_strings(filter)['filter']
+        backend = request.args.get('backend', 'openalex')
+        if backend not in ('openalex', 'dimensions'):
+            return jsonify({'error': f"Unknown backend '{backend}'. Valid backends are: ['openalex', 'dimensions']"}), 400
 
         # figure out scale to display chart 
         date_from = filter.get('dateRange', {}).get('from', "")
         date_to = filter.get('dateRange', {}).get('to', "")
         scale = determine_scale(date_from, date_to, filter.get('scale'))  
 
-        # generate the time filters (either quarterly or yearly), based on scale determined
+        # generate the time filters (monthly, quarterly or yearly), based on scale determined
         time_filters = generate_filters(date_from, date_to, scale)
 
-        base_params = {
-            'mailto': 'dn007@ucsd.edu',
-            'filter': f'authorships.institutions.id:{INSTITUTION_ID},{filter_string}'
-        }
-
         results = {
             'timeline': [],
             'scale': scale,
+            'backend': backend
         }
 
-        # get metrics for each time period
-        count = 0
-        for time_filter in time_filters:
-            count+=1
-            print(f"api call{count}")
-            period_filter = {
-                **base_params,
-                'filter': f"{base_params['filter']},from_publication_date:{time_filter['from']},to_publication_date:{time_filter['to']}"
-            }
-            period_metrics = fetch_metrics(period_filter, group_by='type')  
-            results['timeline'].append({
-                'period': time_filter['display'] if 'display' in time_filter else time_filter['from'][:4],
-                **period_metrics['basic'],
-                'types': period_metrics['type']
-            })
+        if backend == 'dimensions':
+            results['timeline'] = _dimensions_timeline(filter, time_filters, scale)
+            return jsonify(results)
+
+        filter_string = generate_filter_strings(filter)['filter']
+        base_params = {
+            'mailto': 'dn007@ucsd.edu',
+            'filter': f'authorships.institutions.id:{INSTITUTION_ID},{filter_string}'
+        }
+
+        # works per year and type are bucketed by OpenAlex; citation sums are fetched per period
+        print(f"Fetching OpenAlex timeline for {len(time_filters)} periods")
+        results['timeline'] = fetch_timeline(base_params, time_filters)
 
         # sort the timeline in ascending order by period (years) (2022, 2023, 2024, etc.).
         results['timeline'].sort(key=lambda x: x['period'], reverse=False)
 
         return jsonify(results)
 
+    except QueryBudgetExceeded as e:
+        print(f"Query budget exceeded: {str(e)}")
+        return jsonify({'status': 'error', **e.to_dict()}), 413
+
     except requests.exceptions.RequestException as e:
         return jsonify({'error': str(e)}), 500
+
+    except Exception as e:
+        print(f"Error in get_works_metrics: {str(e)}")
+        return jsonify({'error': str(e)}), 500